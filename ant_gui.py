@@ -113,12 +113,20 @@ class BiofeedbackApp:
             try:
                 with open(CONFIG_FILE, 'r') as f:
                     data = json.load(f)
-                    return data.get('last_profile_path', None)
+                    path = data.get('last_profile_path', None)
+                    # Older configs hold an absolute path from another machine: fall back to the local profile folder
+                    if path and not os.path.exists(path):
+                        local = os.path.join(PROFILE_DIR, os.path.basename(path))
+                        if os.path.exists(local): return local
+                    return path
             except:
                 pass
         return None
 
     def _save_config(self, profile_path):
+        # Relative when inside the project, so the folder can be moved / archived with the profiles
+        rel = os.path.relpath(os.path.abspath(profile_path))
+        if not rel.startswith(".."): profile_path = rel
         with open(CONFIG_FILE, 'w') as f:
             json.dump({'last_profile_path': profile_path}, f)
 
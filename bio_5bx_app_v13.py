@@ -1,3 +1,5 @@
+from modules import startup_profile
+from modules import metrics
 import tkinter as tk
 from tkinter import ttk, messagebox
 import time
@@ -10,24 +12,27 @@ import datetime
 import subprocess
 import platform
 import sys
-import csv
-import statistics
-import shutil
-from PIL import Image, ImageTk
-
-# Match v3 imports for graphing
-import matplotlib
-matplotlib.use("TkAgg")
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from matplotlib.figure import Figure
-from matplotlib.ticker import MaxNLocator
-import numpy as np
-
-from modules.ant_driver import AntHrvSensor
-from modules.manual_viewer import ManualViewer
+startup_profile.mark("import: stdlib + tkinter")
+
+# Heavy / optional modules are imported on first use:
+#   matplotlib  -> _load_graphs() (graphs only)
+#   PIL         -> screens that show images
+#   ant_driver  -> sensor worker thread (pulls in usb + openant)
+#   manual/pdf  -> show_manual_popup() / Plan PDF button
 from modules.ant_user_profile import UserProfile
+from modules.workout_engine import WorkoutEngine, SessionLogger, read_segment, result_badge, format_secs, STATIONARY_MODE
+from modules.calibration_engine import CalibrationEngine
+from modules.progress_forecast import ProgressForecaster, format_eta
 import modules.five_bx_data as bx
+import modules.progression_engine as pe
+import modules.progress_db as progress_db
+import modules.user_stats as user_stats
+import modules.device_registry as device_registry
+import modules.session_retention as session_retention
+import modules.workout_journal as workout_journal
+from modules.exercise_series import ExerciseSeriesCache
+from modules.persistence import PersistenceWorker
+startup_profile.mark("import: app modules")
 
 USER_DB_FILE = "databases/user_progress.db"
 PROFILE_DIR = "ant_user_profiles"
@@ -35,38 +40,20 @@ SESSION_DIR = "ant_sessions"
 IMG_DIR = "images"
 BACKUP_DIR = "ant_user_profiles/backups"
 CALIBRATION_EXPIRY_DAYS = 30
-PHASE_DURATIONS = {
-    "REST": 60,
-    "STRESS": 60,
-    "EXERTION": 45,
-    "RECOVERY": 60
-}
-
-class SessionLogger:
-    def __init__(self, user_name):
-        self.user_name = user_name
-        self.filename = None
-        self.file = None
-        self.writer = None
-        if not os.path.exists(SESSION_DIR): os.makedirs(SESSION_DIR)
-
-    def start(self):
-        ts = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        safe_name = "".join([c for c in self.user_name if c.isalpha() or c.isdigit() or c==' ']).rstrip()
-        self.filename = os.path.join(SESSION_DIR, f"session_5bx_{safe_name}_{ts}.csv")
-        self.file = open(self.filename, 'w', newline='')
-        self.writer = csv.writer(self.file)
-        self.writer = csv.writer(self.file)
-        self.writer.writerow(["Timestamp", "HR_BPM", "RMSSD_MS", "Raw_RR_MS", "Raw_Packet_Hex", "Chart_Level", "Exercise_Note", "Status", "Battery_V"])
-
-    def log(self, hr, rmssd, raw_rr, raw_hex, state, trend, status, bat):
-        if self.writer:
-            ts = datetime.datetime.now().strftime("%H:%M:%S.%f")[:-3]
-            self.writer.writerow([ts, hr, rmssd, raw_rr, raw_hex, state, trend, status, bat])
-            self.file.flush()
-
-    def stop(self):
-        if self.file: self.file.close()
+SENSOR_POLL_MS = 100 # How often the UI checks on a background sensor start
+DB_POLL_MS = 50
+LOG_TELEMETRY = False # --telemetry: sensor link stats saved next to each session CSV
+
+_graphs = None
+
+def _load_graphs():
+    """modules.history_graphs (and with it matplotlib) is only imported when a graph is first drawn."""
+    global _graphs
+    if _graphs is None:
+        with startup_profile.phase("lazy import: matplotlib"):
+            import modules.history_graphs as history_graphs
+        _graphs = history_graphs
+    return _graphs
 
 class Bio5BXApp(tk.Tk):
     def __init__(self):
@@ -83,13 +70,10 @@ class Bio5BXApp(tk.Tk):
         self.profile_data = {}
         self.calculated_age = 30
         self.true_max_hr = 180
-        self.session_metrics = []
-        self.logger = None
         self.dashboard_active = False
         self.dashboard_active = False
         self.linker_active = False # New flag for first screen
-        self.cardio_mode_var = tk.StringVar(value="Standard (Stationary)")
-        self.current_cardio_mode = None # Reset to None for dynamic selection
+        self.cardio_mode_var = tk.StringVar(value=STATIONARY_MODE)
         
         self.last_reconnect_attempt = 0 # Auto-Reconnect Cooldown
         self.is_reconnecting = False # Flag to prevent concurrent reconnection loops
@@ -97,21 +81,39 @@ class Bio5BXApp(tk.Tk):
         self.retry_task = None # Handle for pending scheduled retries
         self.reset_task = None # Handle for manual reset delay
         self.sensor = None # Initialize sensor attribute
-
-        self.init_sensor()
-
-        self.current_exercise_idx = 0
+        self.sensor_token = 0 # Bumped to orphan an in-flight background sensor start
+        self.sensor_lock = threading.Lock() # Guards sensor_token / sensor_pending against the sensor-init thread
+        self.sensor_pending = None # Result dict of the in-flight background sensor start
+        self.device_saved = None # (user, device number) last written to the device registry
+        self.db_ready = threading.Event()
+        self.persist = PersistenceWorker(USER_DB_FILE, ready=self.db_ready) # Write-behind: session saves, profile JSON, CSV rows
+
+        self.workout = None # WorkoutEngine for the current / last session
         self.workout_active = False
-        self.timer_running = False
-        self.reps_achieved = []
-        self.target_reps_list = []
         self.temp_reps_buffer = None
+        self.forecaster = None # Per-user level trend model
+        self.series_cache = None # Per-exercise history series (graphs)
+        self.pane_graph = None # Reused figures, one per graph type
+        self.popup_graph = None
+        self.history_popup = None
+        self.manual_index = None # manual_search.ManualIndex, opened on first use and reused
+        self.last_history = None # Future -> history id of the last saved session
         
         self.last_reconnect_attempt = 0 # Auto-Reconnect Cooldown
         self.is_reconnecting = False # Flag to prevent concurrent reconnection loops
 
-        self._init_db()
+        startup_profile.mark("app: window + state")
+
+        # First screen first: migrations and the USB sensor start in the background
+        threading.Thread(target=self._init_db, name="db-init", daemon=True).start()
         self.show_profile_linker()
+        startup_profile.mark("app: profile linker built")
+        self.after_idle(self._on_first_screen)
+
+    def _on_first_screen(self):
+        startup_profile.mark("app: first screen drawn")
+        self.init_sensor()
+        startup_profile.report()
 
     def init_sensor(self, attempt=1, max_attempts=10):
         # Prevent concurrent reconnection attempts (Strict Lock)
@@ -121,29 +123,73 @@ class Bio5BXApp(tk.Tk):
 
         self.is_reconnecting = True
         
+        # UI STEP 3: Initialising (Only on first attempt to avoid flicker)
+        if attempt == 1:
+            try:
+                msg = "📡 Initialising ANT+ HRM Sensor..."
+                if hasattr(self, 'lbl_device_status') and self.lbl_device_status.winfo_exists():
+                    self.lbl_device_status.config(text=msg, foreground="#f1c40f")
+                if hasattr(self, 'lbl_device_dash') and self.lbl_device_dash.winfo_exists():
+                    self.lbl_device_dash.config(text=msg, foreground="#f1c40f")
+            except: pass
+
+        # CRITICAL: Prevent Zombie Sensors
+        # If we are about to create a new sensor, we MUST ensure the old one is dead
+        # and not holding the USB handle.
+        if self.sensor:
+            try: 
+                self.sensor.stop()
+            except: pass
+            self.sensor = None
+
+        # Opening the USB node blocks for a while, so it runs on a worker thread and
+        # the result is collected by _await_sensor() on the Tk thread.
+        with self.sensor_lock:
+            self.sensor_token += 1
+            token = self.sensor_token
+            result = self.sensor_pending = {}
+        threading.Thread(target=self._start_sensor, args=(result, token), name="sensor-init", daemon=True).start()
+        self.retry_task = self.after(SENSOR_POLL_MS, lambda: self._await_sensor(result, token, attempt, max_attempts))
+
+    def _start_sensor(self, result, token):
+        # Worker thread: no Tk calls here. A start that was orphaned meanwhile releases the
+        # USB stick itself - the poll that would have collected it may have been cancelled.
+        sensor = None
         try:
-            # UI STEP 3: Initialising (Only on first attempt to avoid flicker)
-            if attempt == 1:
-                try:
-                    msg = "📡 Initialising ANT+ HRM Sensor..."
-                    if hasattr(self, 'lbl_device_status') and self.lbl_device_status.winfo_exists():
-                        self.lbl_device_status.config(text=msg, foreground="#f1c40f")
-                    if hasattr(self, 'lbl_device_dash') and self.lbl_device_dash.winfo_exists():
-                        self.lbl_device_dash.config(text=msg, foreground="#f1c40f")
-                    self.update()
+            with startup_profile.phase("sensor: import + USB start"):
+                from modules.sensor_daemon import create_sensor
+                # Shared via the sensor daemon if it is running, else pinned to this user's strap
+                sensor = create_sensor(pin=device_registry.lookup(self.username))
+                sensor.start()
+            with self.sensor_lock:
+                current = token == self.sensor_token
+                if current: result['sensor'] = sensor
+            if not current:
+                print("Sensor start superseded: releasing it")
+                try: sensor.stop()
                 except: pass
-
-            # CRITICAL: Prevent Zombie Sensors
-            # If we are about to create a new sensor, we MUST ensure the old one is dead
-            # and not holding the USB handle.
-            if self.sensor:
-                try: 
-                    self.sensor.stop()
+        except Exception as e:
+            # Cleanup failed instance immediately
+            if sensor:
+                try: sensor.stop()
                 except: pass
-                self.sensor = None
+            result['error'] = e
+        result['done'] = True
 
-            self.sensor = AntHrvSensor()
-            self.sensor.start()
+    def _await_sensor(self, result, token, attempt, max_attempts):
+        if not result.get('done'):
+            self.retry_task = self.after(SENSOR_POLL_MS, lambda: self._await_sensor(result, token, attempt, max_attempts))
+            return
+
+        with self.sensor_lock:
+            if token != self.sensor_token:
+                # Superseded (calibration / manual reset took over the USB stick meanwhile);
+                # _start_sensor / _abandon_sensor_init have released the sensor already
+                return
+            self.sensor_pending = None
+
+        if 'sensor' in result:
+            self.sensor = result['sensor']
             print(f"Sensor Initialized Successfully! (Attempt {attempt})")
             
             # UI STEP 4: Secured
@@ -159,25 +205,34 @@ class Bio5BXApp(tk.Tk):
             self.is_reconnecting = False
             self.retry_task = None
             return
-            
-        except Exception as e:
-            # Cleanup failed instance immediately
-            if self.sensor:
-                 try: self.sensor.stop()
-                 except: pass
-                 self.sensor = None
-
-            err_str = str(e).lower()
-            # Check for "Resource busy" (Error 16)
-            if ("busy" in err_str or "16" in err_str or "usb" in err_str) and attempt < max_attempts:
-                print(f"Sensor Busy: Retrying ({attempt}/{max_attempts})...")
-                # Schedule next attempt in 500ms WITHOUT blocking GUI
-                self.retry_task = self.after(500, lambda: self.init_sensor(attempt + 1, max_attempts))
-            else:
-                print(f"Sensor Error: {e}")
-                self.sensor = None
-                self.is_reconnecting = False # Give up and release flag
-                self.retry_task = None
+
+        e = result['error']
+        err_str = str(e).lower()
+        # Check for "Resource busy" (Error 16)
+        if ("busy" in err_str or "16" in err_str or "usb" in err_str) and attempt < max_attempts:
+            print(f"Sensor Busy: Retrying ({attempt}/{max_attempts})...")
+            # Schedule next attempt in 500ms WITHOUT blocking GUI
+            self.retry_task = self.after(500, lambda: self.init_sensor(attempt + 1, max_attempts))
+        else:
+            print(f"Sensor Error: {e}")
+            self.sensor = None
+            self.is_reconnecting = False # Give up and release flag
+            self.retry_task = None
+
+    def _abandon_sensor_init(self):
+        """Orphans any background sensor start so it releases the USB stick instead of taking over."""
+        with self.sensor_lock:
+            self.sensor_token += 1
+            result, self.sensor_pending = self.sensor_pending, None
+        # Started but not collected yet: nobody else will stop it
+        if result and result.get('sensor'):
+            try: result['sensor'].stop()
+            except: pass
+        if self.retry_task:
+            try: self.after_cancel(self.retry_task)
+            except: pass
+            self.retry_task = None
+        self.is_reconnecting = False
 
     def play_beep(self):
         system_os = platform.system()
@@ -205,95 +260,39 @@ class Bio5BXApp(tk.Tk):
             return self.user_data.get('age', 30)
 
     def _init_db(self):
+        # Runs on a background thread at startup; _db_connect() waits for it
         try:
-            conn = sqlite3.connect(USER_DB_FILE)
-            c = conn.cursor()
-            c.execute('''CREATE TABLE IF NOT EXISTS users (
-                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                         name TEXT UNIQUE,
-                         age INTEGER,
-                         linked_file TEXT,
-                         current_chart TEXT,
-                         current_level TEXT,
-                         goal_chart TEXT,
-                         goal_level TEXT,
-                         dob TEXT
-                         )''')
-            c.execute('''CREATE TABLE IF NOT EXISTS history (
-                         id INTEGER PRIMARY KEY AUTOINCREMENT,
-                         user_id INTEGER,
-                         timestamp TEXT,
-                         chart TEXT,
-                         level TEXT,
-                         verdict TEXT,
-                         avg_hr INTEGER,
-                         max_hr INTEGER,
-                         end_rmssd INTEGER,
-                         ex1 INTEGER,
-                         ex2 INTEGER,
-                         ex3 INTEGER,
-                         ex4 INTEGER,
-                         ex5 INTEGER,
-                         segment_stats TEXT,
-                         FOREIGN KEY(user_id) REFERENCES users(id)
-                         )''')
-                         
-            # --- MIGRATION: Check if ex1..ex5 and segment_stats exist ---
-            c.execute("PRAGMA table_info(history)")
-            cols = [info[1] for info in c.fetchall()]
-            
-            if "ex1" not in cols:
-                print("Migrating DB: Adding rep columns to history...")
-                for i in range(1, 6):
-                    try: c.execute(f"ALTER TABLE history ADD COLUMN ex{i} INTEGER DEFAULT 0")
-                    except: pass
-            
-            if "segment_stats" not in cols:
-                print("Migrating DB: Adding segment stats to history...")
-                try: c.execute("ALTER TABLE history ADD COLUMN segment_stats TEXT")
-                except: pass
-            
-            # --- MIGRATION: Check for DOB in users ---
-            c.execute("PRAGMA table_info(users)")
-            u_cols = [info[1] for info in c.fetchall()]
-            if "dob" not in u_cols:
-                print("Migrating DB: Adding DOB to users...")
-                try: c.execute("ALTER TABLE users ADD COLUMN dob TEXT")
-                except: pass
-            
-            # --- MIGRATION V9: Split Strength/Cardio ---
-            if "strength_chart" not in u_cols:
-                 print("Migrating DB: Adding Split Levels to users...")
-                 try: 
-                     c.execute("ALTER TABLE users ADD COLUMN strength_chart TEXT DEFAULT '1'")
-                     c.execute("ALTER TABLE users ADD COLUMN strength_level TEXT DEFAULT '1'")
-                     c.execute("ALTER TABLE users ADD COLUMN cardio_chart TEXT DEFAULT '1'")
-                     c.execute("ALTER TABLE users ADD COLUMN cardio_level TEXT DEFAULT '1'")
-                 except: pass
-
-            # --- MIGRATION V9.1: Fix Legacy History Chart IDs ("3" -> "3/3") ---
-            # This ensures old data works with new split logic
-            try:
-                # Update chart to chart/chart where it doesn't contain '/'  
-                # We limit by length to avoid messing up anything weird, though checking for / is safest
-                c.execute("UPDATE history SET chart = chart || '/' || chart WHERE chart NOT LIKE '%/%'")
-            except Exception as e:
-                print("Migration V9.1 Error:", e)
-
-            # --- MIGRATION V11: Add Notes Column ---
-            if "notes" not in cols:
-                print("Migrating DB: Adding Notes to history...")
-                try: c.execute("ALTER TABLE history ADD COLUMN notes TEXT")
-                except: pass
-
-            conn.commit()
-            conn.close()
+            with startup_profile.phase("db: schema + migrations"):
+                progress_db.init_db(USER_DB_FILE)
         except Exception as e:
             print("DB Init Error:", e)
+        finally:
+            self.db_ready.set()
+        self._compact_sessions()
 
+    def _compact_sessions(self):
+        # Background (db-init thread): move old recordings into the DB archive tiers
+        try:
+            with startup_profile.phase("sessions: retention"):
+                r = session_retention.compact(USER_DB_FILE, SESSION_DIR)
+            if r['archived'] or r['empty'] or r['summarised']:
+                print(f"Session retention: archived {r['archived']} recordings ({r['bytes_freed'] // 1024} KB), {r['summarised']} summarised")
+        except Exception as e:
+            print("Session Retention Error:", e)
+
+    def _db_connect(self):
+        if not self.db_ready.is_set():
+            start = time.perf_counter()
+            self.db_ready.wait()
+            metrics.observe("db.ready_wait_ms", (time.perf_counter() - start) * 1000)
+        self.persist.flush() # Read your own queued writes (instant when idle)
+        metrics.inc("db.connections")
+        return sqlite3.connect(USER_DB_FILE)
+
+    @metrics.timed("db.get_user_ms")
     def db_get_user(self, name):
         try:
-            conn = sqlite3.connect(USER_DB_FILE)
+            conn = self._db_connect()
             conn.row_factory = sqlite3.Row
             c = conn.cursor()
             c.execute("SELECT * FROM users WHERE name=?", (name,))
@@ -304,7 +303,7 @@ class Bio5BXApp(tk.Tk):
 
     def db_get_all_users(self):
         try:
-            conn = sqlite3.connect(USER_DB_FILE)
+            conn = self._db_connect()
             c = conn.cursor()
             c.execute("SELECT name FROM users ORDER BY name ASC")
             rows = c.fetchall()
@@ -314,7 +313,7 @@ class Bio5BXApp(tk.Tk):
 
     def db_create_user(self, name, age, linked_file, cur_c, cur_l, goal_c, goal_l, dob=None):
         try:
-            conn = sqlite3.connect(USER_DB_FILE)
+            conn = self._db_connect()
             c = conn.cursor()
             # Initialize all columns (Legacy + New Split)
             # Default split levels to same as start (cur_c/cur_l)
@@ -335,7 +334,7 @@ class Bio5BXApp(tk.Tk):
 
     def db_delete_user(self, name):
         try:
-            conn = sqlite3.connect(USER_DB_FILE)
+            conn = self._db_connect()
             c = conn.cursor()
             # Get ID first
             c.execute("SELECT id FROM users WHERE name=?", (name,))
@@ -343,49 +342,145 @@ class Bio5BXApp(tk.Tk):
             if row:
                 uid = row[0]
                 # Delete History
+                c.execute("DELETE FROM session_file WHERE history_id IN (SELECT id FROM history WHERE user_id=?)", (uid,))
                 c.execute("DELETE FROM history WHERE user_id=?", (uid,))
+                c.execute("DELETE FROM user_stats WHERE user_id=?", (uid,))
+                c.execute("DELETE FROM session_archive WHERE user_id=?", (uid,))
                 # Delete User
                 c.execute("DELETE FROM users WHERE id=?", (uid,))
                 conn.commit()
+                if self.series_cache and self.series_cache.user_id == uid: self.series_cache = None
             conn.close()
             return True
         except Exception as e:
             print(f"Delete Error: {e}")
             return False
 
-    def db_add_history(self, user_id, chart, level, verdict, avg_hr, max_hr, rmssd, reps_list=None, stats_json=None, ex5_type="standard", ex5_duration=0, notes=None):
+    @metrics.timed("db.add_history_ms")
+    def db_add_history(self, user_id, chart, level, verdict, avg_hr, max_hr, rmssd, reps_list=None, stats_json=None, ex5_type="standard", ex5_duration=0, notes=None, prev_levels=None, new_levels=None, session_file=None):
+        """See progress_db.insert_history; queued on the write-behind worker. Returns a Future of the
+           new history id. Also keeps the in-memory forecaster / graph series current."""
         if reps_list is None: reps_list = [0,0,0,0,0]
         # Pad if short
         while len(reps_list) < 5: reps_list.append(0)
         
         ts = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        conn = sqlite3.connect(USER_DB_FILE)
-        c = conn.cursor()
-        c.execute("""INSERT INTO history (user_id, timestamp, chart, level, verdict, avg_hr, max_hr, end_rmssd, ex1, ex2, ex3, ex4, ex5, segment_stats, ex5_type, ex5_duration, notes)
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                     (user_id, ts, chart, level, verdict, int(avg_hr), int(max_hr), int(rmssd), 
-                      reps_list[0], reps_list[1], reps_list[2], reps_list[3], reps_list[4], stats_json, ex5_type, ex5_duration, notes))
-        new_id = c.lastrowid
-        conn.commit()
-        conn.close()
-        return new_id
+        future = self.persist.execute(progress_db.insert_history, user_id, ts, chart, level, verdict, avg_hr, max_hr, rmssd, reps_list,
+                                      stats_json, ex5_type, ex5_duration, notes, prev_levels, new_levels, session_file)
+
+        # Keep the trend model current without refitting the whole history
+        if self.forecaster and self.forecaster.user_id == user_id:
+            self.forecaster.add_session(ts, chart, level)
+        def add_to_series(new_id):
+            if self.series_cache and self.series_cache.user_id == user_id:
+                self.series_cache.add_row({'id': new_id, 'timestamp': ts, 'chart': chart, 'avg_hr': int(avg_hr),
+                                           'ex1': reps_list[0], 'ex2': reps_list[1], 'ex3': reps_list[2], 'ex4': reps_list[3], 'ex5': reps_list[4],
+                                           'segment_stats': stats_json, 'ex5_type': ex5_type, 'ex5_duration': ex5_duration})
+        self._when_persisted(future, add_to_series)
+        return future
+
+    def _when_persisted(self, future, callback):
+        # Runs callback(result) on the Tk thread once the write-behind worker has committed it
+        if not future.done():
+            self.after(DB_POLL_MS, lambda: self._when_persisted(future, callback))
+            return
+        if future.exception() is None: callback(future.result())
+
+    @staticmethod
+    def _discard_journal_if_saved(journal, saved):
+        # Persistence worker: `saved` (the history insert) is resolved by the time this runs
+        if saved.exception() is None: journal.discard()
+        else: journal.close()
 
     def db_update_notes(self, history_id, notes):
-        conn = sqlite3.connect(USER_DB_FILE)
+        conn = self._db_connect()
         c = conn.cursor()
         c.execute("UPDATE history SET notes=? WHERE id=?", (notes, history_id))
         conn.commit()
         conn.close()
 
     def db_delete_history(self, history_id):
-        conn = sqlite3.connect(USER_DB_FILE)
+        conn = self._db_connect()
         c = conn.cursor()
+        c.execute("SELECT user_id FROM history WHERE id=?", (history_id,))
+        row = c.fetchone()
         c.execute("DELETE FROM history WHERE id=?", (history_id,))
+        c.execute("DELETE FROM session_file WHERE history_id=?", (history_id,))
+        if row: user_stats.rebuild(conn, [row[0]]) # Bests/streaks can't be "un-folded"
         conn.commit()
         conn.close()
+        if self.series_cache: self.series_cache.remove(history_id)
+        self.refit_forecaster()
+
+    @metrics.timed("db.undo_history_ms")
+    def db_undo_history(self, history_id):
+        """
+        Undoes history_id and every later session of the same user in ONE transaction:
+        the rows are deleted and the levels snapshotted before history_id are restored.
+        "Later" is by (timestamp, id), so imported rows with out-of-order ids are handled.
+        The levels are a snapshot restore; the user's aggregates (streaks, bests) and the
+        forecast are recomputed from the remaining history. Returns (restored (s_c, s_l, c_c, c_l), sessions undone) or None.
+        """
+        conn = self._db_connect()
+        try:
+            with conn:
+                c = conn.cursor()
+                c.execute("SELECT user_id, timestamp, chart, level, prev_levels FROM history WHERE id=?", (history_id,))
+                row = c.fetchone()
+                if not row: return None
+                uid, ts, chart, level, prev_levels = row
+                # Rows written before snapshots existed fall back to their start-of-session fields
+                levels = progress_db.unpack_levels(prev_levels) or progress_db.unpack_levels(progress_db.levels_from_row(chart, level))
+
+                c.execute("SELECT id FROM history WHERE user_id=? AND (timestamp>? OR (timestamp=? AND id>=?)) ORDER BY timestamp, id",
+                          (uid, ts, ts, history_id))
+                undone = [r[0] for r in c.fetchall()]
+                c.executemany("DELETE FROM history WHERE id=?", [(hid,) for hid in undone])
+                c.executemany("DELETE FROM session_file WHERE history_id=?", [(hid,) for hid in undone])
+                c.execute("UPDATE users SET strength_chart=?, strength_level=?, cardio_chart=?, cardio_level=? WHERE id=?",
+                          levels + (uid,))
+                user_stats.rebuild(conn, [uid])
+        finally:
+            conn.close()
+
+        if self.series_cache:
+            for hid in undone: self.series_cache.remove(hid)
+        if uid == self.user_id: self._sync_levels(*levels)
+        self.refit_forecaster()
+        return levels, len(undone)
+
+    def get_exercise_series(self):
+        """Series cache for the logged-in user; the full history is only scanned on first use."""
+        if self.series_cache is None or self.series_cache.user_id != self.user_id:
+            self.series_cache = ExerciseSeriesCache(self.user_id).load(self.db_get_history(self.user_id))
+        return self.series_cache
+
+    def refit_forecaster(self):
+        if self.user_id is None: return
+        try:
+            self.forecaster = ProgressForecaster(self.user_id, self.calculated_age).fit(self.db_get_history(self.user_id))
+        except Exception as e:
+            print(f"Forecast Error: {e}")
+            self.forecaster = None
+
+    @metrics.timed("db.get_stats_ms")
+    def db_get_stats(self, user_id):
+        """Aggregates (sessions, streaks, bests...) - one row, whatever the history size."""
+        try:
+            conn = self._db_connect()
+            stats = user_stats.load(conn, user_id)
+            if stats is None:
+                stats = user_stats.rebuild(conn, [user_id])[user_id]
+                conn.commit()
+            conn.close()
+            return stats
+        except Exception as e:
+            print(f"Stats Error: {e}")
+            return user_stats.empty(user_id)
 
+    @metrics.timed("db.get_history_ms")
     def db_get_history(self, user_id):
-        conn = sqlite3.connect(USER_DB_FILE)
+        conn = self._db_connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         c.execute("SELECT * FROM history WHERE user_id=? ORDER BY id DESC", (user_id,))
@@ -394,20 +489,18 @@ class Bio5BXApp(tk.Tk):
         return [dict(row) for row in rows]
 
     def db_update_level(self, user_id, chart, level):
-        conn = sqlite3.connect(USER_DB_FILE)
+        conn = self._db_connect()
         c = conn.cursor()
         c.execute("UPDATE users SET current_chart=?, current_level=? WHERE id=?", (chart, level, user_id))
         conn.commit()
         conn.close()
 
+    @metrics.timed("db.update_split_level_ms")
     def db_update_split_level(self, user_id, s_c, s_l, c_c, c_l):
-        conn = sqlite3.connect(USER_DB_FILE)
-        c = conn.cursor()
-        c.execute("UPDATE users SET strength_chart=?, strength_level=?, cardio_chart=?, cardio_level=? WHERE id=?", 
-                 (s_c, s_l, c_c, c_l, user_id))
-        conn.commit()
-        conn.close()
-        
+        self.persist.execute(progress_db.update_split_level, user_id, s_c, s_l, c_c, c_l)
+        self._sync_levels(s_c, s_l, c_c, c_l)
+
+    def _sync_levels(self, s_c, s_l, c_c, c_l):
         # Sync Memory (Unconditional if active)
         if hasattr(self, 'user_data') and self.user_data:
             # Just update if exists, ignoring ID check to be robust against type mismatches
@@ -478,10 +571,8 @@ class Bio5BXApp(tk.Tk):
         self.lst_profiles.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.config(command=self.lst_profiles.yview)
 
-        # Populate from DB
-        user_list = self.db_get_all_users()
-        for name in user_list:
-            self.lst_profiles.insert(tk.END, name)
+        # Populate from DB (once the background migration has finished)
+        self._populate_profile_list()
 
         # SELECTED INFO PANEL
         info_frame = tk.Frame(frame, bg="#34495e", pady=10)
@@ -575,9 +666,10 @@ class Bio5BXApp(tk.Tk):
 
     def launch_calibration_app(self):
         # 1. STOP SENSOR (Release Resource)
+        self._abandon_sensor_init()
         if self.sensor:
             self.sensor.stop()
-            time.sleep(1) # Give it a moment to release
+            if not getattr(self.sensor, 'shared', False): time.sleep(1) # Give it a moment to release
             
         if hasattr(self, 'lbl_device_dash'):
             self.lbl_device_dash.config(text="📡 Status: Calibration Wizard Running...", foreground="#f39c12")
@@ -641,6 +733,15 @@ class Bio5BXApp(tk.Tk):
         if self.linker_active:
             self.show_profile_linker()
 
+    def _populate_profile_list(self):
+        if not (self.linker_active and hasattr(self, 'lst_profiles') and self.lst_profiles.winfo_exists()): return
+        if not self.db_ready.is_set():
+            self.after(DB_POLL_MS, self._populate_profile_list)
+            return
+        self.lst_profiles.delete(0, tk.END)
+        for name in self.db_get_all_users():
+            self.lst_profiles.insert(tk.END, name)
+
     def on_profile_select(self, event):
         selection = self.lst_profiles.curselection()
         if not selection:
@@ -765,20 +866,34 @@ class Bio5BXApp(tk.Tk):
         curr = self.profile_data.get('current_stats', {})
         self.bio_profile = UserProfile(name)
         self.bio_profile.baseline_rmssd = curr.get('baseline_rmssd', 40)
+        self.bio_profile.resting_hr = curr.get('resting_hr', 60)
         profile_max = curr.get('max_hr', 180)
         age_max = 220 - self.calculated_age
         self.true_max_hr = max(profile_max, age_max)
         self.bio_profile.max_hr = self.true_max_hr
 
-        self.show_dashboard()
+        self.refit_forecaster()
+        if not self.offer_resume_workout(): self.show_dashboard()
+
+    def _remember_device(self, data):
+        # Pin this strap for the next connect (see device_registry)
+        key = (self.username, data.get('device_number'))
+        if data.get('status') != "Active" or not key[1] or key == self.device_saved: return
+        try:
+            if device_registry.remember(self.username, data): self.device_saved = key
+        except OSError as e:
+            print(f"Device registry not saved: {e}")
+            self.device_saved = key
 
     # --- SHARED STATUS LOOP (Used by Linker & Dashboard) ---
+    @metrics.timed("ui.update_status_loop_ms")
     def update_status_loop(self):
         # Runs if EITHER screen is active
         if not (self.dashboard_active or self.linker_active): return
 
         if self.sensor:
             data = self.sensor.get_data()
+            self._remember_device(data)
             manuf = data.get('manufacturer', 'Unknown')
             serial = data.get('serial')
             batt_v = data.get('battery_volts')
@@ -830,10 +945,11 @@ class Bio5BXApp(tk.Tk):
         # ex5 (reps) is at index 4. Run at 5. Walk at 6.
         
         final_ex5_target = c_targets[4]
-        if self.current_cardio_mode:
-             if "Run" in self.current_cardio_mode:
+        last_mode = self.workout.cardio_mode if self.workout else None
+        if last_mode:
+             if "Run" in last_mode:
                  final_ex5_target = c_targets[5] if len(c_targets) > 5 else 0
-             elif "Walk" in self.current_cardio_mode:
+             elif "Walk" in last_mode:
                  final_ex5_target = c_targets[6] if len(c_targets) > 6 else 0
                  
         targets = s_targets[:4] + [final_ex5_target]
@@ -868,6 +984,28 @@ class Bio5BXApp(tk.Tk):
         lbl_stats = ttk.Label(stats_frame, text=f"❤️ RHR: {rhr} | ⚡ HRV: {rmssd}ms | 🎯 Max HR: {self.true_max_hr} ({max_hr_source})", foreground="#1abc9c", font=("Arial", 11))
         lbl_stats.pack(anchor="center")
 
+        # TRAINING TOTALS (user_stats aggregates - one row read)
+        stats = self.db_get_stats(self.user_id)
+        s_bests = stats['bests'].get(str(s_chart), [0] * 7)
+        c_bests = stats['bests'].get(str(c_chart), [0] * 7)
+        if stats['sessions']:
+            totals = f"🏋️ Sessions: {stats['sessions']} | ⏱ Trained: {user_stats.format_duration(stats['training_secs'])}"
+            totals += f" | Maintain Streak: 💪 {stats['strength_streak']} 🏃 {stats['cardio_streak']}"
+            if stats['last_avg_hr']: totals += f" | Last: ♥ {stats['last_avg_hr']} ⚡ {stats['last_rmssd']}ms"
+            ttk.Label(stats_frame, text=totals, foreground="#bdc3c7", font=("Arial", 10)).pack(anchor="center")
+
+        # FORECAST (Trend Model)
+        if self.forecaster:
+            goal = None
+            if self.user_data.get("goal_chart") and self.user_data.get("goal_level"):
+                goal = (self.user_data["goal_chart"], self.user_data["goal_level"])
+            fc = self.forecaster.forecast(s_chart, s_level, c_chart, c_level, goal=goal)
+            fc_parts = []
+            for comp, icon in (("Strength", "💪"), ("Cardio", "🏃")):
+                f = fc[comp]
+                fc_parts.append(f"{icon} Next: {format_eta(f['next_level'])} · Age Goal: {format_eta(f['age_target'])} · Elite: {format_eta(f['elite_target'])}")
+            ttk.Label(stats_frame, text="📅 Forecast  " + "  |  ".join(fc_parts), foreground="#bdc3c7", font=("Arial", 10)).pack(anchor="center")
+
         # DEVICE STATS
         hw_frame = ttk.Frame(frame)
         hw_frame.pack(fill=tk.X, pady=5)
@@ -894,6 +1032,7 @@ class Bio5BXApp(tk.Tk):
             row.pack(fill=tk.X, padx=10, pady=5)
             
             txt = f"{i+1}. {details['name']}: {target} Reps"
+            if s_bests[i]: txt += f"  (PB {s_bests[i]})"
             ttk.Label(row, text=txt, font=("Arial", 12)).pack(side=tk.LEFT)
             tk.Button(row, text="📈", font=("Arial", 10), 
                       command=lambda idx=i, name=details['name'], chart=s_chart: self.show_exercise_history(chart, idx, name)).pack(side=tk.RIGHT)
@@ -910,7 +1049,8 @@ class Bio5BXApp(tk.Tk):
         t_stat = c_targets[4]
         row_c1 = ttk.Frame(preview_c)
         row_c1.pack(fill=tk.X, padx=10, pady=5)
-        ttk.Label(row_c1, text=f"A. {details_c['name']}: {t_stat} Reps", font=("Arial", 12)).pack(side=tk.LEFT)
+        pb_txt = f"  (PB {c_bests[4]})" if c_bests[4] else ""
+        ttk.Label(row_c1, text=f"A. {details_c['name']}: {t_stat} Reps{pb_txt}", font=("Arial", 12)).pack(side=tk.LEFT)
         tk.Button(row_c1, text="📈", font=("Arial", 10), 
                   command=lambda: self.show_exercise_history(c_chart, 4, details_c['name'])).pack(side=tk.RIGHT)
                   
@@ -920,7 +1060,8 @@ class Bio5BXApp(tk.Tk):
         lbl_run = c_config['run']
         row_c2 = ttk.Frame(preview_c)
         row_c2.pack(fill=tk.X, padx=10, pady=5)
-        ttk.Label(row_c2, text=f"B. {lbl_run}: {t_run // 60}:{t_run % 60:02d} (Time)", font=("Arial", 12)).pack(side=tk.LEFT)
+        pb_txt = f"  (PB {c_bests[5] // 60}:{c_bests[5] % 60:02d})" if c_bests[5] else ""
+        ttk.Label(row_c2, text=f"B. {lbl_run}: {t_run // 60}:{t_run % 60:02d} (Time){pb_txt}", font=("Arial", 12)).pack(side=tk.LEFT)
         tk.Button(row_c2, text="📈", font=("Arial", 10), 
                   command=lambda: self.show_exercise_history(c_chart, 5, lbl_run)).pack(side=tk.RIGHT)
                   
@@ -930,7 +1071,8 @@ class Bio5BXApp(tk.Tk):
             t_walk = c_targets[6] if len(c_targets) > 6 else 0
             row_c3 = ttk.Frame(preview_c)
             row_c3.pack(fill=tk.X, padx=10, pady=5)
-            ttk.Label(row_c3, text=f"C. {lbl_walk}: {t_walk // 60}:{t_walk % 60:02d} (Time)", font=("Arial", 12)).pack(side=tk.LEFT)
+            pb_txt = f"  (PB {c_bests[6] // 60}:{c_bests[6] % 60:02d})" if c_bests[6] else ""
+            ttk.Label(row_c3, text=f"C. {lbl_walk}: {t_walk // 60}:{t_walk % 60:02d} (Time){pb_txt}", font=("Arial", 12)).pack(side=tk.LEFT)
             tk.Button(row_c3, text="📈", font=("Arial", 10), 
                       command=lambda: self.show_exercise_history(c_chart, 6, lbl_walk)).pack(side=tk.RIGHT)
 
@@ -950,6 +1092,7 @@ class Bio5BXApp(tk.Tk):
             self.destroy()
 
     # --- SCREEN 2.5: HISTORY ---
+    @metrics.timed("ui.show_history_screen_ms")
     def show_history_screen(self):
         self.dashboard_active = False
         self._clear()
@@ -1057,8 +1200,10 @@ class Bio5BXApp(tk.Tk):
         tk.Button(btn_frame, text="Back to Dashboard", command=self.show_dashboard).pack(side=tk.LEFT)
         tk.Button(btn_frame, text="View Details", bg="#3498db", fg="white", command=self.history_view_details).pack(side=tk.LEFT, padx=10)
         tk.Button(btn_frame, text="Delete Selected (Undo)", bg="#c0392b", fg="white", command=self.delete_history_item).pack(side=tk.RIGHT)
+        tk.Button(btn_frame, text="↶ Undo Back To Selected", bg="#e67e22", fg="white", command=self.undo_history_to).pack(side=tk.RIGHT, padx=10)
     
     def show_badges_screen(self):
+        from PIL import Image, ImageTk
         root = tk.Toplevel(self)
         root.title("Trophy Room")
         
@@ -1177,6 +1322,7 @@ class Bio5BXApp(tk.Tk):
         self.lbl_chart_title = tk.Label(nav_frame, text=f"CHART {self.view_chart_idx}", font=("Helvetica", 20, "bold"), bg="#34495e", fg="white")
         self.lbl_chart_title.pack(side=tk.LEFT, padx=20, pady=10)
         tk.Button(nav_frame, text="Next Chart ▶", command=lambda: self.change_chart_view(1), font=("Arial", 12, "bold")).pack(side=tk.LEFT, padx=20, pady=10)
+        tk.Button(nav_frame, text="📄 Plan PDF", command=self.open_plan_pdf, font=("Arial", 12, "bold")).pack(side=tk.LEFT, padx=20, pady=10)
 
         # Content Frame
         self.chart_content = tk.Frame(self.chart_win, bg="#2c3e50")
@@ -1205,6 +1351,7 @@ class Bio5BXApp(tk.Tk):
             # Maintain selected exercise
             self.show_exercise_info(self.selected_exercise_idx)
 
+    @metrics.timed("ui.render_chart_grid_ms")
     def render_chart_grid(self):
         for widget in self.chart_content.winfo_children(): widget.destroy()
         
@@ -1323,6 +1470,7 @@ class Bio5BXApp(tk.Tk):
         pass 
         
     def show_exercise_info(self, idx):
+        from PIL import Image, ImageTk
         self.selected_exercise_idx = idx # Track selection
         
         # Clear Info Pane
@@ -1450,236 +1598,93 @@ class Bio5BXApp(tk.Tk):
                 tv.configure(height=12)
 
         # --- GRAPH RENDERING ---
-        for widget in self.graph_pane.winfo_children(): widget.destroy()
-        
-        records = self.db_get_history(self.user_id)
-        report_reps, report_hr, report_hrv, dates = [], [], [], []
-        
-        records = self.db_get_history(self.user_id)
-        report_reps, report_hr, report_hrv, dates = [], [], [], []
-        
-        for r in records:
-            # Filter by Current Chart (Handle Split Logic)
-            raw_chart = str(r['chart'])
-            chart = raw_chart
-            
-            # SPLIT LOGIC v9
-            if "/" in chart:
-                parts = chart.split("/")
-                if len(parts) >= 2:
-                    if idx < 4: chart = parts[0] # Strength
-                    else: chart = parts[1] # Cardio
-            
-            # DEBUG
-            # print(f"Processing Rec: ID={r['id']} RawChart={raw_chart} EffChart={chart} ViewChart={self.view_chart_idx}")
-
-            if chart != str(self.view_chart_idx):
-                 # print(f"  -> SKIPPED (Chart Mismatch)")
-                 continue
-
-            # print(f"  -> ACCEPTED")
-                 
-            # Parse Reps
-            reps_list = [0]*5
-            if r['ex1']: reps_list = [r['ex1'], r['ex2'], r['ex3'], r['ex4'], r['ex5']]
-            
-            # Helper to get value
-            val = 0
-            e_type = r.get('ex5_type', "")
-            e_dur = r.get('ex5_duration', 0)
-            
-            if idx < 5:
-                # Standard Logic
-                if idx == 4: # Standard Stationary Filter
-                     # If EX 5 type IS Run or Walk, skip this record for Stationary Graph
-                     if e_type and ("Run" in e_type or "Walk" in e_type) and "Stationary" not in e_type:
-                         continue
-                
-                if reps_list[idx] <= 0: continue
-                val = reps_list[idx]
-            else:
-                # Handle Ex 6 (Run) / 7 (Walk)
-                if idx == 5: # Run
-                    if "Run" in e_type and "Stationary" not in e_type: val = e_dur
-                elif idx == 6: # Walk
-                    if "Walk" in e_type: val = e_dur
-                    
-                if val <= 0: continue
-            
-            # Parse Detailed Stats (JSON)
-            hr = 0
-            hrv = 0
-            stats_json = r.get('segment_stats')
-            if stats_json:
-                try:
-                    data = json.loads(stats_json)
-                    
-                    # Handle V2 format
-                    segments = []
-                    if isinstance(data, dict):
-                        segments = data.get('segments', [])
-                    elif isinstance(data, list):
-                        segments = data
-                        
-                    # Use Index Math: reliable 0-4
-                    target_stats_idx = idx
-                    if idx >= 5: target_stats_idx = 4 # Map back to Ex 5 slot for stats
-                    
-                    if target_stats_idx < len(segments):
-                         item = segments[target_stats_idx]
-                         hr = item.get('max_hr', 0)
-                         hrv = item.get('hrv', 0)
-                except: pass
-            
-            # If no detailed stats found, maybe use session average? No, keep 0 to avoid noise.
-            
-            dates.append(r['timestamp'][:10])
-            report_reps.append(val)
-            report_hr.append(hr)
-            report_hrv.append(hrv)
-
-        # Reverse to show chronological left-to-right
-        dates = dates[::-1]
-        report_reps = report_reps[::-1]
-        report_hr = report_hr[::-1]
-        report_hrv = report_hrv[::-1]
-        
-        # Plot
-        fig = Figure(figsize=(10, 3), dpi=90, facecolor="#34495e") # Shorter height
-        
-        # Ax1: Reps
-        ax1 = fig.add_subplot(121)
-        ax1.set_facecolor("#2c3e50")
-        ax1.plot(dates, report_reps, marker='o', color='#2ecc71', linewidth=2, label="Score")
-        t_label = "Reps Progress"
-        if idx >= 5: t_label = "Time (Seconds)"
-        ax1.set_title(t_label, color="white", fontsize=10)
-        ax1.tick_params(axis='x', colors='white', labelsize=8, rotation=45)
-        ax1.tick_params(axis='y', colors='white')
-        ax1.grid(color='#7f8c8d', linestyle='--', linewidth=0.5)
-        
-        # Ax2: HR / HRV
-        ax2 = fig.add_subplot(122)
-        ax2.set_facecolor("#2c3e50")
-        ax2.plot(dates, report_hr, marker='s', color='#e74c3c', linewidth=2, label="Max HR")
-        ax2.set_title("Physiological Cost (HR & HRV)", color="white", fontsize=10)
-        
-        ax2_b = ax2.twinx()
-        ax2_b.plot(dates, report_hrv, marker='^', color='#f1c40f', linestyle='--', linewidth=1.5, label="HRV")
-        
-        ax2.tick_params(axis='x', colors='white', labelsize=8, rotation=45)
-        ax2.tick_params(axis='y', colors='#e74c3c')
-        ax2_b.tick_params(axis='y', colors='#f1c40f')
-        
-        # Combined Legend
-        lines, labels = ax2.get_legend_handles_labels()
-        lines2, labels2 = ax2_b.get_legend_handles_labels()
-        ax2.legend(lines + lines2, labels + labels2, loc='upper left', fontsize=8)
-        
-        fig.tight_layout()
-        canvas = FigureCanvasTkAgg(fig, master=self.graph_pane)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
-
+        graphs = _load_graphs()
+        if self.pane_graph is None: self.pane_graph = graphs.PaneGraph()
+        self.pane_graph.show(self.graph_pane, idx, self.get_exercise_series().pane_series(self.view_chart_idx, idx))
 
     def delete_history_item(self):
         selected = self.hist_tree.selection()
         if not selected: return
         db_id = int(selected[0])
-        conn = sqlite3.connect(USER_DB_FILE)
+        conn = self._db_connect()
         c = conn.cursor()
-        c.execute("SELECT MAX(id) FROM history WHERE user_id=?", (self.user_id,))
-        latest_id = c.fetchone()[0]
+        c.execute("SELECT id FROM history WHERE user_id=? ORDER BY timestamp DESC, id DESC LIMIT 1", (self.user_id,))
+        latest = c.fetchone()
+        latest_id = latest[0] if latest else None
         conn.close()
 
         if messagebox.askyesno("Confirm", "Delete this record?"):
-            # V13 FIX: Capture state BEFORE delete
-            del_c, del_l = "1", "1"
-            is_latest = (db_id == latest_id)
-            
-            if is_latest:
-                 conn = sqlite3.connect(USER_DB_FILE)
-                 c = conn.cursor()
-                 c.execute("SELECT chart, level FROM history WHERE id=?", (db_id,))
-                 row_del = c.fetchone()
-                 conn.close()
-                 if row_del:
-                     del_c = str(row_del[0])
-                     del_l = str(row_del[1])
-
+            if db_id == latest_id:
+                # Deleting the LATEST record is a one-step undo: restore the levels from before it
+                self.undo_history_to(db_id, confirm=False)
+                return
             self.db_delete_history(db_id)
-            
-            # If we deleted the LATEST record, we revert to the state stored IN that record
-            # (which represents the start point of that session)
-            if is_latest:
-                 prev_c_str = del_c
-                 prev_l_str = del_l
-                 
-                 # Handle Split Format: "1/1", "2/1"
-                 s_c, c_c = "1", "1"
-                 s_l, c_l = "1", "1"
-                 
-                 if " | " in prev_c_str:
-                      parts = prev_c_str.split(" | ")
-                      if len(parts) >= 2: s_c, c_c = parts[0], parts[1]
-                 elif "/" in prev_c_str:
-                      parts = prev_c_str.split("/")
-                      if len(parts) >= 2: s_c, c_c = parts[0], parts[1]
-                 else: s_c, c_c = prev_c_str, prev_c_str
-                 
-                 if " | " in prev_l_str:
-                      parts = prev_l_str.split(" | ")
-                      if len(parts) >= 2: s_l, c_l = parts[0], parts[1]
-                 elif "/" in prev_l_str:
-                      parts = prev_l_str.split("/")
-                      if len(parts) >= 2: s_l, c_l = parts[0], parts[1]
-                 else: s_l, c_l = prev_l_str, prev_l_str
-                 
-                 self.db_update_split_level(self.user_id, s_c, s_l, c_c, c_l)
-                 
-                 # Format for Message
-                 s_disp_l = bx.get_level_display(s_l)
-                 c_disp_l = bx.get_level_display(c_l)
-                 messagebox.showinfo("Synced", f"Most recent workout deleted. Level reverted to start of that session:\n\nStrength: {s_c} {s_disp_l}\nCardio: {c_c} {c_disp_l}")
-            
             self.show_history_screen()
 
+    def undo_history_to(self, db_id=None, confirm=True):
+        """Multi-step undo: removes the selected session and everything after it, restoring the
+           levels snapshotted before the selected session."""
+        if db_id is None:
+            selected = self.hist_tree.selection()
+            if not selected: return
+            db_id = int(selected[0])
+
+        if confirm:
+            # Same (timestamp, id) order as db_undo_history
+            key = lambda iid: (self.hist_tree.set(iid, "Date"), int(iid))
+            later = sum(1 for iid in self.hist_tree.get_children() if key(iid) >= key(str(db_id)))
+            if not messagebox.askyesno("Confirm Undo", f"Undo {later} session(s), back to before the selected one?"):
+                return
+
+        result = self.db_undo_history(db_id)
+        if result:
+            (s_c, s_l, c_c, c_l), count = result
+            s_disp_l = bx.get_level_display(s_l)
+            c_disp_l = bx.get_level_display(c_l)
+            messagebox.showinfo("Synced", f"{count} session(s) undone. Level reverted to start of the selected session:\n\nStrength: {s_c} {s_disp_l}\nCardio: {c_c} {c_disp_l}")
+        self.show_history_screen()
+
     # --- EXERCISE FLOW ---
     def start_workout(self):
         self.dashboard_active = False
-        self.current_exercise_idx = 0
-        self.session_metrics = []
-        self.reps_achieved = []
-        self.logger = SessionLogger(self.username)
-        self.logger.start()
-
-        # V9: Split Strength/Cardio
-        s_chart = self.user_data.get("strength_chart") or self.user_data.get("current_chart") or "1"
-        s_level = self.user_data.get("strength_level") or self.user_data.get("current_level") or "1"
-        c_chart = self.user_data.get("cardio_chart") or self.user_data.get("current_chart") or "1"
-        c_level = self.user_data.get("cardio_level") or self.user_data.get("current_level") or "1"
-        
-        strength_targets = bx.get_targets(s_chart, s_level)
-        cardio_targets = bx.get_targets(c_chart, c_level)
-        
-        # Combine: First 4 from Strength, 5th from Cardio
-        # targets includes [ex1..ex5, run, walk]
-        # Store full cardio targets for later selection
-        self.cardio_targets_all = cardio_targets
-        
-        # Initial target list - Ex 5 placeholder until selected
-        self.target_reps_list = strength_targets[:4] + [cardio_targets[4]]
-        
-        # Reset Mode
-        self.current_cardio_mode = None
-        
+        self.last_history = None
+        self.workout = WorkoutEngine(self.user_data, self.true_max_hr, self.bio_profile, SessionLogger(self.username, persist=self.persist),
+                                     journal=workout_journal.WorkoutJournal(workout_journal.journal_path(self.user_id)))
+        self.workout.start()
         self.workout_active = True
-        self.timer_running = False
         
         # Switch to main thread loop for UI safety
         self.run_exercise_screen()
         self.sensor_loop() 
 
+    def offer_resume_workout(self):
+        """After a crash / power loss: offers to continue this user's interrupted workout from its journal.
+           Returns True if it was resumed."""
+        path = workout_journal.journal_path(self.user_id)
+        records = workout_journal.pending(path)
+        if not records or int(records[0].value) != self.user_id: return False
+        done = sum(1 for r in records if r.kind == workout_journal.RESULT)
+        started = datetime.datetime.fromtimestamp(records[0].t).strftime("%d %b %H:%M")
+        if not messagebox.askyesno("Resume Workout", f"Your workout from {started} was interrupted after {done} of 5 exercises.\n\nResume it?"):
+            workout_journal.discard(path)
+            return False
+
+        self.dashboard_active = False
+        self.last_history = None
+        self.workout = WorkoutEngine(self.user_data, self.true_max_hr, self.bio_profile, SessionLogger(self.username, persist=self.persist))
+        used = self.workout.resume(records)
+        self.workout.journal = workout_journal.WorkoutJournal(path, records=used)
+        self.workout_active = True
+        self.run_exercise_screen()
+        self.sensor_loop()
+        return True
+
+    def quit_workout(self):
+        # Deliberately abandoned: nothing to resume
+        self.workout_active = False
+        if self.workout and self.workout.journal: self.persist.call(self.workout.journal.discard)
+        self.show_dashboard()
+
     def reset_sensor_connection(self):
         print("Force Resetting Sensor...")
         
@@ -1692,6 +1697,7 @@ class Bio5BXApp(tk.Tk):
         except: pass
         self.update() # Force UI refresh
 
+        shared = getattr(self.sensor, 'shared', False)
         if self.sensor:
             try: self.sensor.stop()
             except: pass
@@ -1703,59 +1709,42 @@ class Bio5BXApp(tk.Tk):
                  self.lbl_device_status.config(text="📡 Re-opening USB Connection...", foreground="#e67e22")
         except: pass
         
-        # Stop any pending retry loops
-        if self.retry_task:
-             try: self.after_cancel(self.retry_task)
-             except: pass
-             self.retry_task = None
+        # Stop any pending retry loops / background start
+        self._abandon_sensor_init()
              
         # Stop any pending reset delay (Debounce)
         if self.reset_task:
              try: self.after_cancel(self.reset_task)
              except: pass
              self.reset_task = None
-             
-        self.is_reconnecting = False # Force release lock for this manual action
 
         # Smart Init will handle the waiting -> Instant callback
-        # Wait 2.0s to allow proper USB resource release by OS
-        self.reset_task = self.after(2000, self.init_sensor)
+        # Wait 2.0s to allow proper USB resource release by OS (the daemon keeps the USB open)
+        self.reset_task = self.after(0 if shared else 2000, self.init_sensor)
         
+    @metrics.timed("ui.run_exercise_screen_ms")
     def run_exercise_screen(self):
+        from PIL import Image, ImageTk
         self._clear()
-        idx = self.current_exercise_idx
-        if idx >= 5:
+        wk = self.workout
+        idx = wk.idx
+        if wk.finished:
             self.finish_workout()
             return
 
         chart = self.user_data["current_chart"]
         
         # CARDIO SELECTION INTERCEPT
-        if idx == 4 and self.current_cardio_mode is None:
+        if wk.needs_cardio_choice:
              frame = ttk.Frame(self)
              frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
-             
-             c_chart = chart
-             if "/" in str(chart):
-                 try: c_chart = chart.split("/")[1]
-                 except: pass
-                 
-             self._show_cardio_selection(frame, c_chart)
+             self._show_cardio_selection(frame)
              return
 
-             self._show_cardio_selection(frame, c_chart)
-             return
-
-        # Use Cardio Mode for variant details if applicable
-        variant = "Standard"
-        if idx == 4 and self.current_cardio_mode:
-            variant = self.current_cardio_mode
-            
-        details = bx.get_exercise_detail(chart, idx, variant)
-        target = self.target_reps_list[idx]
-        duration = bx.TIME_LIMITS[idx]
-
-        self.session_metrics.append({'name': details['name'], 'hr': [], 'rmssd': []})
+        details = wk.begin_exercise()
+        target = wk.target_reps_list[idx]
+        duration = wk.duration()
+        cardio_mode = wk.cardio_mode
 
         frame = ttk.Frame(self)
         frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=20)
@@ -1763,22 +1752,22 @@ class Bio5BXApp(tk.Tk):
         top_bar = ttk.Frame(frame)
         top_bar.pack(fill=tk.X, pady=5)
         
-        tk.Button(top_bar, text="⬅ Quit Workout", command=self.show_dashboard, bg="#e74c3c", fg="white").pack(side=tk.LEFT)
+        tk.Button(top_bar, text="⬅ Quit Workout", command=self.quit_workout, bg="#e74c3c", fg="white").pack(side=tk.LEFT)
         tk.Button(top_bar, text="📡 Reset", command=self.reset_sensor_connection, bg="#e67e22", fg="white").pack(side=tk.RIGHT)
         
         title_text = f"Exercise {idx+1}: {details['name']}"
         
         # Customize title for Run/Walk to show distance
-        if idx == 4 and self.current_cardio_mode:
+        if idx == 4 and cardio_mode:
              # Logic to extract distance similar to below, or just use the whole string?
              # User wants: "Run (Distance)"
-             # self.current_cardio_mode is like "1 Mile (1.6 km) Run"
+             # cardio_mode is like "1 Mile (1.6 km) Run"
              # We want "Run (1 Mile (1.6 km))" or just swap it?
              # Let's say details['name'] is "Run" (from get_exercise_detail) 
              # actually get_exercise_detail returns generic names mostly unless overridden.
-             # Let's use current_cardio_mode to build it.
+             # Let's use cardio_mode to build it.
              
-             raw = self.current_cardio_mode
+             raw = cardio_mode
              dist_text = ""
              mode_name = "Run"
              if "Run" in raw: 
@@ -1819,9 +1808,9 @@ class Bio5BXApp(tk.Tk):
         
         # History Button Logic
         hist_idx = idx
-        if idx == 4 and self.current_cardio_mode:
-            if "Run" in self.current_cardio_mode and "Stationary" not in self.current_cardio_mode: hist_idx = 5
-            elif "Walk" in self.current_cardio_mode or "Jog" in self.current_cardio_mode: hist_idx = 6
+        if idx == 4 and cardio_mode:
+            if "Run" in cardio_mode and "Stationary" not in cardio_mode: hist_idx = 5
+            elif "Walk" in cardio_mode or "Jog" in cardio_mode: hist_idx = 6
         
         hist_chart_filter = chart
         if "/" in str(chart):
@@ -1838,7 +1827,7 @@ class Bio5BXApp(tk.Tk):
         stats_frame.pack(fill=tk.X, padx=40, pady=10)
         
         goal_text = f"GOAL: {target}"
-        if idx == 4 and self.current_cardio_mode and "Stationary" not in self.current_cardio_mode:
+        if idx == 4 and cardio_mode and "Stationary" not in cardio_mode:
             try:
                 t_val = int(target)
                 tm = t_val // 60
@@ -1867,13 +1856,13 @@ class Bio5BXApp(tk.Tk):
         if idx == 4:
              dist_text = ""
              # Check for Run/Walk variant
-             if self.current_cardio_mode:
-                 if "Run" in self.current_cardio_mode:
+             if cardio_mode:
+                 if "Run" in cardio_mode:
                      c_config = bx.get_cardio_config(chart)
                      # Parse out the distance part if possible, or just use the whole string?
                      # The string is like "1 Mile (1.6 km) Run"
                      # Let's extract "1 Mile (1.6 km)"
-                     raw = self.current_cardio_mode
+                     raw = cardio_mode
                      if "Run" in raw: dist_text = raw.replace(" Run", "")
                      elif "Walk" in raw: dist_text = raw.replace(" Walk", "")
                      elif "Jog" in raw: dist_text = raw.replace(" Jog", "")
@@ -1884,7 +1873,7 @@ class Bio5BXApp(tk.Tk):
 
 
         # Alt Cardio Mode Logic
-        if idx == 4 and self.current_cardio_mode and ("Run" in self.current_cardio_mode or "Walk" in self.current_cardio_mode or "Jog" in self.current_cardio_mode) and "Stationary" not in self.current_cardio_mode:
+        if idx == 4 and cardio_mode and ("Run" in cardio_mode or "Walk" in cardio_mode or "Jog" in cardio_mode) and "Stationary" not in cardio_mode:
              # Manual Mode UI
              # Removed explicitly hiding HR/Advice/Timer. We want HR and Advice visible.
              # self.lbl_hr.pack_forget() <- REMOVED
@@ -1909,9 +1898,9 @@ class Bio5BXApp(tk.Tk):
                  # Distances
                  dist = 0
                  c_idx = int(chart.split('/')[1] if '/' in str(chart) else chart)
-                 if "Run" in self.current_cardio_mode:
+                 if "Run" in cardio_mode:
                       dist = 0.5 if c_idx == 1 else 1.0
-                 elif "Walk" in self.current_cardio_mode or "Jog" in self.current_cardio_mode:
+                 elif "Walk" in cardio_mode or "Jog" in cardio_mode:
                      dist = 1.0 if c_idx == 1 else 2.0
                      
                  if dist > 0:
@@ -1937,59 +1926,32 @@ class Bio5BXApp(tk.Tk):
              
              self.btn_action = tk.Button(frame, text="START EXERCISE (3s Countdown)", bg="#2ecc71", fg="white", font=("Arial", 14, "bold"), command=self.start_timer_action)
              self.btn_action.pack(fill=tk.X, side=tk.BOTTOM, pady=10)
-        self.timer_running = False
 
-    def _show_cardio_selection(self, parent, chart):
+    def _show_cardio_selection(self, parent):
         # Top Bar
         top_bar = ttk.Frame(parent)
         top_bar.pack(fill=tk.X, pady=5)
-        tk.Button(top_bar, text="⬅ Quit Workout", command=self.show_dashboard, bg="#e74c3c", fg="white").pack(side=tk.LEFT)
+        tk.Button(top_bar, text="⬅ Quit Workout", command=self.quit_workout, bg="#e74c3c", fg="white").pack(side=tk.LEFT)
         tk.Button(top_bar, text="📡 Reset", command=self.reset_sensor_connection, bg="#e67e22", fg="white").pack(side=tk.RIGHT)
 
         ttk.Label(parent, text="Select Exercise 5 Variant", font=("Arial", 20, "bold")).pack(pady=10)
         
-        # Get Config
-        config = bx.get_cardio_config(chart)
-        
-        # Option 1: Stationary
-        # Target is at index 4 (Standard)
-        t_stat = self.cardio_targets_all[4]
-        def sel_stat():
-            self.current_cardio_mode = "Standard (Stationary)"
-            self.target_reps_list[4] = t_stat
+        # Stationary (reps), Run (time), Walk/Jog (time, if the chart has one)
+        def select(mode, target):
+            self.workout.select_cardio(mode, target)
             self.run_exercise_screen() # Refresh
-            
-        b1 = tk.Button(parent, text=f"Stationary Run\nTarget: {t_stat} Reps", font=("Arial", 14), bg="#e67e22", fg="white", height=3, command=sel_stat)
-        b1.pack(fill=tk.X, pady=10, padx=20)
-        
-        # Option 2: Run
-        # Target at index 5
-        t_run = self.cardio_targets_all[5] if len(self.cardio_targets_all) > 5 else 0
-        m = t_run // 60; s = t_run % 60
-        lbl_run = config['run']
-        def sel_run():
-            self.current_cardio_mode = lbl_run
-            self.target_reps_list[4] = t_run
-            self.run_exercise_screen()
-            
-        b2 = tk.Button(parent, text=f"{lbl_run}\nTarget: {m}:{s:02d}", font=("Arial", 14), bg="#e74c3c", fg="white", height=3, command=sel_run)
-        b2.pack(fill=tk.X, pady=10, padx=20)
-        
-        # Option 3: Walk (if exists)
-        lbl_walk = config['walk']
-        if lbl_walk:
-            t_walk = self.cardio_targets_all[6] if len(self.cardio_targets_all) > 6 else 0
-            m = t_walk // 60; s = t_walk % 60
-            def sel_walk():
-                self.current_cardio_mode = lbl_walk
-                self.target_reps_list[4] = t_walk
-                self.run_exercise_screen()
-                
-            b3 = tk.Button(parent, text=f"{lbl_walk}\nTarget: {m}:{s:02d}", font=("Arial", 14), bg="#9b59b6", fg="white", height=3, command=sel_walk)
-            b3.pack(fill=tk.X, pady=10, padx=20)
 
+        colors = ["#e67e22", "#e74c3c", "#9b59b6"]
+        for (mode, target), color in zip(self.workout.cardio_options(), colors):
+            if mode == STATIONARY_MODE: text = f"Stationary Run\nTarget: {target} Reps"
+            else: text = f"{mode}\nTarget: {format_secs(target)}"
+            tk.Button(parent, text=text, font=("Arial", 14), bg=color, fg="white", height=3,
+                      command=lambda m=mode, t=target: select(m, t)).pack(fill=tk.X, pady=10, padx=20)
 
+
+    # --- BETWEEN-EXERCISE RECOVERY / TIMER ---
     def start_timer_action(self):
+        self.workout.end_recovery()
         # Disable button during countdown
         self.btn_action.config(state=tk.DISABLED, bg="#95a5a6", text="Starting...")
         self.start_countdown(3)
@@ -2008,23 +1970,24 @@ class Bio5BXApp(tk.Tk):
             self.play_beep() 
             
             # Start Actual Timer
-            self.timer_running = True
+            self.workout.start_timer()
             self.btn_action.config(state=tk.NORMAL, text="COMPLETED (Input Reps)", bg="#e67e22", command=self.input_results)
             
             # Wait 1s then restore and start
             self.after(1000, self._start_real_timer)
 
     def _start_real_timer(self):
-        if not self.workout_active or not self.timer_running: return
+        if not self.workout_active or not self.workout.timer_running: return
         if hasattr(self, 'lbl_timer') and self.lbl_timer.winfo_exists():
             self.lbl_timer.config(font=("Arial", 80, "bold"), foreground="#bdc3c7")
             self.timer_loop()
 
     def input_results(self):
-        self.timer_running = False
-        idx = self.current_exercise_idx
-        chart = self.user_data["current_chart"]
-        details = bx.get_exercise_detail(chart, idx)
+        wk = self.workout
+        idx = wk.idx
+        analyzer = wk.stop_timer()
+        if analyzer: self._cardio_recovery_loop(analyzer)
+        details = bx.get_exercise_detail(self.user_data["current_chart"], idx)
 
         top = tk.Toplevel(self)
         top.title("Report Card")
@@ -2036,14 +1999,13 @@ class Bio5BXApp(tk.Tk):
         e_reps = tk.Entry(top, font=("Arial", 14), justify='center')
         
         # Check based on current mode, not just index
-        mode_str = str(self.current_cardio_mode).lower()
-        is_alt_cardio = (idx == 4 and self.current_cardio_mode and any(m in mode_str for m in ["run", "walk", "jog"]) and "stationary" not in mode_str)
+        is_alt_cardio = wk.alt_cardio
         
         if is_alt_cardio:
              tk.Label(top, text="Time Taken (MM:SS):", fg="white", bg="#34495e").pack()
              e_reps.insert(0, "")
         else:
-             e_reps.insert(0, str(self.target_reps_list[idx]))
+             e_reps.insert(0, str(wk.target_reps_list[idx]))
              
         e_reps.pack(pady=10); e_reps.select_range(0, tk.END); e_reps.focus_force()
         self.temp_reps_buffer = None
@@ -2065,24 +2027,10 @@ class Bio5BXApp(tk.Tk):
                 self.temp_reps_buffer = val
                 
                 # BADGE LOGIC
-                target = self.target_reps_list[idx]
-                badge = None
-                color = "gold"
+                earned = result_badge(val, wk.target_reps_list[idx], is_alt_cardio)
                 
-                if is_alt_cardio:
-                    # Time: Lower is better
-                    diff = target - val # Positive if faster (better)
-                    if diff >= 60: badge = "🔥 UNSTOPPABLE"; color="#e74c3c"
-                    elif diff >= 10: badge = "🚀 SMASHED IT"; color="#9b59b6"
-                    elif diff >= 0: badge = "🎯 TARGET HIT"; color="#2ecc71"
-                else:
-                    # Reps: Higher is better
-                    diff = val - target
-                    if diff >= target * 0.2 and target > 10: badge = "🔥 UNSTOPPABLE"; color="#e74c3c"
-                    elif diff >= target * 0.1 and target > 10: badge = "🚀 SMASHED IT"; color="#9b59b6"
-                    elif diff >= 0: badge = "🎯 TARGET HIT"; color="#2ecc71"
-                
-                if badge:
+                if earned:
+                    badge, color = earned
                     # Celebration Animation
                     for w in top.winfo_children(): w.destroy()
                     top.configure(bg=color)
@@ -2097,17 +2045,17 @@ class Bio5BXApp(tk.Tk):
         self.wait_window(top)
 
         if self.temp_reps_buffer is not None:
-            self.reps_achieved.append(self.temp_reps_buffer)
-            self.current_exercise_idx += 1
+            wk.record_result(self.temp_reps_buffer)
             self.run_exercise_screen()
         else: self.input_results()
 
+    @metrics.timed("ui.timer_loop_ms")
     def timer_loop(self):
-        if not self.workout_active or not self.timer_running: return
+        if not self.workout_active or not self.workout.timer_running: return
         
         # Safety Check: Ensure widget exists before configuring
         if not hasattr(self, 'lbl_timer') or not self.lbl_timer.winfo_exists():
-            self.timer_running = False
+            self.workout.timer_running = False
             return
 
         if self.time_left > 0:
@@ -2121,6 +2069,7 @@ class Bio5BXApp(tk.Tk):
             # Automatically trigger input results
             self.input_results()
 
+    @metrics.timed("ui.sensor_loop_ms")
     def sensor_loop(self):
         if not self.workout_active: return
         
@@ -2135,6 +2084,7 @@ class Bio5BXApp(tk.Tk):
         if needs_restart and not self.is_reconnecting:
             if (current_time - self.last_reconnect_attempt) > 5.0:
                 print("⚠️ Auto-Reconnecting Sensor (Dropout Detected)...")
+                metrics.inc("sensor.reconnects")
                 self.last_reconnect_attempt = current_time
                 
                 # Update Status if possible
@@ -2151,32 +2101,12 @@ class Bio5BXApp(tk.Tk):
             data = self.sensor.get_data()
             hr = data['bpm']
             rmssd = data['rmssd']
-
-            chart = self.user_data["current_chart"]
-            level = self.user_data["current_level"]
-            trend = f"C{chart}-Ex {self.current_exercise_idx+1}"
-
-            # Advice Logic
-            limit_95 = self.true_max_hr * 0.95
-            limit_90 = self.true_max_hr * 0.90
-            limit_60 = self.true_max_hr * 0.60
-            status_text, status_color, log_status = "Zone OK", "#2ecc71", "OK"
-
-            if hr >= limit_95: status_text, status_color, log_status = "⚠️ DANGER! STOP NOW", "#e74c3c", "CRITICAL"
-            elif hr >= limit_90: status_text, status_color, log_status = "⚠️ Limit Reached - SLOW DOWN", "#e67e22", "WARNING"
-            elif hr < limit_60 and self.current_exercise_idx == 4: status_text, status_color, log_status = "⚡ Push Harder!", "#f1c40f", "LOW"
+            status_text, status_color = self.workout.sample(data)
+            metrics.gauge("sensor.bpm", hr)
+            self._remember_device(data)
+            if LOG_TELEMETRY: self.workout.log_telemetry(self.sensor)
 
             if hr > 0:
-                if self.current_exercise_idx < len(self.session_metrics):
-                    self.session_metrics[self.current_exercise_idx]['hr'].append(hr)
-                    self.session_metrics[self.current_exercise_idx]['rmssd'].append(rmssd)
-
-                if self.logger and self.current_exercise_idx < len(self.session_metrics):
-                    name = self.session_metrics[self.current_exercise_idx]['name']
-                    raw_rr = data.get('raw_rr_ms', 0)
-                    raw_hex = data.get('raw_hex', '')
-                    self.logger.log(hr, rmssd, raw_rr, raw_hex, f"Ch {chart} - Lvl {level}", f"C{chart}-Ex {self.current_exercise_idx+1}: {name}", log_status, data.get('battery_volts'))
-
                 try:
                     txt = f"♥ {hr} BPM"
                     if hasattr(self, 'lbl_hr'): self.lbl_hr.config(text=txt, foreground="#2c3e50")
@@ -2231,422 +2161,59 @@ class Bio5BXApp(tk.Tk):
             
         self.after(1000, self.sensor_loop)
 
+    # --- EX 5: HEART RATE RECOVERY ---
+    def _cardio_recovery_loop(self, analyzer):
+        # Keeps sampling after Ex 5 (even once the summary is shown) until HRR 30/60 are captured
+        if not self.workout or analyzer is not self.workout.cardio_analyzer: return # A new workout has started
+        hr = 0
+        if self.sensor and self.sensor.running:
+            hr = self.sensor.get_data().get('bpm', 0)
+        if analyzer.add_recovery_sample(hr):
+            if self.last_history:
+                self.db_update_cardio_metrics(self.last_history, analyzer.summary())
+            return
+        self.after(1000, lambda: self._cardio_recovery_loop(analyzer))
+
+    @metrics.timed("db.update_cardio_metrics_ms")
+    def db_update_cardio_metrics(self, history_id, cardio):
+        # Merge the (late) HRR result into the stored segment_stats JSON. history_id may be
+        # db_add_history()'s Future; the worker resolves it (errors are printed there)
+        if not cardio: return
+        self.persist.execute(progress_db.merge_cardio_metrics, history_id, cardio)
+
     # --- FINISH & REPORT ---
     def _get_consecutive_fails(self, component="Strength"):
         """Count consecutive fails/non-upgrades backwards in history.
            Stops when it finds an UP, or a Max Level Maintain (Pass)."""
         if not os.path.exists(USER_DB_FILE): return 0
-        try:
-            conn = sqlite3.connect(USER_DB_FILE)
-            conn.row_factory = sqlite3.Row
-            c = conn.cursor()
-            c.execute("SELECT chart, level, verdict FROM history WHERE user_id=? ORDER BY id DESC LIMIT 10", (self.user_id,))
-            rows = c.fetchall()
-            conn.close()
-            
-            fails = 0
-            for r in rows:
-                v_str = r['verdict']
-                # Parse Verdict Part
-                # Format: "Strength (MAINTAIN) / Cardio (UP)" or "Strength (...) | Cardio (...)"
-                part = v_str
-                if " | " in v_str:
-                     parts = v_str.split(" | ")
-                     if len(parts) >= 2:
-                         part = parts[0] if component == "Strength" else parts[1]
-                elif "/" in v_str: # Legacy support
-                    parts = v_str.split("/")
-                    if len(parts) >= 2:
-                        part = parts[0] if component == "Strength" else parts[1]
-                
-                # Check outcome
-                if "UP" in part or "PROMOTION" in part or "LEAPFROG" in part or "LEVEL UP" in part:
-                     break # Success breaks the streak
-                
-                if "MAINTAIN" in part:
-                     # Check if Max Level (Pass)
-                     raw_c, raw_l = str(r['chart']), str(r['level'])
-                     chart, level = raw_c, raw_l
-                     
-                     if " | " in raw_c:
-                         c_parts = raw_c.split(" | ")
-                         l_parts = raw_l.split(" | ")
-                         if len(c_parts) >= 2:
-                             chart = c_parts[0] if component == "Strength" else c_parts[1]
-                             level = l_parts[0] if component == "Strength" else l_parts[1]
-                     elif "/" in raw_c:
-                         c_parts = raw_c.split("/")
-                         l_parts = raw_l.split("/")
-                         if len(c_parts) >= 2:
-                             chart = c_parts[0] if component == "Strength" else c_parts[1]
-                             level = l_parts[0] if component == "Strength" else l_parts[1]
-                     
-                     if str(chart) == "6" and str(level) == "12":
-                         break # Max Level Pass
-                     
-                     fails += 1
-                else:
-                     # Demotion, Down, etc.
-                     fails += 1
-            return fails
-        except:
-            return 0
+        # Streaks are kept in user_stats; only the last fail_lookback sessions ever counted
+        stats = self.db_get_stats(self.user_id)
+        key = 'strength_streak' if component == "Strength" else 'cardio_streak'
+        return min(stats[key], pe.DEFAULT_RULES["fail_lookback"])
 
+    @metrics.timed("ui.finish_workout_ms")
     def finish_workout(self):
+        from PIL import Image, ImageTk
         self.workout_active = False
-        if self.logger: self.logger.stop()
         self._clear()
 
-        mode_str = str(self.current_cardio_mode).lower()
-        is_alt_cardio = (self.current_cardio_mode and 
-                        any(m in mode_str for m in ["run", "walk", "jog"]) and 
-                        "stationary" not in mode_str)
+        wk = self.workout
+        # Streaks are read before finish() stops the logger: its final CSV batch isn't queued yet,
+        # so the flush in _db_connect has nothing of this session's to wait for
+        fails = {comp: self._get_consecutive_fails(comp) for comp in ("Strength", "Cardio")}
+        res = wk.finish(fails.get, self.calculate_age(self.user_data.get('dob', '2000-01-01')))
+        report_text = res['report']
 
-        missed = 0
-        for a, t in zip(self.reps_achieved, self.target_reps_list):
-            if a < t: missed += 1
-        physical_pass = (missed == 0)
-
-        report_text = ["--- SESSION BREAKDOWN ---"]
-        
-        # REPS SUMMARY
-        exercises = ["Toe Touch", "Sit-up", "Back Extension", "Push-up", "Cardio"]
-        report_text.append("PERFORMANCE:")
-        for i in range(5):
-            name = exercises[i]
-            done = self.reps_achieved[i]
-            target = self.target_reps_list[i]
-            
-            # Format for Cardio (Time vs Reps)
-            if i == 4 and any(m in str(self.current_cardio_mode) for m in ["Run", "Walk", "Jog"]):
-                 # Time
-                 done_str = f"{int(done//60)}:{int(done%60):02d}"
-                 target_str = f"{int(target//60)}:{int(target%60):02d}"
-                 report_text.append(f"{name}: {done_str} / {target_str}")
-            else:
-                 report_text.append(f"{name}: {done} / {target}")
-        report_text.append("") # Spacer
-        
-        warnings = 0
-        session_peak_hr = 0
-        all_hr, all_rmssd = [], []
-
-        for i, metric in enumerate(self.session_metrics):
-            name, hrs, hrvs = metric['name'], metric['hr'], metric['rmssd']
-            if not hrs:
-                report_text.append(f"{name}: (No HR Data)"); continue
-
-            avg_hr, max_hr = sum(hrs)/len(hrs), max(hrs)
-            all_hr.extend(hrs)
-            session_peak_hr = max(session_peak_hr, max_hr)
-
-            if "Back Arch" in name or i == 2: hrv_str = "(Ignored)"; avg_hrv = 999
-            else: avg_hrv = sum(hrvs)/len(hrvs) if hrvs else 0; hrv_str = f"{avg_hrv:.1f} ms"; all_rmssd.extend(hrvs)
-
-            status = "OK"
-            if max_hr > (self.true_max_hr * 0.95): status = "INTENSE"; warnings += 1
-            if avg_hrv < 10 and avg_hrv != 999: status += " / HIGH STRESS"
-
-            line = f"{name}: Avg HR {int(avg_hr)} | Max {max_hr} | HRV {hrv_str}"
-            if status != "OK": line += f"\n   -> ⚠️ {status}"
-            report_text.append(line)
-
-        if session_peak_hr > self.true_max_hr and session_peak_hr < 220:
-            report_text.append(f"\n📈 NEW MAX HR: {session_peak_hr} bpm (Prev: {self.true_max_hr})")
-            self.bio_profile.max_hr = session_peak_hr
+        if res['new_max_hr']:
+            self.bio_profile.max_hr = res['new_max_hr']
             if "current_stats" in self.profile_data:
-                self.profile_data['current_stats']['max_hr'] = session_peak_hr
-                with open(self.full_profile_path, 'w') as f: json.dump(self.profile_data, f, indent=4)
-            warnings += 1
-            report_text.append("⚠️ Pushed to absolute limit.")
-
-        avg_session_hr = sum(all_hr)/len(all_hr) if all_hr else 0
-        max_session_hr = session_peak_hr
-        end_session_rmssd = all_rmssd[-1] if all_rmssd else 0
+                self.profile_data['current_stats']['max_hr'] = res['new_max_hr']
+                self.persist.write_json(self.full_profile_path, self.profile_data)
 
-        # V9: SPLIT LOGIC
-        # 1. Load Current States
-        s_chart = self.user_data.get("strength_chart") or self.user_data.get("current_chart") or "1"
-        s_level = self.user_data.get("strength_level") or self.user_data.get("current_level") or "1"
-        c_chart = self.user_data.get("cardio_chart") or self.user_data.get("current_chart") or "1"
-        c_level = self.user_data.get("cardio_level") or self.user_data.get("current_level") or "1"
-        
-        
-        report_text.append("") # Spacer before Verdict
-        
-        # 2. Evaluate STRENGTH (Ex 1-4)
-        s_perf_c, s_perf_l = bx.calculate_strength_placement(self.reps_achieved, s_chart)
-        s_status = "MAINTAIN"
-        s_new_c, s_new_l = s_chart, s_level
-        s_score_curr = bx.get_total_score(s_chart, s_level)
-        s_score_perf = bx.get_total_score(s_perf_c, s_perf_l)
-        
-        s_missed = 0
-        for i in range(4):
-            if self.reps_achieved[i] < self.target_reps_list[i]: s_missed += 1
-
-        if s_missed == 0:
-            # Met Current Targets!
-            # 5BX Rule: If you meet the target, you advance to the next level.
-            # Even if our reps didn't technically qualify for the higher level yet (e.g. exact match), we advance.
-            s_next_c, s_next_l = bx.get_next_level(s_chart, s_level)
-            s_score_next = bx.get_total_score(s_next_c, s_next_l)
-            
-            if s_score_perf < s_score_next:
-                s_perf_c, s_perf_l = s_next_c, s_next_l
-                s_score_perf = s_score_next
-
-            if s_score_perf > s_score_curr:
-                s_status = "UP"
-                s_new_c, s_new_l = s_perf_c, s_perf_l
-                
-                # Check for Leap
-                s_disp = bx.get_level_display(s_new_l)
-                dest = f"C{s_new_c} {s_disp}"
-                steps = s_score_perf - s_score_curr
-                if steps > 1:
-                    report_text.append(f"💪 Strength: 🚀 PROMOTION! (Jumped {steps} Levels to {dest})")
-                else:
-                    report_text.append(f"💪 Strength: ✅ LEVEL UP! (Now at {dest})")
-
-        else:
-            s_status = "MAINTAIN"
-            s_new_c, s_new_l = s_chart, s_level
-            
-            # Check Demotion (Strength)
-            streak = 1 + self._get_consecutive_fails("Strength")
-            if streak >= 3:
-                s_status = "DOWN"
-                # Logic: Drop to performance level.
-                # Constraint: Don't drop CHART unless we were already at the bottom (Level 1 / D-)
-                if s_level != "1" and int(s_perf_c) < int(s_chart):
-                    s_perf_c = s_chart
-                    s_perf_l = "1"
-                elif s_level == "1" and s_perf_l == "1":
-                     # Already at bottom, and placement is keeping us at bottom (or lower)
-                     l1_targets = bx.get_targets(s_chart, "1")
-                     failed_l1 = any(self.reps_achieved[i] < l1_targets[i] for i in range(4))
-                     if failed_l1 and int(s_chart) > 1:
-                         s_perf_c = str(int(s_chart) - 1)
-                         s_perf_l = "12" # A+
-
-                s_new_c, s_new_l = s_perf_c, s_perf_l
-                s_disp = bx.get_level_display(s_new_l)
-                report_text.append(f"💪 Strength: 📉 DEMOTION: {streak} Consecutive Failures. Dropped to C{s_new_c} {s_disp}")
-            else:
-                report_text.append(f"💪 Strength: Missed Target (Streak {streak}/3)")
-
-        # 3. Evaluate CARDIO (Ex 5)
-        c_perf_c, c_perf_l = bx.calculate_cardio_placement(self.reps_achieved, c_chart)
-        c_status = "MAINTAIN" 
-        c_new_c, c_new_l = c_chart, c_level
-        
-        c_missed = 0
-        if is_alt_cardio:
-            # Time Based: Achieved <= Target (LOWER IS BETTER)
-            user_time = self.reps_achieved[4]
-            target_time = self.target_reps_list[4]
-            
-            # Report
-            mins = user_time // 60
-            secs = user_time % 60
-            report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): {mins}:{secs:02d} (Target {target_time // 60}:{target_time % 60:02d})")
-            
-            if user_time <= target_time:
-                # PASSED TARGET (Minimum requirement met for current level)
-                # Now check absolute placement to allow leapfrogging charts
-                c_perf_c, c_perf_l = bx.calculate_cardio_time_placement(user_time, self.current_cardio_mode, c_chart)
-                
-                # Calculate scores
-                score_curr = bx.get_total_score(c_chart, c_level)
-                score_perf = bx.get_total_score(c_perf_c, c_perf_l)
-                
-                # Check Next Level (Incremental) to ensure at least +1 if placement is conservative?
-                # Actually placement should find the max level consistent with time.
-                # But if placement returns current level (because time equals exactly current target)?
-                # We want at least progress.
-                # If valid time <= target time, we should advance?
-                # Standard 5BX: If you meet the time, you advance to next level.
-                c_next_c, c_next_l = bx.get_next_level(c_chart, c_level)
-                score_next = bx.get_total_score(c_next_c, c_next_l)
-                
-                if score_perf < score_next:
-                    # Upgrade logic guarantees at least 1 step if entered time met target
-                    c_perf_c, c_perf_l = c_next_c, c_next_l
-                    score_perf = score_next
-                
-                if score_perf > score_curr:
-                     c_status = "UP"
-                     c_new_c, c_new_l = c_perf_c, c_perf_l
-                     
-                     # Check for Leap
-                     c_disp = bx.get_level_display(c_new_l)
-                     dest = f"C{c_new_c} {c_disp}"
-                     steps = score_perf - score_curr
-                     if steps > 1:
-                         report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): 🚀 PROMOTION! (Jumped {steps} Levels to {dest})")
-                     else:
-                         report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): ✅ LEVEL UP! (Now at {dest})")
-            else:
-                c_missed = 1
-                # Check Demotion (Time)
-                streak = 1 + self._get_consecutive_fails("Cardio")
-                if streak >= 3:
-                    c_status = "DOWN"
-                    c_perf_c, c_perf_l = bx.calculate_cardio_time_placement(user_time, self.current_cardio_mode, c_chart)
-                    
-                    # Logic: Drop to performance level.
-                    # Constraint: Don't drop CHART unless we were already at the bottom (Level 1 / D-)
-                    if c_level != "1" and int(c_perf_c) < int(c_chart):
-                        c_perf_c = c_chart
-                        c_perf_l = "1"
-                    elif c_level == "1":
-                        # We are at bottom. Did we fail Level 1 targets?
-                        # Note: calculate_placement might return lower chart, implying failure.
-                        # But we confirm explicitly against L1 Target to be safe.
-                        l1_time = bx.get_time_target(c_chart, "1", self.current_cardio_mode)
-                        if user_time > l1_time and int(c_chart) > 1:
-                            c_perf_c = str(int(c_chart) - 1)
-                            c_perf_l = "12"
-                        else:
-                            # We failed streaks but passed L1 time (maybe barely?)
-                            # Or we are at Chart 1.
-                            c_perf_c = c_chart
-                            c_perf_l = "1"
-
-                    c_new_c, c_new_l = c_perf_c, c_perf_l
-                    c_disp = bx.get_level_display(c_new_l)
-                    report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): 📉 DEMOTIION: {streak} Consecutive Failures. Dropped to C{c_new_c} {c_disp}")
-                else:
-                    report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): Missed Target (Streak {streak}/3)")
-        else:
-            # Reps Based (Original)
-            if self.reps_achieved[4] < self.target_reps_list[4]:
-                c_missed += 1
-            
-            if c_missed == 0:
-                c_score_curr = bx.get_total_score(c_chart, c_level)
-                c_score_perf = bx.get_total_score(c_perf_c, c_perf_l)
-                
-                # Check Next Level (Guaranteed Promotion if Target Met)
-                c_next_c, c_next_l = bx.get_next_level(c_chart, c_level)
-                score_next = bx.get_total_score(c_next_c, c_next_l)
-                
-                if c_score_perf < score_next:
-                    c_perf_c, c_perf_l = c_next_c, c_next_l
-                    c_score_perf = score_next
-                
-                if c_score_perf > c_score_curr:
-                    c_status = "UP"
-                    c_new_c, c_new_l = c_perf_c, c_perf_l
-                     
-                    # Check for Leap
-                    c_disp = bx.get_level_display(c_new_l)
-                    dest = f"C{c_new_c} {c_disp}"
-                    steps = c_score_perf - c_score_curr
-                    if steps > 1:
-                        report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): 🚀 PROMOTION! (Jumped {steps} Levels to {dest})")
-                    else:
-                        report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): ✅ LEVEL UP! (Now at {dest})")
-                else:
-                    report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): MAINTAIN (Max Level or Scored Equal)")
-                    c_status = "MAINTAIN"
-                    c_new_c, c_new_l = c_chart, c_level
-                
-            else:
-                # Check Demotion (Reps) - ONLY IF MISSED
-                streak = 1 + self._get_consecutive_fails("Cardio")
-                if streak >= 3:
-                    c_status = "DOWN"
-                    c_perf_c, c_perf_l = bx.calculate_cardio_placement(self.reps_achieved, c_chart)
-                    
-                    # Logic: Drop to performance level.
-                    # Constraint: Don't drop CHART unless we were already at the bottom (Level 1 / D-)
-                    if c_level != "1" and int(c_perf_c) < int(c_chart):
-                        c_perf_c = c_chart
-                        c_perf_l = "1"
-                    elif c_level == "1":
-                         targets = bx.get_targets(c_chart, "1")
-                         if self.reps_achieved[4] < targets[4] and int(c_chart) > 1:
-                             c_perf_c = str(int(c_chart) - 1)
-                             c_perf_l = "12"
-                         else:
-                             c_perf_c = c_chart
-                             c_perf_l = "1"
-
-                    c_new_c, c_new_l = c_perf_c, c_perf_l
-                    c_disp = bx.get_level_display(c_new_l)
-                    report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): 📉 DEMOTIION: {streak} Consecutive Failures. Dropped to C{c_new_c} {c_disp}")
-                else:
-                    report_text.append(f"🏃 Cardio ({self.current_cardio_mode}): Missed Target (Streak {streak}/3)")
-
-
-        # 4. Final Verdict
-        # Format: Strength (LEAPFROG to C2 B+) / Cardio (MAINTAIN (1/3 Strikes))
-        
-        def get_progression_desc(old_c, old_l, new_c, new_l, status, score_old, score_new, strikes=0):
-            if status == "DOWN":
-                n_disp = bx.get_level_display(new_l)
-                dest = f"C{new_c} {n_disp}"
-                return f"DEMOTION to {dest}"
-            if status != "UP":
-                c_disp = bx.get_level_display(old_l)
-                loc = f"C{old_c} {c_disp}"
-                if strikes > 0:
-                     return f"MAINTAIN {loc} ({strikes}/3 Strikes)"
-                return f"MAINTAIN {loc}"
-            
-            diff = score_new - score_old
-            n_disp = bx.get_level_display(new_l)
-            dest = f"C{new_c} {n_disp}"
-            
-            if diff > 1: return f"LEAPFROG to {dest}"
-            if str(new_c) != str(old_c): return f"PROMOTION to {dest}"
-            return f"LEVEL UP to {dest}"
-
-        # Strength Verdict
-        # Calculate current strk for display (if missed)
-        s_current_streak = 0
-        if s_missed > 0 and s_status == "MAINTAIN":
-             # We just missed, so streak is at least 1. 
-             # The DB function gets PAST history, so we add 1 for today.
-             s_current_streak = 1 + self._get_consecutive_fails("Strength")
-
-        s_algo_verdict = get_progression_desc(s_chart, s_level, s_new_c, s_new_l, s_status, s_score_curr, s_score_perf, s_current_streak)
-        
-        # Cardio Verdict
-        c_current_streak = 0
-        if c_missed > 0 and c_status == "MAINTAIN":
-             c_current_streak = 1 + self._get_consecutive_fails("Cardio")
-
-        c_algo_verdict = get_progression_desc(c_chart, c_level, c_new_c, c_new_l, c_status, bx.get_total_score(c_chart, c_level), bx.get_total_score(c_new_c, c_new_l), c_current_streak)
-
-        status = f"Strength ({s_algo_verdict}) | Cardio ({c_algo_verdict})"
-        color = "#2ecc71" if "UP" in status else "darkorange"
-        if "DOWN" in status: color = "#e74c3c"
-        
-        def get_component_reason(name, status, missed):
-            if status == "UP": return f"{name} improved!"
-            if status == "DOWN": return f"{name} level reduced to match ability."
-            if missed > 0: return f"{name} targets missed."
-            return f"{name} maintained."
-
-        s_reason = get_component_reason("Strength", s_status, s_missed)
-        c_reason = get_component_reason("Cardio", c_status, c_missed)
-        
-        if s_reason == c_reason:
-            # Combined
-            if s_status == "UP": reason = "Great Job! Both Strength and Cardio improved!"
-            elif s_status == "DOWN": reason = "Both levels adjusted to match current performance."
-            elif s_missed > 0: reason = "Standards not met. Improvement required to advance."
-            else: reason = "Maintained status in both areas. Keep pushing!"
-        else:
-            # Different
-            reason = f"{s_reason} {c_reason}"
-
-        # Check for Milestones (Strength & Cardio)
-        age = self.calculate_age(self.user_data.get('dob', '2000-01-01'))
-        milestones = bx.check_milestones(age, s_chart, s_level, s_new_c, s_new_l, c_chart, c_level, c_new_c, c_new_l)
+        s_status, c_status = res['strength']['status'], res['cardio']['status']
+        s_algo_verdict, c_algo_verdict = res['strength']['verdict'], res['cardio']['verdict']
+        reason = res['reason']
+        milestones = res['milestones']
         
         # MILESTONE POPUP
         if milestones:
@@ -2687,55 +2254,15 @@ class Bio5BXApp(tk.Tk):
             m_top.geometry(f"+{x}+{y}")
             self.wait_window(m_top)
 
-        # 4. Serialize Detailed Stats for History (EXTENDED V2)
-        segment_data = []
-        for i, metric in enumerate(self.session_metrics):
-            name = metric['name']
-            hr_data = metric['hr']
-            hrv_data = metric['rmssd']
-            
-            avg_hr_seg = int(sum(hr_data)/len(hr_data)) if hr_data else 0
-            max_hr_seg = max(hr_data) if hr_data else 0
-            avg_hrv_seg = int(sum(hrv_data)/len(hrv_data)) if hrv_data else 0
-            
-            # --- STATUS / INTENSITY CHECK (Restored from v10) ---
-            status_txt = "OK"
-            if max_hr_seg > (self.true_max_hr * 0.95): status_txt = "INTENSE"
-            if avg_hrv_seg < 10 and avg_hrv_seg > 0: status_txt += " / HIGH STRESS"
-            if status_txt == "OK": status_txt = "" # Don't save "OK" to keep JSON clean unless needed
-            
-            segment_data.append({
-                "name": name, 
-                "avg_hr": avg_hr_seg, 
-                "max_hr": max_hr_seg, 
-                "hrv": avg_hrv_seg,
-                "status": status_txt
-            })
-        
-        # New Struct: { segments: [], badges: [], verdict: "" }
-        milestone_data = []
-        if milestones:
-            for m in milestones:
-                milestone_data.append({'text': m['text'], 'image': m.get('image', '')})
-
-        stats_payload = {
-            "version": "2.0",
-            "segments": segment_data,
-            "badges": milestone_data,
-            "verdict_reason": reason
-        }
-        stats_json = json.dumps(stats_payload)
+        self.db_update_split_level(self.user_id, *res['new_levels'])
+        self.last_history = self.db_add_history(self.user_id, **res['history'])
 
-        # Ex 5 Metadata
-        ex5_duration = 0
-        if is_alt_cardio:
-             ex5_duration = self.reps_achieved[4]
-             self.reps_achieved[4] = 1 # Store 1 in reps column as a 'completed' flag
-              
-        self.db_update_split_level(self.user_id, s_new_c, s_new_l, c_new_c, c_new_l)
-        
-        self.last_history_id = self.db_add_history(self.user_id, f"{s_chart}/{c_chart}", f"{s_level}/{c_level}", status, avg_session_hr, max_session_hr, end_session_rmssd, self.reps_achieved, stats_json, 
-                                                   ex5_type=self.current_cardio_mode, ex5_duration=ex5_duration)
+        # HRR finished while the milestone popup was open -> persist it now
+        if wk.cardio_analyzer and wk.cardio_analyzer.phase == "DONE":
+            self.db_update_cardio_metrics(self.last_history, wk.cardio_analyzer.summary())
+        # Once saved: nothing left to resume. Runs on the worker after the insert has committed (or
+        # failed - then the journal is kept and the workout is offered again on the next start).
+        if wk.journal: self.persist.call(self._discard_journal_if_saved, wk.journal, self.last_history)
 
         # --- UI REFACTOR: Session Summary (Read-Only) ---
         self._clear()
@@ -2820,7 +2347,7 @@ class Bio5BXApp(tk.Tk):
         if not selected: return
         
         db_id = int(selected[0])
-        conn = sqlite3.connect(USER_DB_FILE)
+        conn = self._db_connect()
         conn.row_factory = sqlite3.Row
         c = conn.cursor()
         c.execute("SELECT * FROM history WHERE id=?", (db_id,))
@@ -2848,6 +2375,7 @@ class Bio5BXApp(tk.Tk):
         segments = []
         badges = []
         verdict_reason = ""
+        cardio = None
         
         if stats_json:
             try:
@@ -2857,6 +2385,7 @@ class Bio5BXApp(tk.Tk):
                     segments = data.get('segments', [])
                     badges = data.get('badges', [])
                     verdict_reason = data.get('verdict_reason', "")
+                    cardio = data.get('cardio')
                 else:
                     # V1 (List)
                     segments = data
@@ -2997,12 +2526,32 @@ class Bio5BXApp(tk.Tk):
                 status_txt = item.get('status', '')
                 if status_txt and status_txt != "OK":
                      report.append(f"   -> ⚠️ {status_txt}")
+
+                rec = item.get('recovery')
+                if rec:
+                     ready = f"{rec.get('ready_secs')}s" if rec.get('ready_secs') is not None else "Not reached"
+                     report.append(f"   REST: {rec.get('rest_secs', 0)}s | Ready: {ready} | HR {-rec.get('hr_drop', 0):+d} bpm")
                      
                 report.append("")
         else:
             report.append("(No detailed physiological stats available)")
             report.append("")
 
+        # B2. CARDIO ANALYSIS (Ex 5)
+        if cardio:
+            report.append("• CARDIO ANALYSIS (EX 5)")
+            zones = " ".join(f"{z}:{secs}s" for z, secs in sorted(cardio.get('zone_secs', {}).items(), reverse=True))
+            report.append(f"   Zones: {zones or '--'}")
+            if cardio.get('drift_bpm_min') is not None:
+                report.append(f"   Drift: {cardio['drift_bpm_min']:+.1f} bpm/min")
+            hrr_30 = cardio.get('hrr_30')
+            hrr_60 = cardio.get('hrr_60')
+            # HRR is the drop from the end-of-exercise HR: shown as the (signed) change
+            hrr_30 = f"{-hrr_30:+d} bpm" if hrr_30 is not None else "--"
+            hrr_60 = f"{-hrr_60:+d} bpm" if hrr_60 is not None else "--"
+            report.append(f"   HRR: 30s {hrr_30} | 60s {hrr_60}")
+            report.append("")
+
         # C. SESSION NOTES - REMOVED PER USER REQUEST
         
         # D. VERDICT (Formatted)
@@ -3052,8 +2601,50 @@ class Bio5BXApp(tk.Tk):
             
             txt.insert(tk.END, line + "\n", tags)
         
-        btn = tk.Button(top, text="Close", command=top.destroy)
-        btn.pack(pady=10)
+        btn_frame = tk.Frame(top, bg="#2c3e50")
+        btn_frame.pack(pady=10)
+        tk.Button(btn_frame, text="HR Trace", command=lambda: self.show_session_trace(db_id, record['timestamp'])).pack(side=tk.LEFT, padx=5)
+        tk.Button(btn_frame, text="Close", command=top.destroy).pack(side=tk.LEFT, padx=5)
+
+    def show_session_trace(self, history_id, timestamp):
+        """Recorded HR / RMSSD of one session, per exercise. Raw CSV rows via the session_file
+           byte offsets (one seek per exercise), else the archived 1 Hz series."""
+        conn = self._db_connect()
+        entry = progress_db.load_session_file(conn, history_id)
+        if entry and not os.path.exists(entry['path']): entry = None
+        series = None if entry else session_retention.load_series(conn, history_id)
+        conn.close()
+
+        if entry: names = [s['exercise'] for s in entry['segments']]
+        else: names = list(dict.fromkeys(s['exercise'] for s in series or []))
+        if not names:
+            messagebox.showinfo("HR Trace", "No HR recording is linked to this session.")
+            return
+
+        top = tk.Toplevel(self)
+        top.title(f"HR Trace: {timestamp}")
+        top.geometry("750x600")
+        top.configure(bg="#2c3e50")
+        box = ttk.Combobox(top, values=names, state="readonly", width=50)
+        box.pack(pady=10)
+        txt = tk.Text(top, font=("Courier", 11), bg="#34495e", fg="white", padx=15, pady=15)
+        txt.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+
+        def show(_event=None):
+            i = box.current()
+            if entry:
+                lines = [f"{'Time':<14}{'HR':>5}{'RMSSD':>9}  Status"]
+                lines += [f"{r['Timestamp']:<14}{r['HR_BPM']:>5}{r['RMSSD_MS']:>9}  {r['Status']}" for r in read_segment(entry, i)]
+            else:
+                lines = [f"{'Offset':<14}{'HR':>5}{'RMSSD':>9}  (archived 1 Hz)"]
+                lines += [f"{format_secs(s['t']):<14}{s['hr']:>5}{s['rmssd']:>9.1f}" for s in series if s['exercise'] == names[i]]
+            txt.delete("1.0", tk.END)
+            txt.insert(tk.END, "\n".join(lines))
+
+        box.bind("<<ComboboxSelected>>", show)
+        box.current(0)
+        show()
+        tk.Button(top, text="Close", command=top.destroy).pack(pady=(0, 10))
     
     def show_exercise_history(self, target_chart_id, target_idx, title_name):
         """
@@ -3062,155 +2653,43 @@ class Bio5BXApp(tk.Tk):
         target_idx: 0-4 (The index in the routine) OR 5=Run, 6=Walk.
         title_name: Display name for the window title.
         """
-        records = self.db_get_history(self.user_id)
-        
-        dates = []
-        reps = []
-        hrs = []
-        hrvs = []
-        
-        for r in records:
-            # 1. Resolve Effective Chart for this Record
-            raw_chart = str(r['chart'])
-            eff_chart = raw_chart
-            
-            if "/" in raw_chart:
-                parts = raw_chart.split("/")
-                if len(parts) >= 2:
-                    if target_idx < 4: eff_chart = parts[0]
-                    else: eff_chart = parts[1]
-            
-            # 2. STRICT ID MATCH
-            if str(eff_chart) != str(target_chart_id):
-                 continue
-                 
-            # 3. Parse Value
-            val = 0
-            
-            # Reps list
-            reps_list = [0]*5
-            if r['ex1']: reps_list = [r['ex1'], r['ex2'], r['ex3'], r['ex4'], r['ex5']]
-            
-            if target_idx < 5:
-                # Use index directly from the DB row data we just extracted
-                val = reps_list[target_idx]
-            else:
-                # Handle Ex 6 (Run) / 7 (Walk)
-                keys = r.keys()
-                e_type = r['ex5_type'] if 'ex5_type' in keys else ""
-                e_dur = r['ex5_duration'] if 'ex5_duration' in keys else 0
-                if not e_type: e_type = ""
-                if not e_dur: e_dur = 0
-                
-                if target_idx == 5: # Run
-                    if "Run" in e_type: val = e_dur
-                elif target_idx == 6: # Walk
-                    if "Walk" in e_type: val = e_dur
-            
-            r_hr = r['avg_hr']
-            r_hrv = 0
-            
-            # 4. Parse JSON stats if available
-            stats_json = r.get('segment_stats')
-            if stats_json:
-                try:
-                    data = json.loads(stats_json)
-                    # Handle V2 Struct
-                    if isinstance(data, dict):
-                         data = data.get('segments', [])
-
-                    # Use Index Math
-                    t_stat = target_idx
-                    if target_idx >= 5: t_stat = 4
-                    
-                    if t_stat < len(data):
-                         item = data[t_stat]
-                         r_hr = item.get('max_hr', 0)
-                         r_hrv = item.get('hrv', 0)
-                except: pass
-            
-            if val > 0:
-                short_date = r['timestamp'].split(" ")[0][5:] # MM-DD
-                dates.append(short_date)
-                reps.append(val)
-                hrs.append(r_hr)
-                hrvs.append(r_hrv)
-                
-            # LIMIT TO 20
-            if len(dates) >= 20: break
-            
-        if not dates:
+        series = self.get_exercise_series().popup_series(target_chart_id, target_idx)
+        if not series[0]:
             messagebox.showinfo("History", f"No history data found for {title_name}")
             return
-            
-        # Reverse for plot (Oldest -> Newest)
-        dates = dates[::-1]
-        reps = reps[::-1]
-        hrs = hrs[::-1]
-        hrvs = hrvs[::-1]
 
         # -- PLOT --
-        top = tk.Toplevel(self)
-        
         # Detailed Title
         full_title = f"Chart {target_chart_id} Exercise {target_idx + 1}: {title_name}"
+
+        # One popup, reused: switching exercise only swaps the line data
+        top = self.history_popup
+        if top is None or not top.winfo_exists():
+            top = self.history_popup = tk.Toplevel(self)
+            
+            # 66% Screen Size
+            sw = top.winfo_screenwidth()
+            sh = top.winfo_screenheight()
+            w = int(sw * 0.66)
+            h = int(sh * 0.66)
+            x = (sw - w) // 2
+            y = (sh - h) // 2
+            top.geometry(f"{w}x{h}+{x}+{y}")
+            
+            top.configure(bg="#2c3e50")
         top.title(f"Progress: {full_title}")
-        
-        # 66% Screen Size
-        sw = top.winfo_screenwidth()
-        sh = top.winfo_screenheight()
-        w = int(sw * 0.66)
-        h = int(sh * 0.66)
-        x = (sw - w) // 2
-        y = (sh - h) // 2
-        top.geometry(f"{w}x{h}+{x}+{y}")
-        
-        top.configure(bg="#2c3e50")
-        
-        fig = Figure(figsize=(8, 6), dpi=100, facecolor="#2c3e50")
-        fig.subplots_adjust(hspace=0.4) # spacing
-        
-        # Subplot 1: Reps
-        ax1 = fig.add_subplot(211)
-        ax1.set_facecolor("#34495e")
-        ax1.plot(dates, reps, marker='o', color='#2ecc71', linewidth=2, label="Score")
-        
-        y_label = "Reps Count"
-        if target_idx >= 5: y_label = "Time (Seconds)"
-        
-        ax1.set_title(f"{y_label}: {full_title}", color="white")
-        ax1.tick_params(colors='white', rotation=45)
-        ax1.xaxis.set_major_locator(MaxNLocator(nbins=8)) # Fix Date Readability
-        ax1.grid(True, alpha=0.3)
-        ax1.legend()
-        
-        # Subplot 2: Bio
-        ax2 = fig.add_subplot(212)
-        ax2.set_facecolor("#34495e")
-        ax2.plot(dates, hrs, marker='s', color='#ff5555', linestyle='--', label="Avg HR")
-        
-        # Only plot HRV if we valid data
-        if any(h > 0 for h in hrvs):
-            ax2_2 = ax2.twinx()
-            ax2_2.plot(dates, hrvs, marker='^', color='#f1c40f', linestyle=':', label="HRV (ms)")
-            ax2_2.tick_params(colors='#f1c40f')
-            ax2_2.spines['right'].set_color('#f1c40f')
-            
-        ax2.set_title("Physiological Cost", color="white")
-        ax2.tick_params(colors='white', rotation=45)
-        ax2.xaxis.set_major_locator(MaxNLocator(nbins=8))
-        ax2.grid(True, alpha=0.3)
-        ax2.legend(loc='upper left')
-
-        canvas = FigureCanvasTkAgg(fig, master=top)
-        canvas.draw()
-        canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        top.lift()
+
+        graphs = _load_graphs()
+        if self.popup_graph is None: self.popup_graph = graphs.PopupGraph()
+        self.popup_graph.show(top, full_title, target_idx, series)
 
     def show_exercise_info_popup(self, idx):
+        from PIL import Image, ImageTk
         # Determine variant if Ex 5
         variant = "Standard"
-        if idx == 4:
-            variant = self.current_cardio_mode
+        if idx == 4 and self.workout and self.workout.cardio_mode:
+            variant = self.workout.cardio_mode
             
         c_chart = str(self.user_data.get('cardio_chart') or "1")
         s_chart = str(self.user_data.get('strength_chart') or "1")
@@ -3248,6 +2727,9 @@ class Bio5BXApp(tk.Tk):
             widget.destroy()
     def destroy(self):
         self.workout_active = False; self.dashboard_active = False; self.linker_active = False
+        self.persist.close() # Flush the write-behind queue
+        if self.manual_index: self.manual_index.close()
+        if self.workout and self.workout.journal: self.workout.journal.close() # Kept for resume if unfinished
         if self.sensor:
             try: self.sensor.stop()
             except: pass
@@ -3326,7 +2808,7 @@ class Bio5BXApp(tk.Tk):
                  cl_raw = str(level_displays.index(c_l_var.get()) + 1)
             
             # Update DB
-            conn = sqlite3.connect(USER_DB_FILE)
+            conn = self._db_connect()
             c = conn.cursor()
             c.execute("""
                 UPDATE users 
@@ -3350,7 +2832,8 @@ class Bio5BXApp(tk.Tk):
             db_level = sl_raw
             if sl_raw != cl_raw: db_level = f"{sl_raw}/{cl_raw}"
             
-            self.db_add_history(self.user_id, db_chart, db_level, verdict, 0, 0, 0, reps_list=[0]*5)
+            self.db_add_history(self.user_id, db_chart, db_level, verdict, 0, 0, 0, reps_list=[0]*5,
+                                prev_levels=(s_c, s_l, c_c, c_l), new_levels=(sc, sl_raw, cc, cl_raw))
             
             # Update Live Obj
             self.user_data["strength_chart"] = sc
@@ -3360,14 +2843,26 @@ class Bio5BXApp(tk.Tk):
         tk.Button(top, text="Save Changes", bg="#2ecc71", fg="white", font=("Arial", 11, "bold"), command=save).pack(pady=20)
 
     # --- DOCUMENTATION VIEWER ---
+    def open_plan_pdf(self):
+        from modules.pdf_viewer import open_plan
+        open_plan(self.view_chart_idx)
+
     def show_manual_popup(self):
+        from modules.manual_viewer import ManualViewer
+        from modules.manual_search import ManualIndex
+        from modules.pdf_viewer import PLAN_PDF
+
         pages = [
             ("Introduction", "manual/5bx_introduction.md", "#2980b9"),
             ("Progression Rules", "manual/progression_rules.md", "#8e44ad"),
-            ("Calibration Guide", "manual/calibration_guide.md", "#e67e22")
+            ("Calibration Guide", "manual/calibration_guide.md", "#e67e22"),
+            ("5BX Plan (PDF)", PLAN_PDF, "#16a085")
         ]
         
-        viewer = ManualViewer(title="5BX Manual & Rules", pages=pages)
+        # One index (sqlite connection) for the app's lifetime, closed in destroy()
+        if self.manual_index is None:
+            self.manual_index = ManualIndex([p[1] for p in pages if p[1].endswith(".md")], exercises_db=bx.DB_NAME)
+        viewer = ManualViewer(title="5BX Manual & Rules", pages=pages, search_index=self.manual_index)
         viewer.show()
 
 
@@ -3383,31 +2878,22 @@ class CalibrationWizard(tk.Toplevel):
         
         # Data State
         self.sensor = None
-        self.user_name = ""
-        self.user_dob = ""
-        self.user_age = 30
+        self.engine = None # CalibrationEngine (phases + results)
+        self.user_name = (initial_user_data or {}).get('name') # Picks the strap to pin
         self.current_phase = ""
         self.is_recording = False
         self.dashboard_active = False 
         self.retry_task = None
         self.reset_task = None 
 
-        self.phase_data_hr = []
-        self.phase_data_rmssd = []
-
-        self.results = {
-            "rest": {}, "stress": {}, "exertion": {}, "recovery": {}
-        }
-        
         # Start Sensor Logic
         self.dashboard_active = True 
         self.init_sensor_loop()
 
         # UI Setup - Jump straight to Phase 1
         if initial_user_data:
-            self.user_name = initial_user_data.get('name', 'Unknown')
-            self.user_dob = initial_user_data.get('dob', '')
-            self.user_age = initial_user_data.get('age', 30)
+            self.engine = CalibrationEngine(initial_user_data.get('name', 'Unknown'), initial_user_data.get('dob', ''),
+                                            initial_user_data.get('age', 30))
             
             # Start Wizard
             self.show_instruction("REST")
@@ -3426,7 +2912,8 @@ class CalibrationWizard(tk.Toplevel):
                 try: self.sensor.stop() 
                 except: pass
                 
-            self.sensor = AntHrvSensor()
+            from modules.sensor_daemon import create_sensor
+            self.sensor = create_sensor(pin=device_registry.lookup(self.user_name))
             self.sensor.start()
             self.after(500, self.check_startup_status)
         except Exception as e:
@@ -3493,6 +2980,7 @@ class CalibrationWizard(tk.Toplevel):
         self.lbl_live.pack()
         self.update_live_preview()
 
+    @metrics.timed("ui.wizard_dashboard_loop_ms")
     def update_dashboard_loop(self):
         if not self.dashboard_active: return
         if self.sensor:
@@ -3527,18 +3015,15 @@ class CalibrationWizard(tk.Toplevel):
     def run_phase_timer(self):
         self.is_recording = True
         self.btn_next.config(state="disabled")
-        self.phase_data_hr = []
-        self.phase_data_rmssd = []
-        self.remaining_time = PHASE_DURATIONS[self.current_phase]
+        self.engine.begin_phase()
+        self.remaining_time = self.engine.duration()
         self.record_loop()
 
     def record_loop(self):
         if self.remaining_time > 0:
             if self.sensor:
                 data = self.sensor.get_data()
-                if data.get('bpm',0) > 0:
-                    self.phase_data_hr.append(data['bpm'])
-                    self.phase_data_rmssd.append(data.get('rmssd',0))
+                self.engine.sample(data)
                 self.lbl_live.config(text=f"RECORDING... {self.remaining_time}s\n♥ {data.get('bpm',0)} | ⚡ {data.get('rmssd',0):.3f}")
             self.remaining_time -= 1
             self.after(1000, self.record_loop)
@@ -3548,24 +3033,10 @@ class CalibrationWizard(tk.Toplevel):
     def finish_phase(self):
         self.play_beep()
         self.is_recording = False
-        
-        if len(self.phase_data_hr) > 0:
-            avg_hr = statistics.mean(self.phase_data_hr)
-            max_hr = max(self.phase_data_hr)
-            avg_rmssd = statistics.mean(self.phase_data_rmssd)
-            peak_rmssd = max(self.phase_data_rmssd)
-        else:
-            avg_hr, max_hr, avg_rmssd, peak_rmssd = 0, 0, 0, 0
-
-        self.results[self.current_phase.lower()] = {
-            "avg_hr": avg_hr, "max_hr": max_hr,
-            "avg_rmssd": avg_rmssd, "peak_rmssd": peak_rmssd
-        }
 
-        sequence = ["REST", "STRESS", "EXERTION", "RECOVERY"]
-        curr_idx = sequence.index(self.current_phase)
-        if curr_idx < len(sequence) - 1:
-            self.show_instruction(sequence[curr_idx + 1])
+        next_phase = self.engine.finish_phase()
+        if next_phase:
+            self.show_instruction(next_phase)
         else:
             self.save_profile()
 
@@ -3574,53 +3045,12 @@ class CalibrationWizard(tk.Toplevel):
         self.dashboard_active = False 
         self.clear_screen()
 
-        profile = UserProfile(self.user_name)
-        profile.calibrate(self.results['rest'], self.results['stress'], self.results['recovery'])
-        
-        age_max = 220 - self.user_age
-        measured_max = self.results['exertion']['max_hr']
-        profile.max_hr = max(age_max, measured_max)
-
-        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        new_stats = {
-            "date": timestamp,
-            "resting_hr": round(profile.resting_hr, 1),
-            "baseline_rmssd": round(profile.baseline_rmssd, 3),
-            "stress_hr_threshold": round(profile.stress_hr_threshold, 1),
-            "recovery_score": round(profile.recovery_score, 1),
-            "max_hr": int(profile.max_hr),
-            "raw_results": self.results
-        }
-
         # Resolve File via DB (using parent app reference)
-        db_u = self.parent.db_get_user(self.user_name)
-        filename = db_u['linked_file'] if (db_u and db_u.get('linked_file') and db_u['linked_file'] != 'none') else f"{self.user_name.lower().replace(' ', '_')}_profile.json"
-        
-        full_path = os.path.join(PROFILE_DIR, filename) 
-        
-        final_data = {
-            "name": self.user_name,
-            "dob": self.user_dob,
-            "age": self.user_age,
-            "current_stats": new_stats,
-            "history": []
-        }
-
-        if os.path.exists(full_path):
-            backup_name = f"{filename}.{int(time.time())}.bak"
-            if not os.path.exists(BACKUP_DIR): os.makedirs(BACKUP_DIR)
-            try: shutil.copy(full_path, os.path.join(BACKUP_DIR, backup_name))
-            except: pass
-
-            try:
-                with open(full_path, 'r') as f: old_data = json.load(f)
-                if "history" in old_data: final_data["history"] = old_data["history"]
-                if "current_stats" in old_data: final_data["history"].append(old_data["current_stats"])
-            except: pass
-
-        with open(full_path, 'w') as f:
-            json.dump(final_data, f, indent=4)
+        name = self.engine.user_name
+        db_u = self.parent.db_get_user(name)
+        filename = db_u['linked_file'] if (db_u and db_u.get('linked_file') and db_u['linked_file'] != 'none') else f"{name.lower().replace(' ', '_')}_profile.json"
 
+        profile = self.engine.save_profile(filename, PROFILE_DIR, BACKUP_DIR)
         self.show_success_screen(profile, filename)
 
     def show_success_screen(self, profile, filename):
@@ -3655,14 +3085,38 @@ class CalibrationWizard(tk.Toplevel):
         super().destroy()
 
 if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Bio-Adaptive 5BX Trainer")
+    parser.add_argument("--profile-startup", action="store_true", help="Print import / init phase timings")
+    parser.add_argument("--telemetry", action="store_true", help="Log sensor link telemetry alongside sessions")
+    parser.add_argument("--metrics", action="store_true", help=f"Collect metrics, written to {metrics.METRICS_FILE}")
+    parser.add_argument("--metrics-port", type=int, help="Also serve metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--watchdog", nargs="?", type=int, const=250, metavar="MS",
+                        help="Report main loop stalls longer than MS (default 250) by callback on exit")
+    args, _ = parser.parse_known_args()
+    startup_profile.enabled = args.profile_startup
+    LOG_TELEMETRY = args.telemetry
+    if args.metrics or args.metrics_port:
+        try:
+            metrics.start(http_port=args.metrics_port)
+        except OSError as e:
+            # Port taken: keep the file exporter, train without the HTTP endpoint
+            print(f"Metrics HTTP Error (port {args.metrics_port}): {e}")
+
+    watchdog = None
     try:
         app = Bio5BXApp()
+        if args.watchdog:
+            from modules.tk_watchdog import TkWatchdog
+            watchdog = TkWatchdog(app, threshold_ms=args.watchdog).start()
         app.mainloop()
     except KeyboardInterrupt:
         pass
     finally:
+        if watchdog: watchdog.stop()
         if 'app' in locals() and hasattr(app, 'sensor') and app.sensor:
              app.sensor.stop()
         if 'app' in locals():
              try: app.destroy()
              except: pass
+        metrics.shutdown()
@@ -0,0 +1,282 @@
+"""
+Headless 5BX runner - the trainer's workout and calibration flows without Tk.
+
+    python -m fivebx run --user "Matthew" --sensor replay:ant_sessions/<session>.csv --speed 0
+    python -m fivebx run --user "Matthew" --sensor ant --cardio run --results 30,20,25,15,540
+    python -m fivebx calibrate --user "Matthew" --sensor replay:<session>.csv --speed 0
+
+Sensors:  ant (USB stick, or the sensor daemon if running), replay:<session csv> (recorded session), none (no HR data).
+--speed is the clock multiplier: 1 = real time, 60 = a minute per second, 0 = as fast as
+possible. Results go to the same DB / profile / session files as the trainer; point --db
+etc. at copies for benchmarks, or pass --no-save.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+
+import modules.progress_db as progress_db
+import modules.progression_engine as pe
+import modules.user_stats as user_stats
+import modules.device_registry as device_registry
+from modules.ant_user_profile import UserProfile
+from modules.workout_engine import WorkoutEngine, SessionLogger
+from modules.calibration_engine import CalibrationEngine
+from modules.replay_sensor import ReplaySensor
+
+USER_DB_FILE = "databases/user_progress.db"
+PROFILE_DIR = "ant_user_profiles"
+SESSION_DIR = "ant_sessions"
+COUNTDOWN_SECS = 3 # Matches the trainer's start countdown
+SENSOR_WAIT_SECS = 30
+
+
+class RunnerError(Exception):
+    pass
+
+
+class SimClock:
+    """Seconds since start. sleep() advances it and waits secs / speed of real time."""
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.t = 0.0
+        self.started = datetime.datetime.now()
+
+    def now(self):
+        return self.t
+
+    def datetime(self):
+        return self.started + datetime.timedelta(seconds=self.t)
+
+    def sleep(self, secs):
+        self.t += secs
+        if self.speed > 0: time.sleep(secs / self.speed)
+
+
+def open_sensor(spec, clock, user_name=None):
+    if spec == "none": return None
+    if spec.startswith("replay:"):
+        sensor = ReplaySensor(spec[len("replay:"):], clock.now)
+        sensor.start()
+        return sensor
+    if spec == "ant":
+        from modules.sensor_daemon import create_sensor
+        sensor = create_sensor(pin=device_registry.lookup(user_name))
+        sensor.start()
+        deadline = time.time() + SENSOR_WAIT_SECS
+        while sensor.get_data().get('status') != "Active" and time.time() < deadline: time.sleep(0.5)
+        return sensor
+    raise RunnerError(f"Unknown sensor {spec!r} (ant | replay:<file> | none)")
+
+
+def read_sensor(sensor):
+    if sensor and sensor.running: return sensor.get_data()
+    return None
+
+
+# --- USER / PROFILE ---
+def calculate_age(dob_str):
+    try:
+        birth_date = datetime.datetime.strptime(dob_str, "%Y-%m-%d").date()
+        today = datetime.date.today()
+        return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+    except (TypeError, ValueError):
+        return None
+
+
+def load_user(conn, name, profile_dir):
+    """(user row dict, profile data, profile path, age) - resolved the way the trainer does."""
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM users WHERE name=?", (name,)).fetchone()
+    conn.row_factory = None
+    if not row: raise RunnerError(f"No user named {name!r}")
+    user = dict(row)
+    linked = user.get('linked_file')
+    filename = linked if linked and linked != 'none' else f"{name.lower().replace(' ', '_')}_profile.json"
+    path = os.path.join(profile_dir, filename)
+    profile_data = {}
+    if os.path.exists(path):
+        with open(path) as f: profile_data = json.load(f)
+    age = calculate_age(profile_data.get("dob") or user.get("dob")) or profile_data.get("age") or user.get("age") or 30
+    return user, profile_data, path, age
+
+
+def bio_profile_for(name, profile_data, age):
+    curr = profile_data.get('current_stats', {})
+    bio = UserProfile(name)
+    bio.baseline_rmssd = curr.get('baseline_rmssd', 40)
+    bio.resting_hr = curr.get('resting_hr', 60)
+    bio.max_hr = max(curr.get('max_hr', 180), 220 - age)
+    return bio
+
+
+def parse_results(text):
+    """'target' or five comma separated values (Run/Walk time as seconds or M:SS)."""
+    if text == "target": return None
+    values = []
+    for part in text.split(","):
+        part = part.strip()
+        if ":" in part:
+            m, s = part.split(":")
+            values.append(int(m) * 60 + int(s))
+        else:
+            values.append(int(part))
+    if len(values) != 5: raise RunnerError("--results needs 5 values")
+    return values
+
+
+# --- WORKOUT ---
+def run_workout(args):
+    clock = SimClock(args.speed)
+    progress_db.init_db(args.db)
+    conn = sqlite3.connect(args.db)
+    try:
+        user, profile_data, profile_path, age = load_user(conn, args.user, args.profile_dir)
+        bio = bio_profile_for(args.user, profile_data, age)
+        results = parse_results(args.results)
+        sensor = open_sensor(args.sensor, clock, args.user)
+        logger = None if args.no_save else SessionLogger(args.user, args.session_dir, now=clock.datetime, mono=clock.now)
+
+        engine = WorkoutEngine(user, bio.max_hr, bio, logger, now=clock.now)
+        t0 = time.perf_counter()
+        engine.start()
+
+        def tick(secs):
+            for _ in range(int(secs)):
+                data = read_sensor(sensor)
+                if data: engine.sample(data)
+                if args.telemetry: engine.log_telemetry(sensor)
+                clock.sleep(1)
+
+        analyzer = None
+        while not engine.finished:
+            if engine.needs_cardio_choice:
+                options = engine.cardio_options()
+                pick = {"stationary": 0, "run": 1, "walk": 2}[args.cardio]
+                if pick >= len(options): raise RunnerError(f"Chart has no {args.cardio} option")
+                engine.select_cardio(*options[pick])
+            idx = engine.idx
+            details = engine.begin_exercise()
+            value = results[idx] if results else engine.target_reps_list[idx]
+
+            if idx > 0: tick(args.rest) # Between exercises (recovery tracking)
+            if engine.alt_cardio:
+                tick(value) # Out on the run / walk: the result is the time taken
+            else:
+                engine.end_recovery()
+                tick(COUNTDOWN_SECS)
+                engine.start_timer()
+                tick(engine.duration())
+            analyzer = engine.stop_timer() or analyzer
+            engine.record_result(value)
+            print(f"  Ex {idx + 1}: {details['name']} -> {value} (target {engine.target_reps_list[idx]})")
+
+        # Ex 5 heart rate recovery (the trainer samples this while the summary is shown)
+        while analyzer and not analyzer.add_recovery_sample((read_sensor(sensor) or {}).get('bpm', 0), clock.now()):
+            clock.sleep(1)
+
+        def consecutive_fails(component):
+            stats = user_stats.load(conn, user['id']) or user_stats.rebuild(conn, [user['id']])[user['id']]
+            key = 'strength_streak' if component == "Strength" else 'cardio_streak'
+            return min(stats[key], pe.DEFAULT_RULES["fail_lookback"])
+
+        res = engine.finish(consecutive_fails, age)
+        if sensor:
+            if args.sensor == "ant" and not args.no_save: device_registry.remember(args.user, sensor.get_data())
+            sensor.stop()
+
+        history_id = None
+        if not args.no_save:
+            with conn:
+                progress_db.update_split_level(conn, user['id'], *res['new_levels'])
+                history_id = progress_db.insert_history(conn, user['id'], clock.datetime().strftime("%Y-%m-%d %H:%M:%S"), **res['history'])
+                if engine.cardio_analyzer and engine.cardio_analyzer.phase == "DONE":
+                    progress_db.merge_cardio_metrics(conn, history_id, engine.cardio_analyzer.summary())
+            if res['new_max_hr'] and "current_stats" in profile_data:
+                profile_data['current_stats']['max_hr'] = res['new_max_hr']
+                with open(profile_path, 'w') as f: json.dump(profile_data, f, indent=4)
+        elapsed = time.perf_counter() - t0
+    finally:
+        conn.close()
+
+    report = res['report']
+    hrr = engine.cardio_analyzer.summary() if engine.cardio_analyzer and engine.cardio_analyzer.phase == "DONE" else None
+    if hrr: # Already measured above, unlike the trainer's summary screen
+        fmt = lambda v: f"{-v:+d} bpm" if v is not None else "--"
+        report = [f"   HR Recovery: 30s {fmt(hrr['hrr_30'])} | 60s {fmt(hrr['hrr_60'])}" if l.startswith("   HR Recovery:") else l for l in report]
+    print("\n".join(report))
+    print(f"\nVerdict: {res['verdict']}")
+    for m in res['milestones'] or []: print(f"🏆 {m['text']}")
+    saved = f"history #{history_id}" if history_id else "not saved"
+    if logger: saved += f", {logger.filename}"
+    print(f"Workout: {clock.now():.0f}s simulated in {elapsed:.2f}s ({saved})")
+    return 0
+
+
+# --- CALIBRATION ---
+def run_calibration(args):
+    clock = SimClock(args.speed)
+    progress_db.init_db(args.db)
+    conn = sqlite3.connect(args.db)
+    try:
+        user, profile_data, profile_path, age = load_user(conn, args.user, args.profile_dir)
+    finally:
+        conn.close()
+    sensor = open_sensor(args.sensor, clock, args.user)
+    engine = CalibrationEngine(args.user, profile_data.get("dob") or user.get("dob") or "", age)
+    t0 = time.perf_counter()
+
+    while not engine.finished:
+        phase = engine.phase
+        engine.begin_phase()
+        for _ in range(engine.duration()):
+            data = read_sensor(sensor)
+            if data: engine.sample(data)
+            clock.sleep(1)
+        engine.finish_phase()
+        r = engine.results[phase.lower()]
+        print(f"  {phase}: avg HR {r['avg_hr']:.1f} | max {r['max_hr']} | RMSSD {r['avg_rmssd']:.1f} (peak {r['peak_rmssd']:.1f})")
+    if sensor: sensor.stop()
+
+    if args.no_save:
+        profile, _ = engine.build_profile()
+    else:
+        profile = engine.save_profile(os.path.basename(profile_path), args.profile_dir, os.path.join(args.profile_dir, "backups"))
+    print(f"Resting HR: {profile.resting_hr:.1f} bpm | Baseline HRV: {profile.baseline_rmssd:.3f} ms | Max HR: {int(profile.max_hr)} bpm")
+    print(f"Calibration: {clock.now():.0f}s simulated in {time.perf_counter() - t0:.2f}s ({'not saved' if args.no_save else profile_path})")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="fivebx", description="Headless 5BX workout / calibration runner.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="Run a full workout and record it")
+    run.add_argument("--cardio", choices=("stationary", "run", "walk"), default="stationary", help="Exercise 5 variant")
+    run.add_argument("--results", default="target", help="'target' (hit every target) or 5 comma separated results")
+    run.add_argument("--rest", type=int, default=30, help="Seconds between exercises")
+    run.add_argument("--telemetry", action="store_true", help="Log sensor link telemetry alongside the session")
+    cal = sub.add_parser("calibrate", help="Run the calibration protocol and save the profile")
+    for p in (run, cal):
+        p.add_argument("--user", required=True)
+        p.add_argument("--sensor", default="ant", help="ant | replay:<session csv> | none")
+        p.add_argument("--speed", type=float, default=1.0, help="Clock multiplier (0 = as fast as possible)")
+        p.add_argument("--no-save", action="store_true", help="Don't write the DB / profile / session log")
+        p.add_argument("--db", default=USER_DB_FILE)
+        p.add_argument("--profile-dir", default=PROFILE_DIR)
+        p.add_argument("--session-dir", default=SESSION_DIR)
+    args = parser.parse_args(argv)
+
+    try:
+        return run_workout(args) if args.command == "run" else run_calibration(args)
+    except RunnerError as e:
+        print(f"Error: {e}")
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,28 @@
 import sqlite3
 import json
-import five_bx_data as bx
 import datetime
 import random
+import collections
+import argparse
+import multiprocessing
+import time
 
-DB_FILE = "user_progress.db"
+import modules.five_bx_data as bx
+import modules.progression_engine as pe
+import modules.progress_db as progress_db
+import modules.user_stats as user_stats
+
+DB_FILE = "databases/user_progress.db"
+LOAD_TEST_DB = "databases/load_test.db" # Population runs never touch the real progress DB
+
+# Labels exactly as the trainer stores them in history.ex5_type (mode, probability)
+CARDIO_MODES = [
+    ("Standard (Stationary)", 0.60),
+    ("1 Mile (1.6 km) Run", 0.20),
+    ("2 Mile (3.2 km) Walk", 0.15),
+    ("2 Mile (3.2 km) Jog", 0.05)
+]
+USERS_PER_BATCH = 200 # One worker task and one transaction per batch
 
 def create_test_user():
     conn = sqlite3.connect(DB_FILE)
@@ -21,16 +39,8 @@ def create_test_user():
     conn.close()
     return uid
 
-def get_progression_desc(old_c, old_l, new_c, new_l, status, score_old, score_new):
-    if status != "UP": return "MAINTAIN" 
-    diff = score_new - score_old
-    n_disp = bx.get_level_display(new_l)
-    dest = f"C{new_c} {n_disp}"
-    if diff > 1: return f"LEAPFROG to {dest}"
-    if str(new_c) != str(old_c): return f"PROMOTION to {dest}"
-    return f"LEVEL UP to {dest}"
-
 def generate_data():
+    progress_db.init_db(DB_FILE)
     uid = create_test_user()
     print(f"Generating FULL PROGRESSION data for User ID: {uid}")
     
@@ -52,9 +62,9 @@ def generate_data():
     # Start date
     start_date = datetime.date.today() - datetime.timedelta(days=20)
     
-    # Tracking Fail Streaks
-    consecutive_s = 0
-    consecutive_c = 0
+    # Progression rules come from the trainer's engine (same verdicts as a real session)
+    table = pe.get_chart_table()
+    recent = collections.deque(maxlen=pe.DEFAULT_RULES['fail_lookback']) # Newest first
     
     while day < max_days:
         s_score = bx.get_total_score(current_s_c, current_s_l)
@@ -63,8 +73,8 @@ def generate_data():
         date_str = (start_date + datetime.timedelta(days=day)).strftime("%Y-%m-%d 18:00:00")
         
         # Targets
-        s_targets = bx.get_targets(current_s_c, current_s_l)
-        c_targets = bx.get_targets(current_c_c, current_c_l)
+        s_targets = table.targets(current_s_c, current_s_l)
+        c_targets = table.targets(current_c_c, current_c_l)
         
         s_outcome = "PASS"
         if 5 <= day <= 7: 
@@ -98,56 +108,6 @@ def generate_data():
             elif s_outcome == "CRUSH": reps[i] = tgt + random.randint(3, 8)
             else: reps[i] = tgt + random.randint(0, 2)
             
-        # Calculate Logic
-        
-        # 1. Strength
-        s_missed = 0
-        for i in range(4):
-            if reps[i] < s_targets[i]: s_missed += 1
-            
-        s_status = "MAINTAIN"
-        s_new_c, s_new_l = current_s_c, current_s_l
-        s_score_curr = bx.get_total_score(current_s_c, current_s_l)
-        s_score_perf = s_score_curr
-        
-        if s_missed == 0 and s_score_curr < max_score:
-            consecutive_s = 0 # Reset
-            s_perf_c, s_perf_l = bx.calculate_strength_placement(reps, current_s_c)
-            s_score_perf_calc = bx.get_total_score(s_perf_c, s_perf_l)
-            
-            # Force Next Check
-            s_next_c, s_next_l = bx.get_next_level(current_s_c, current_s_l)
-            s_score_next = bx.get_total_score(s_next_c, s_next_l)
-            
-            final_score = s_score_perf_calc
-            final_c, final_l = s_perf_c, s_perf_l
-            
-            if s_score_perf_calc < s_score_next:
-                final_score = s_score_next
-                final_c, final_l = s_next_c, s_next_l
-                
-            if final_score > s_score_curr:
-                s_status = "UP"
-                s_new_c, s_new_l = final_c, final_l
-                s_score_perf = final_score
-        else:
-            if s_missed > 0:
-                consecutive_s += 1
-                if consecutive_s >= 3:
-                    s_status = "DOWN"
-                    consecutive_s = 0
-                    s_perf_c, s_perf_l = bx.calculate_strength_placement(reps, current_s_c)
-                    s_new_c, s_new_l = s_perf_c, s_perf_l
-                    s_score_perf = bx.get_total_score(s_new_c, s_new_l)
-            else:
-                 consecutive_s = 0 # Passed maxed out
-
-        # 2. Cardio
-        c_status = "MAINTAIN"
-        c_new_c, c_new_l = current_c_c, current_c_l
-        c_score_curr = bx.get_total_score(current_c_c, current_c_l)
-        c_score_perf = c_score_curr
-        
         # Pick Mode (Randomize)
         # 60% Stationary, 20% Run, 20% Walk
         # Unless forced fail implies a specific mode? No, assume mode is user choice.
@@ -169,17 +129,7 @@ def generate_data():
             reps[4] = c_val
         else:
             # Run/Walk - Need Target Time
-            # We'll just assume a quick lookup
-            bx_conn = sqlite3.connect(bx.DB_NAME)
-            cursor = bx_conn.cursor()
-            col = "ex5_run" if c_mode == "Run" else "ex5_walk"
-            try:
-                cursor.execute(f"SELECT {col} FROM ExerciseTimes WHERE chart=? AND level=?", (int(current_c_c), int(current_c_l)))
-                row = cursor.fetchone()
-                c_tgt = row[0] if row and row[0] else 300 # Fallback 5m (safer)
-            except:
-                c_tgt = 300
-            bx_conn.close()
+            c_tgt = table.time_target(current_c_c, current_c_l, c_mode)
             
             # Time: Lower is Better
             if c_outcome == "FAIL": c_val = c_tgt + random.randint(10, 120) # Slower
@@ -188,64 +138,14 @@ def generate_data():
             reps[4] = c_val
 
         # Evaluate Performance
-        passed = False
-        perf_c, perf_l = current_c_c, current_c_l
-        
-        if c_mode == "Stationary":
-            passed = (c_val >= c_tgt)
-        else:
-            passed = (c_val <= c_tgt) # Time limit
-
-        if passed and c_score_curr < max_score: 
-             # FORCE UP if Passed
-             c_status = "UP"
-             
-             # Metric 1: Next Level (Minimum Guarantee)
-             c_next_c, c_next_l = bx.get_next_level(current_c_c, current_c_l)
-             score_next = bx.get_total_score(c_next_c, c_next_l)
-             
-             # Metric 2: Placement (Leapfrog)
-             if c_mode == "Stationary":
-                 p_c, p_l = bx.calculate_cardio_placement(reps, current_c_c)
-             else:
-                 p_c, p_l = bx.calculate_cardio_time_placement(c_val, c_mode, current_c_c)
-             score_place = bx.get_total_score(p_c, p_l)
-             
-             # Take Max
-             if score_place > score_next:
-                 c_new_c, c_new_l = p_c, p_l
-                 c_score_perf = score_place
-             else:
-                 c_new_c, c_new_l = c_next_c, c_next_l
-                 c_score_perf = score_next
-        else:
-            # Failed or Maxed
-            if not passed:
-                consecutive_c += 1
-                if consecutive_c >= 3:
-                     c_status = "DOWN"
-                     consecutive_c = 0
-                     # Recalculate based on failure input
-                     if c_mode == "Stationary":
-                        c_perf_c, c_perf_l = bx.calculate_cardio_placement(reps, current_c_c)
-                     else:
-                        c_perf_c, c_perf_l = bx.calculate_cardio_time_placement(c_val, c_mode, current_c_c)
-                     
-                     c_new_c, c_new_l = c_perf_c, c_perf_l
-                     c_score_perf = bx.get_total_score(c_new_c, c_new_l)
-            else:
-                consecutive_c = 0 # Passed but maxed out?
-        
-        # Verdict Strings
-        def get_v_desc(old_c, old_l, new_c, new_l, status, score_old, score_new):
-             if status == "DOWN":
-                 n_disp = bx.get_level_display(new_l)
-                 return f"DEMOTION to C{new_c} {n_disp}"
-             return get_progression_desc(old_c, old_l, new_c, new_l, status, score_old, score_new)
-
-        s_v = get_v_desc(current_s_c, current_s_l, s_new_c, s_new_l, s_status, s_score_curr, s_score_perf)
-        c_v = get_v_desc(current_c_c, current_c_l, c_new_c, c_new_l, c_status, c_score_curr, c_score_perf)
-        final_verdict = f"Strength ({s_v}) / Cardio ({c_v})"
+        targets = s_targets[:4] + [c_tgt]
+        s_res = pe.evaluate_strength(current_s_c, current_s_l, reps, targets,
+                                     pe.count_consecutive_fails(recent, "Strength"), table)
+        c_res = pe.evaluate_cardio(current_c_c, current_c_l, reps, targets, c_mode,
+                                   pe.count_consecutive_fails(recent, "Cardio"), table)
+        s_new_c, s_new_l = s_res['new']
+        c_new_c, c_new_l = c_res['new']
+        final_verdict = pe.format_verdict(s_res, c_res)
         
         # JSON Stats
         seg_data = []
@@ -285,6 +185,7 @@ def generate_data():
               final_type, final_dur, json.dumps(stats_payload), ""))
         
         # Advance state for next day
+        recent.appendleft({'chart': chart_str, 'level': level_str, 'verdict': final_verdict})
         current_s_c, current_s_l = s_new_c, s_new_l
         current_c_c, current_c_l = c_new_c, c_new_l
         
@@ -305,10 +206,172 @@ def generate_data():
           current_s_c, current_s_l,
           current_c_c, current_c_l,
           uid))
+    user_stats.rebuild(conn, [uid])
     conn.commit()
     conn.close()
     
     print(f"Done. Generated {day} records. Final Level: Chart {final_chart} Level {final_level}")
 
+# --- POPULATION GENERATOR (LOAD TESTING) ---
+MAX_SCORE = bx.get_total_score("6", "12")
+
+def _score_to_level(score):
+    """Inverse of bx.get_total_score (clamped to C1 D- .. C6 A+)."""
+    score = int(round(min(MAX_SCORE, max(13, score))))
+    return str((score - 1) // 12), str((score - 1) % 12 + 1)
+
+def _pick_mode(rng):
+    roll = rng.random()
+    for mode, p in CARDIO_MODES:
+        if roll < p: return mode
+        roll -= p
+    return CARDIO_MODES[0][0]
+
+def simulate_user(rng, table, user_id, sessions, today):
+    """
+    One synthetic athlete. Each component has a hidden ability (a chart/level score)
+    that improves slowly with training; every session scatters reps and times around
+    the ExerciseTimes targets of that ability level, so the engine produces a believable
+    mix of level ups, strikes and demotions. Returns (user_row, history_rows).
+    """
+    age = rng.randint(18, 65)
+    dob = (today - datetime.timedelta(days=age * 365 + rng.randint(0, 364))).strftime("%Y-%m-%d")
+    true_max = 220 - age
+
+    s_c = c_c = str(rng.choice([1, 1, 1, 2, 2, 3]))
+    s_l = c_l = str(rng.randint(1, 12))
+    goal_c, goal_l = bx.get_age_goal(age)
+    start_score = bx.get_total_score(s_c, s_l)
+    s_ability = start_score + rng.gauss(1.0, 1.5)
+    c_ability = start_score + rng.gauss(1.0, 1.5)
+
+    recent = collections.deque(maxlen=pe.DEFAULT_RULES['fail_lookback']) # Newest first
+    ts = datetime.datetime.combine(today - datetime.timedelta(days=sessions * 2), datetime.time(6, 0))
+    rows = []
+
+    for _ in range(sessions):
+        ts += datetime.timedelta(days=rng.choice([1, 1, 2, 2, 3]), minutes=rng.randint(-120, 120))
+        mode = _pick_mode(rng)
+        targets = pe.session_targets(table, s_c, s_l, c_c, c_l, mode)
+
+        able = pe.session_targets(table, *(_score_to_level(s_ability) + _score_to_level(c_ability)), mode)
+        reps = [max(0, int(round(t * rng.gauss(1.0, 0.06)))) for t in able[:4]]
+        if pe.is_alt_cardio(mode):
+            reps.append(int(able[4] / max(0.5, rng.gauss(1.0, 0.04)))) # Time: lower is better
+        else:
+            reps.append(max(0, int(round(able[4] * rng.gauss(1.0, 0.06)))))
+
+        s_res = pe.evaluate_strength(s_c, s_l, reps, targets, pe.count_consecutive_fails(recent, "Strength"), table)
+        c_res = pe.evaluate_cardio(c_c, c_l, reps, targets, mode, pe.count_consecutive_fails(recent, "Cardio"), table)
+        verdict = pe.format_verdict(s_res, c_res)
+
+        avg_hr = int(true_max * rng.uniform(0.6, 0.8))
+        seg_data = []
+        for i, name in enumerate(["Toe Touch", "Sit-up", "Back Extension", "Push-up", "Cardio"]):
+            seg_avg = min(true_max, avg_hr + rng.randint(-15, 10) + i * 4)
+            seg_data.append({
+                "name": name,
+                "avg_hr": seg_avg,
+                "max_hr": min(true_max + 5, seg_avg + rng.randint(5, 20)),
+                "hrv": rng.randint(10, 60),
+                "status": ""
+            })
+        stats_payload = {
+            "version": "2.0",
+            "segments": seg_data,
+            "badges": [],
+            "verdict_reason": pe.session_reason(s_res, c_res)
+        }
+
+        ex5, ex5_dur = reps[4], 0
+        if pe.is_alt_cardio(mode): ex5, ex5_dur = 1, reps[4] # Same encoding as finish_workout
+
+        chart_str, level_str = f"{s_c}/{c_c}", f"{s_l}/{c_l}" # Start-of-session levels
+        rows.append((user_id, ts.strftime("%Y-%m-%d %H:%M:%S"), chart_str, level_str, verdict,
+                     avg_hr, max(s["max_hr"] for s in seg_data), rng.randint(15, 60),
+                     reps[0], reps[1], reps[2], reps[3], ex5,
+                     json.dumps(stats_payload), mode, ex5_dur, None))
+
+        recent.appendleft({'chart': chart_str, 'level': level_str, 'verdict': verdict})
+        s_c, s_l = s_res['new']
+        c_c, c_l = c_res['new']
+        s_ability = min(MAX_SCORE, s_ability + rng.gauss(0.04, 0.03))
+        c_ability = min(MAX_SCORE, c_ability + rng.gauss(0.04, 0.03))
+
+    user_row = (user_id, f"LoadTest{user_id:07d}", age, "", dob,
+                s_c, s_l, goal_c, goal_l, s_c, s_l, c_c, c_l)
+    return user_row, rows
+
+def _simulate_batch(task):
+    first_id, count, sessions, seed = task
+    rng = random.Random(seed)
+    table = pe.get_chart_table()
+    today = datetime.date.today()
+    users, history = [], []
+    for uid in range(first_id, first_id + count):
+        user_row, rows = simulate_user(rng, table, uid, sessions, today)
+        users.append(user_row)
+        history.extend(rows)
+    return users, history
+
+def generate_population(db_file, users, sessions, workers=1, seed=None):
+    progress_db.init_db(db_file)
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA synchronous=OFF") # Throwaway fixture - favour bulk insert speed
+    conn.execute("PRAGMA journal_mode=MEMORY")
+
+    first_id = (conn.execute("SELECT MAX(id) FROM users").fetchone()[0] or 0) + 1
+    seed = seed if seed is not None else random.randrange(1 << 30)
+    tasks = []
+    for start in range(0, users, USERS_PER_BATCH):
+        count = min(USERS_PER_BATCH, users - start)
+        tasks.append((first_id + start, count, sessions, seed + start))
+
+    print(f"Generating {users} users x {sessions} sessions into {db_file} ({workers} worker(s), seed {seed})")
+    t0 = time.perf_counter()
+    done_users = done_rows = 0
+
+    pool = multiprocessing.Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap_unordered(_simulate_batch, tasks) if pool else map(_simulate_batch, tasks)
+        for user_rows, history_rows in results:
+            with conn: # One transaction per batch
+                conn.executemany("""INSERT INTO users
+                                    (id, name, age, linked_file, dob,
+                                     current_chart, current_level, goal_chart, goal_level,
+                                     strength_chart, strength_level, cardio_chart, cardio_level)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", user_rows)
+                conn.executemany("""INSERT INTO history
+                                    (user_id, timestamp, chart, level, verdict, avg_hr, max_hr, end_rmssd,
+                                     ex1, ex2, ex3, ex4, ex5, segment_stats, ex5_type, ex5_duration, notes)
+                                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""", history_rows)
+                user_stats.rebuild(conn, [u[0] for u in user_rows])
+            done_users += len(user_rows)
+            done_rows += len(history_rows)
+            elapsed = time.perf_counter() - t0
+            print(f"   {done_users}/{users} users, {done_rows} rows ({done_rows / elapsed:,.0f} rows/s)")
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        conn.close()
+
+    print(f"Done. {done_rows} history rows in {time.perf_counter() - t0:.1f}s")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Synthetic 5BX progress data.")
+    parser.add_argument("--users", type=int, default=0,
+                        help="Generate a population of N users (default: single 'Test' demotion demo)")
+    parser.add_argument("--sessions", type=int, default=100, help="Sessions per user")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to simulate users")
+    parser.add_argument("--db", default=LOAD_TEST_DB, help="Target database for --users")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.users > 0:
+        generate_population(args.db, args.users, args.sessions, max(1, args.workers), args.seed)
+    else:
+        generate_data()
+
 if __name__ == "__main__":
-    generate_data()
+    main()
@@ -10,9 +10,95 @@ from openant.easy.node import Node
 from openant.easy.channel import Channel
 from openant.devices import ANTPLUS_NETWORK_KEY
 
+from modules import metrics
 
-class AntHrvSensor:
+HR_PERIOD = 8070 # Channel period in 1/32768 s (~4.06 Hz)
+HR_DEVICE_TYPE = 120
+PIN_TIMEOUT_SECS = 5.0 # Pinned strap silent this long -> fall back to a wildcard search
+CHANNEL_ID_MSG = 0x51 # Request: which device did the wildcard search lock onto
+PACKET_SECS = HR_PERIOD / 32768.0
+RATE_WINDOW_SECS = 10
+LATENCY_BUCKETS_US = (50, 100, 250, 500, 1000, 5000) # Callback time histogram upper bounds
+
+
+class LinkTelemetry:
+    """Radio link counters for the HR channel. Fed from the driver thread, read via snapshot()."""
     def __init__(self):
+        self.lock = threading.Lock()
+        self.first_packet = None
+        self.last_packet = None
+        self.packets = 0
+        self.duplicates = 0 # Same payload as the previous packet (no new beat / page)
+        self.pages = collections.Counter()
+        self.beat_gaps = collections.Counter() # Beat count jump -> occurrences (jumps > 1 only)
+        self.rejected = collections.Counter() # Beat rejection reason -> count
+        self.latency = [0] * (len(LATENCY_BUCKETS_US) + 1)
+        self.recent = collections.deque() # Packet arrival times inside the rate window
+        self.max_gap_secs = 0.0
+        self.signal_lost = 0
+        self.last_payload = None
+        self.search = None # "pinned" / "wildcard" (after a pin timeout)
+        self.first_beat_secs = None # start() -> first valid beat
+
+    def packet(self, now, page, payload):
+        with self.lock:
+            if self.first_packet is None: self.first_packet = now
+            if self.last_packet is not None: self.max_gap_secs = max(self.max_gap_secs, now - self.last_packet)
+            self.last_packet = now
+            self.packets += 1
+            self.pages[page] += 1
+            if payload == self.last_payload: self.duplicates += 1
+            self.last_payload = payload
+            self.recent.append(now)
+            while self.recent[0] < now - RATE_WINDOW_SECS: self.recent.popleft()
+
+    def beat_gap(self, gap):
+        with self.lock: self.beat_gaps[gap] += 1
+
+    def reject(self, reason):
+        with self.lock: self.rejected[reason] += 1
+
+    def callback_time(self, secs):
+        us = secs * 1e6
+        i = next((i for i, bound in enumerate(LATENCY_BUCKETS_US) if us <= bound), len(LATENCY_BUCKETS_US))
+        with self.lock: self.latency[i] += 1
+
+    def lost(self):
+        with self.lock: self.signal_lost += 1
+
+    def acquired(self, secs):
+        with self.lock: self.first_beat_secs = round(secs, 2)
+
+    def snapshot(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            elapsed = (self.last_packet - self.first_packet) if self.packets else 0.0
+            expected = int(elapsed / PACKET_SECS) + 1 if self.packets else 0
+            window = min(RATE_WINDOW_SECS, now - self.first_packet) if self.packets else 0.0
+            recent = sum(1 for t in self.recent if t >= now - RATE_WINDOW_SECS)
+            expected_recent = window / PACKET_SECS
+            bounds = [f"<={b}us" for b in LATENCY_BUCKETS_US] + [f">{LATENCY_BUCKETS_US[-1]}us"]
+            return {
+                'packets': self.packets,
+                'expected': expected,
+                'loss_pct': round(100.0 * (1 - self.packets / expected), 1) if expected else 0.0,
+                'packets_per_sec': round(recent / window, 2) if window > 0 else 0.0,
+                'recent_loss_pct': round(max(0.0, 100.0 * (1 - recent / expected_recent)), 1) if expected_recent >= 1 else 0.0,
+                'duplicate_pct': round(100.0 * self.duplicates / self.packets, 1) if self.packets else 0.0,
+                'pages': dict(sorted(self.pages.items())),
+                'beat_gaps': dict(sorted(self.beat_gaps.items())),
+                'rejected': dict(self.rejected),
+                'callback_us': dict(zip(bounds, self.latency)),
+                'max_gap_secs': round(self.max_gap_secs, 2),
+                'since_last_secs': round(now - self.last_packet, 2) if self.last_packet else None,
+                'signal_lost': self.signal_lost,
+                'search': self.search,
+                'first_beat_secs': self.first_beat_secs
+            }
+
+
+class AntHrvSensor:
+    def __init__(self, pin=None):
         self.running = False
         self.status = "Initializing"
 
@@ -30,17 +116,33 @@ class AntHrvSensor:
         self.battery_status = "Unknown"
         self.operating_time_hours = 0.0
 
+        # --- CHANNEL ID ---
+        # pin: device_registry entry for the expected strap (device_number, transmission_type)
+        self.pin = pin if pin and pin.get('device_number') and pin.get('transmission_type') is not None else None
+        self.device_number = None
+        self.transmission_type = None
+        self.identifying = False
+        self.started_at = None
+
         # --- INTERNAL BUFFERS ---
         self.rr_buffer = collections.deque(maxlen=30)
         self.filter_buffer = collections.deque(maxlen=5)
         self.consecutive_rejections = 0
 
+        # --- BEAT RECONSTRUCTION (missed packets) ---
+        self.beats_recovered = 0    # Exact RR intervals rebuilt across a packet gap
+        self.beats_interpolated = 0 # Estimated evenly across a gap (HR only, not HRV)
+        self.beats_lost = 0         # Gaps too long / implausible to rebuild
+
+        self.telemetry = LinkTelemetry()
+        self.on_packet = None # Called (driver thread) after each HR packet is decoded
+
         self.node = None
         self.channel_hr = None
         self.channel_run = None
         self.thread = None
 
-        self.last_beat_time = None
+        self.last_beat_ticks = None # 1/1024 s, rolls over every 64 s
         self.last_beat_count = None
         self.last_hr_data_time = time.time()
 
@@ -64,6 +166,7 @@ class AntHrvSensor:
 
     def start(self):
         if self.running: return
+        self.started_at = time.time()
         
         try:
             # Pre-emptively clear kernel driver lock if present
@@ -112,6 +215,8 @@ class AntHrvSensor:
         if (time.time() - self.last_hr_data_time) > 4.0 and self.status == "Active":
             self.status = "Signal Lost"
             self.bpm = 0
+            self.telemetry.lost()
+            metrics.inc("sensor.signal_lost")
 
         # Manufacturer Name
         manuf = "Unknown"
@@ -135,18 +240,35 @@ class AntHrvSensor:
             'serial': self.serial_number,
             'battery_volts': self.battery_voltage,
             'battery_state': self.battery_status,
-            'uptime_hours': self.operating_time_hours
+            'uptime_hours': self.operating_time_hours,
+            'beats_recovered': self.beats_recovered,
+            'beats_interpolated': self.beats_interpolated,
+            'beats_lost': self.beats_lost,
+            'device_number': self.device_number,
+            'transmission_type': self.transmission_type
         }
 
+    def get_telemetry(self):
+        """Link quality snapshot (packet rates / loss, beat gaps, rejections, callback time)."""
+        return self.telemetry.snapshot()
+
     # --- CHANNEL 0: HEART RATE MONITOR ---
     def _on_hr_data(self, data):
-        self.last_hr_data_time = time.time()
+        t_start = time.perf_counter()
+        now = time.time()
+        if now - self.last_hr_data_time > 60: self.last_beat_ticks = None # Beat time/count have wrapped
+        self.last_hr_data_time = now
         # Capture Raw Hex for Debugging/CSV
         try:
              self.last_raw_hex = "".join([f"{x:02X}" for x in data])
         except: self.last_raw_hex = ""
         
         page = data[0] & 0x7F
+        self.telemetry.packet(now, page, bytes(data))
+        if self.device_number is None and not self.identifying:
+            # Can't block the node's callback thread waiting for the reply
+            self.identifying = True
+            threading.Thread(target=self._identify_device, name="ant-channel-id", daemon=True).start()
 
         # 1. Parse Metadata Pages
         if page == 7:  # Battery
@@ -170,39 +292,80 @@ class AntHrvSensor:
 
         # 3. Parse RR Intervals
         beat_count = data[6]
-        beat_time_raw = (data[5] << 8) | data[4]
-        beat_time = beat_time_raw / 1024.0
-
-        if self.last_beat_time is not None:
-            if beat_time < self.last_beat_time: beat_time += 64.0
+        beat_ticks = (data[5] << 8) | data[4]
+        prev_ticks = ((data[3] << 8) | data[2]) if page == 4 else None # Previous beat event time
 
-            if beat_count != self.last_beat_count:
-                delta = beat_time - self.last_beat_time
-                self.raw_rr_ms = int(delta * 1000)
+        if self.last_beat_ticks is not None and beat_count != self.last_beat_count:
+            intervals = self._reconstruct_beats(beat_count, beat_ticks, prev_ticks)
+            gap = len(intervals) > 1
+            if gap: self.telemetry.beat_gap(len(intervals))
+            for ticks, exact in intervals:
+                rr_sec = ticks / 1024.0
+                self.raw_rr_ms = int(rr_sec * 1000)
 
-                # Filter dropped packets
-                if delta > 1.5:
-                    self.filter_buffer.clear()
-                    self.last_beat_time = beat_time_raw / 1024.0
-                    self.last_beat_count = beat_count
-                    return
+                if not exact:
+                    # Estimated beats keep HR continuity but would fake the beat-to-beat
+                    # variation, so they only break the RR sequence for RMSSD
+                    if 0.27 <= rr_sec <= 1.5:
+                        self.beats_interpolated += 1
+                    else:
+                        self.beats_lost += 1
+                        self.telemetry.reject("unrecoverable_gap")
+                        self.filter_buffer.clear()
+                    self.rr_buffer.append(None)
+                    continue
 
-                if self._is_valid_beat(delta):
+                if self._is_valid_beat(rr_sec):
+                    metrics.inc("sensor.beats")
+                    if gap: self.beats_recovered += 1
                     self.rr_ms = self.raw_rr_ms
                     self.rr_buffer.append(self.rr_ms)
-                    self.filter_buffer.append(delta)
+                    self.filter_buffer.append(rr_sec)
                     self.rmssd = self._calculate_rmssd_safe()
+                    if self.telemetry.first_beat_secs is None and self.started_at:
+                        self.telemetry.acquired(now - self.started_at)
                     self.status = "Active"
 
-        self.last_beat_time = beat_time_raw / 1024.0
+        self.last_beat_ticks = beat_ticks
         self.last_beat_count = beat_count
+        elapsed = time.perf_counter() - t_start
+        self.telemetry.callback_time(elapsed)
+        metrics.inc("sensor.packets")
+        metrics.observe("sensor.callback_ms", elapsed * 1000)
+        if self.on_packet: self.on_packet(self)
+
+    def _reconstruct_beats(self, beat_count, beat_ticks, prev_ticks=None):
+        """
+        RR intervals (ticks, exact) that ended since the last packet, oldest first.
+        A beat count jump of n means n intervals ended across the gap. Page 4's previous
+        beat time splits off the newest one exactly (and the one before it too if n == 2);
+        whatever is left is spread evenly over the missing beats.
+        """
+        gap = (beat_count - self.last_beat_count) & 0xFF
+        span = (beat_ticks - self.last_beat_ticks) & 0xFFFF
+        if gap == 1: return [(span, True)]
+
+        tail = []
+        if prev_ticks is not None:
+            newest = (beat_ticks - prev_ticks) & 0xFFFF
+            if 0 < newest < span:
+                tail = [(newest, True)]
+                span -= newest
+                gap -= 1
+        if gap == 1: return [(span, True)] + tail
+        return [(span / gap, False)] * gap + tail
 
     def _is_valid_beat(self, rr_sec):
-        if rr_sec < 0.27 or rr_sec > 1.5: return False
+        if rr_sec < 0.27 or rr_sec > 1.5:
+            self.telemetry.reject("too_short" if rr_sec < 0.27 else "too_long")
+            metrics.inc("sensor.beats_rejected")
+            return False
         if len(self.filter_buffer) > 0:
             avg = sum(self.filter_buffer) / len(self.filter_buffer)
             if abs(rr_sec - avg) > (avg * 0.3):
                 self.consecutive_rejections += 1
+                self.telemetry.reject("outlier")
+                metrics.inc("sensor.beats_rejected")
                 return False
         self.consecutive_rejections = 0
         return True
@@ -210,24 +373,61 @@ class AntHrvSensor:
     def _calculate_rmssd_safe(self):
         if len(self.rr_buffer) < 2: return 0.0
         try:
-            diffs = [self.rr_buffer[i] - self.rr_buffer[i - 1] for i in range(1, len(self.rr_buffer))]
+            # Only successive pairs of real beats (None marks a missed / estimated beat)
+            diffs = [b - a for a, b in zip(self.rr_buffer, list(self.rr_buffer)[1:]) if a is not None and b is not None]
+            if not diffs: return self.rmssd
             sq_diffs = [d * d for d in diffs]
             return math.sqrt(sum(sq_diffs) / len(sq_diffs))
         except:
             return 0.0
 
+    def _set_channel_id(self, pin):
+        if pin:
+            self.channel_hr.set_id(pin['device_number'], HR_DEVICE_TYPE, pin['transmission_type'])
+            self.telemetry.search = "pinned"
+        else:
+            self.channel_hr.set_id(0, 0, 0)  # Wildcard HR
+            self.telemetry.search = "wildcard"
+
+    def _pin_timeout(self):
+        # The remembered strap never showed up (new strap / borrowed one): search for any
+        if not self.running or self.telemetry.packets or not self.channel_hr: return
+        try:
+            self.channel_hr.close()
+            self._set_channel_id(None)
+            self.channel_hr.open()
+        except Exception as e:
+            self.status = f"Error: {e}"
+
+    def _identify_device(self):
+        # Worker thread: asks the stick for the channel ID it is now receiving
+        if self.pin and self.telemetry.search == "pinned":
+            self.device_number, self.transmission_type = self.pin['device_number'], self.pin['transmission_type']
+            return
+        try:
+            reply = self.channel_hr.request_message(CHANNEL_ID_MSG)
+            data = reply[2] if isinstance(reply, tuple) else reply # (channel, message id, [num lo, num hi, type, trans])
+            self.device_number = data[0] | (data[1] << 8)
+            self.transmission_type = data[3]
+        except Exception:
+            self.identifying = False # Ask again on the next packet
+
     def _run_loop(self):
         try:
             # self.node check is done in start()
             
-            # --- CHANNEL 0: HEART RATE (Wildcard) ---
+            # --- CHANNEL 0: HEART RATE (pinned to the registered strap, else wildcard) ---
             self.channel_hr = self.node.new_channel(Channel.Type.BIDIRECTIONAL_RECEIVE)
             self.channel_hr.on_broadcast_data = self._on_hr_data
             self.channel_hr.on_burst_data = self._on_hr_data
-            self.channel_hr.set_id(0, 0, 0)  # Wildcard HR
+            self._set_channel_id(self.pin)
             self.channel_hr.set_rf_freq(57)
-            self.channel_hr.set_period(8070)
+            self.channel_hr.set_period(HR_PERIOD)
             self.channel_hr.open()
+            if self.pin:
+                timer = threading.Timer(PIN_TIMEOUT_SECS, self._pin_timeout)
+                timer.daemon = True
+                timer.start()
 
             self.node.start()
 
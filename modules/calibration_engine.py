@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import shutil
+import datetime
+from statistics import mean
+
+from modules.ant_user_profile import UserProfile
+
+# UI-independent calibration protocol (REST -> STRESS -> EXERTION -> RECOVERY).
+# The Tk CalibrationWizard and the headless runner feed it one sensor reading a second.
+
+PHASES = ["REST", "STRESS", "EXERTION", "RECOVERY"]
+PHASE_DURATIONS = {
+    "REST": 60,
+    "STRESS": 60,
+    "EXERTION": 45,
+    "RECOVERY": 60
+}
+PROFILE_DIR = "ant_user_profiles"
+BACKUP_DIR = "ant_user_profiles/backups"
+
+
+class CalibrationEngine:
+    def __init__(self, user_name, dob="", age=30):
+        self.user_name = user_name
+        self.user_dob = dob
+        self.user_age = age
+        self.phase = PHASES[0]
+        self.phase_data_hr = []
+        self.phase_data_rmssd = []
+        self.results = {p.lower(): {} for p in PHASES}
+
+    @property
+    def finished(self):
+        return self.phase == "FINISHED"
+
+    def duration(self):
+        return PHASE_DURATIONS[self.phase]
+
+    def begin_phase(self):
+        self.phase_data_hr = []
+        self.phase_data_rmssd = []
+
+    def sample(self, data):
+        if data.get('bpm', 0) > 0:
+            self.phase_data_hr.append(data['bpm'])
+            self.phase_data_rmssd.append(data.get('rmssd', 0))
+
+    def finish_phase(self):
+        """Stores the phase averages and moves on. Returns the next phase, or None when done."""
+        if self.phase_data_hr:
+            avg_hr, max_hr = mean(self.phase_data_hr), max(self.phase_data_hr)
+            avg_rmssd, peak_rmssd = mean(self.phase_data_rmssd), max(self.phase_data_rmssd)
+        else:
+            avg_hr, max_hr, avg_rmssd, peak_rmssd = 0, 0, 0, 0
+
+        self.results[self.phase.lower()] = {
+            "avg_hr": avg_hr, "max_hr": max_hr,
+            "avg_rmssd": avg_rmssd, "peak_rmssd": peak_rmssd
+        }
+
+        curr_idx = PHASES.index(self.phase)
+        self.phase = PHASES[curr_idx + 1] if curr_idx < len(PHASES) - 1 else "FINISHED"
+        return None if self.finished else self.phase
+
+    def build_profile(self):
+        """(UserProfile, current_stats dict) from the recorded phases."""
+        profile = UserProfile(self.user_name)
+        profile.calibrate(self.results['rest'], self.results['stress'], self.results['recovery'])
+
+        age_max = 220 - self.user_age
+        measured_max = self.results['exertion']['max_hr']
+        profile.max_hr = max(age_max, measured_max)
+
+        new_stats = {
+            "date": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "resting_hr": round(profile.resting_hr, 1),
+            "baseline_rmssd": round(profile.baseline_rmssd, 3),
+            "stress_hr_threshold": round(profile.stress_hr_threshold, 1),
+            "recovery_score": round(profile.recovery_score, 1),
+            "max_hr": int(profile.max_hr),
+            "raw_results": self.results
+        }
+        return profile, new_stats
+
+    def save_profile(self, filename, profile_dir=PROFILE_DIR, backup_dir=BACKUP_DIR):
+        """Writes the new calibration to profile_dir/filename (old file backed up, its
+           current_stats moved to history). Returns the UserProfile."""
+        profile, new_stats = self.build_profile()
+        full_path = os.path.join(profile_dir, filename)
+
+        final_data = {
+            "name": self.user_name,
+            "dob": self.user_dob,
+            "age": self.user_age,
+            "current_stats": new_stats,
+            "history": []
+        }
+
+        if os.path.exists(full_path):
+            backup_name = f"{filename}.{int(time.time())}.bak"
+            if not os.path.exists(backup_dir): os.makedirs(backup_dir)
+            try: shutil.copy(full_path, os.path.join(backup_dir, backup_name))
+            except: pass
+
+            try:
+                with open(full_path, 'r') as f: old_data = json.load(f)
+                if "history" in old_data: final_data["history"] = old_data["history"]
+                if "current_stats" in old_data: final_data["history"].append(old_data["current_stats"])
+            except: pass
+
+        with open(full_path, 'w') as f:
+            json.dump(final_data, f, indent=4)
+        return profile
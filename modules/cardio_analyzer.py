@@ -0,0 +1,115 @@
+import time
+
+# HR Zones as fraction of the user's true max HR (lower bound, label)
+HR_ZONES = [
+    (0.9, "Z5"),
+    (0.8, "Z4"),
+    (0.7, "Z3"),
+    (0.6, "Z2"),
+    (0.5, "Z1"),
+    (0.0, "Z0")
+]
+
+DRIFT_WARMUP_SECS = 60  # Ignore the initial ramp-up when fitting cardiac drift
+MAX_SAMPLE_GAP = 5.0    # Don't credit zone time across sensor dropouts
+HRR_CHECKPOINTS = (30, 60)
+HRR_TIMEOUT_SECS = 90   # Give up waiting for post-exercise samples after this
+
+
+class CardioAnalyzer:
+    """
+    Streaming Exercise 5 analysis: time-in-zone, cardiac drift and heart rate recovery.
+    Every sample is an O(1) update - drift is fitted from running least-squares sums
+    and nothing is buffered.
+    """
+    def __init__(self, max_hr, mode="Standard"):
+        self.max_hr = max_hr or 180
+        self.mode = mode
+        self.phase = "EXERCISE" # EXERCISE -> RECOVERY -> DONE
+
+        self.start_time = None
+        self.last_time = None
+        self.zone_secs = {label: 0.0 for _, label in HR_ZONES}
+
+        # Linear regression sums for HR vs time (minutes) after warm-up
+        self.n = 0
+        self.sum_t = 0.0
+        self.sum_hr = 0.0
+        self.sum_tt = 0.0
+        self.sum_thr = 0.0
+
+        self.peak_hr = 0
+        self.end_hr = 0
+        self.end_time = None
+        self.hrr = {}
+
+    def get_zone(self, hr):
+        pct = hr / float(self.max_hr)
+        for lower, label in HR_ZONES:
+            if pct >= lower: return label
+        return "Z0"
+
+    def add_sample(self, hr, now=None):
+        if self.phase != "EXERCISE" or hr <= 0: return
+        if now is None: now = time.time()
+
+        if self.start_time is None:
+            self.start_time = now
+        elif self.last_time is not None:
+            dt = now - self.last_time
+            if 0 < dt <= MAX_SAMPLE_GAP:
+                self.zone_secs[self.get_zone(hr)] += dt
+        self.last_time = now
+        self.peak_hr = max(self.peak_hr, hr)
+        self.end_hr = hr
+
+        elapsed = now - self.start_time
+        if elapsed >= DRIFT_WARMUP_SECS:
+            t = elapsed / 60.0
+            self.n += 1
+            self.sum_t += t
+            self.sum_hr += hr
+            self.sum_tt += t * t
+            self.sum_thr += t * hr
+
+    def end_exercise(self, now=None):
+        """Marks the end of Ex 5. HRR is measured relative to the HR at this instant."""
+        if self.phase != "EXERCISE": return
+        self.end_time = now if now is not None else time.time()
+        self.phase = "RECOVERY" if self.end_hr > 0 else "DONE"
+
+    def add_recovery_sample(self, hr, now=None):
+        """Feed post-exercise samples. Returns True once all HRR checkpoints are captured."""
+        if self.phase != "RECOVERY": return self.phase == "DONE"
+        if now is None: now = time.time()
+        elapsed = now - self.end_time
+
+        if hr > 0:
+            for cp in HRR_CHECKPOINTS:
+                if cp not in self.hrr and elapsed >= cp:
+                    self.hrr[cp] = self.end_hr - hr
+
+        if len(self.hrr) == len(HRR_CHECKPOINTS) or elapsed >= HRR_TIMEOUT_SECS:
+            self.phase = "DONE"
+        return self.phase == "DONE"
+
+    def drift_slope(self):
+        """HR slope in bpm/min after warm-up (positive = drifting up)."""
+        if self.n < 2: return None
+        denom = (self.n * self.sum_tt) - (self.sum_t ** 2)
+        if denom == 0: return None
+        return ((self.n * self.sum_thr) - (self.sum_t * self.sum_hr)) / denom
+
+    def summary(self):
+        if self.start_time is None: return None
+        slope = self.drift_slope()
+        return {
+            "mode": self.mode,
+            "duration_secs": int((self.last_time or self.start_time) - self.start_time),
+            "peak_hr": self.peak_hr,
+            "end_hr": self.end_hr,
+            "zone_secs": {k: int(round(v)) for k, v in self.zone_secs.items() if v > 0},
+            "drift_bpm_min": round(slope, 2) if slope is not None else None,
+            "hrr_30": self.hrr.get(30),
+            "hrr_60": self.hrr.get(60)
+        }
@@ -0,0 +1,44 @@
+import os
+import json
+import datetime
+
+# Remembers which HR strap each user wears (ANT channel ID + page 2 manufacturer / serial),
+# so the driver can open a channel pinned to that strap instead of a wildcard search.
+# "_last" is the most recently seen strap, used before anyone is logged in.
+
+REGISTRY_FILE = "ant_user_profiles/device_registry.json"
+LAST_KEY = "_last"
+
+
+def load(path=REGISTRY_FILE):
+    try:
+        with open(path, 'r') as f: return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def lookup(user_name=None, path=REGISTRY_FILE):
+    """Pin dict (device_number, transmission_type, ...) for user_name, else the last strap seen."""
+    registry = load(path)
+    return registry.get(user_name) or registry.get(LAST_KEY)
+
+
+def remember(user_name, data, path=REGISTRY_FILE):
+    """Stores the strap from a sensor get_data() dict. Returns False if it isn't identified yet."""
+    if not data.get('device_number'): return False
+    entry = {
+        "device_number": data['device_number'],
+        "transmission_type": data.get('transmission_type'),
+        "manufacturer": data.get('manufacturer'),
+        "serial": data.get('serial'),
+        "last_seen": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    registry = load(path)
+    keys = [LAST_KEY] + ([user_name] if user_name else [])
+    if all({**registry.get(k, {}), "last_seen": None} == {**entry, "last_seen": None} for k in keys): return True
+    for k in keys: registry[k] = entry
+
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f: json.dump(registry, f, indent=4)
+    os.replace(tmp, path)
+    return True
@@ -0,0 +1,114 @@
+import json
+import collections
+
+# Per-exercise slots: 0-4 = the five exercises, 5 = Ex 5 as a timed Run, 6 = timed Walk
+RUN_IDX = 5
+WALK_IDX = 6
+POPUP_POINTS = 20 # History popup shows the most recent N sessions
+
+# One session's contribution to one exercise slot. seg_hr/seg_hrv are None when the
+# session has no per-segment stats for that exercise.
+Point = collections.namedtuple("Point", "history_id timestamp value avg_hr seg_hr seg_hrv ex5_type")
+
+
+def _segments(stats_json):
+    if not stats_json: return []
+    try:
+        data = json.loads(stats_json)
+    except (TypeError, ValueError):
+        return []
+    if isinstance(data, dict): data = data.get('segments', [])
+    return data if isinstance(data, list) else []
+
+
+def row_points(row):
+    """
+    Splits a history row into {(chart, idx): Point}. The segment_stats JSON is parsed
+    here, once per row, instead of on every graph draw.
+    """
+    raw_chart = str(row['chart'])
+    s_chart = c_chart = raw_chart
+    if "/" in raw_chart:
+        parts = raw_chart.split("/")
+        if len(parts) >= 2: s_chart, c_chart = parts[0], parts[1]
+
+    reps_list = [0] * 5
+    if row['ex1']: reps_list = [row['ex1'], row['ex2'], row['ex3'], row['ex4'], row['ex5']]
+    e_type = row.get('ex5_type') or ""
+    e_dur = row.get('ex5_duration') or 0
+    segments = _segments(row.get('segment_stats'))
+
+    points = {}
+    for idx in range(7):
+        if idx < 5: value = reps_list[idx]
+        elif idx == RUN_IDX: value = e_dur if "Run" in e_type else 0
+        else: value = e_dur if "Walk" in e_type else 0
+        if not value or value <= 0: continue
+
+        seg_idx = min(idx, 4) # Run/Walk stats live in the Ex 5 slot
+        seg_hr = seg_hrv = None
+        if seg_idx < len(segments):
+            item = segments[seg_idx]
+            try:
+                seg_hr, seg_hrv = item.get('max_hr', 0), item.get('hrv', 0)
+            except AttributeError: pass
+
+        chart = s_chart if idx < 4 else c_chart
+        points[(chart, idx)] = Point(row['id'], row['timestamp'], value, row.get('avg_hr'), seg_hr, seg_hrv, e_type)
+    return points
+
+
+class ExerciseSeriesCache:
+    """
+    Per-exercise time series for one user, keyed by (chart, exercise idx) and kept in
+    history id order. Built once from the full history, then kept current with
+    add_row() / remove() so drawing a graph never rescans or re-parses the history.
+    """
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.series = collections.defaultdict(list) # (chart, idx) -> [Point] (oldest first)
+        self.keys_by_id = {}                         # history_id -> [(chart, idx)]
+
+    def load(self, rows):
+        for row in sorted(rows, key=lambda r: r['id']): self.add_row(row)
+        return self
+
+    def add_row(self, row):
+        if row['id'] in self.keys_by_id: self.remove(row['id'])
+        points = row_points(row)
+        for key, point in points.items():
+            series = self.series[key]
+            if series and series[-1].history_id > point.history_id:
+                # Out-of-order insert (only on load of odd data)
+                series.append(point)
+                series.sort(key=lambda p: p.history_id)
+            else:
+                series.append(point)
+        self.keys_by_id[row['id']] = list(points)
+
+    def remove(self, history_id):
+        for key in self.keys_by_id.pop(history_id, []):
+            self.series[key] = [p for p in self.series[key] if p.history_id != history_id]
+
+    # --- VIEWS ---
+    def pane_series(self, chart, idx):
+        """Chart viewer graph: every session (dates, values, max_hr, hrv), oldest first."""
+        dates, values, hrs, hrvs = [], [], [], []
+        for p in self.series.get((str(chart), idx), []):
+            # Stationary Ex 5 graph excludes timed runs/walks; the Run graph excludes stationary runs
+            if idx == 4 and p.ex5_type and ("Run" in p.ex5_type or "Walk" in p.ex5_type) and "Stationary" not in p.ex5_type: continue
+            if idx == RUN_IDX and "Stationary" in p.ex5_type: continue
+            dates.append(p.timestamp[:10])
+            values.append(p.value)
+            hrs.append(p.seg_hr if p.seg_hr is not None else 0)
+            hrvs.append(p.seg_hrv if p.seg_hrv is not None else 0)
+        return dates, values, hrs, hrvs
+
+    def popup_series(self, chart, idx, limit=POPUP_POINTS):
+        """History popup: last `limit` sessions (MM-DD dates, values, HR, hrv), oldest first."""
+        points = self.series.get((str(chart), idx), [])[-limit:]
+        dates = [p.timestamp.split(" ")[0][5:] for p in points]
+        values = [p.value for p in points]
+        hrs = [p.seg_hr if p.seg_hr is not None else p.avg_hr for p in points]
+        hrvs = [p.seg_hrv if p.seg_hrv is not None else 0 for p in points]
+        return dates, values, hrs, hrvs
@@ -49,6 +49,24 @@ def get_age_goal(age):
 def get_total_score(chart, level):
     return (int(chart) * 12) + int(level)
 
+def split_component(raw):
+    """
+    Splits a combined history field into (strength, cardio).
+    Handles "3/2", "3 | 2" and legacy single values ("3" -> ("3", "3")).
+    """
+    raw = str(raw)
+    for sep in (" | ", "/"):
+        if sep in raw:
+            parts = raw.split(sep)
+            if len(parts) >= 2: return parts[0].strip(), parts[1].strip()
+    return raw, raw
+
+def get_elite_goal(age):
+    for (min_a, max_a), target in ELITE_TARGETS.items():
+        if min_a <= age <= max_a:
+            return target
+    return None
+
 BADGE_DIR = os.path.join("images", "badges")
 
 def get_badge_image_path(is_elite, min_a, max_a):
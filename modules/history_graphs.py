@@ -0,0 +1,154 @@
+import tkinter as tk
+import matplotlib
+matplotlib.use("TkAgg")
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.ticker import MaxNLocator, FuncFormatter
+
+MAX_MARKERS = 60 # Long histories only mark every Nth point (markers dominate draw time)
+
+# Reusable exercise history graphs. Each graph type owns ONE Figure whose axes and
+# lines are created once; showing another exercise only swaps the line data
+# (set_data) and titles. Lines are plotted against the point index with the dates as
+# tick labels, so the category axis never accumulates stale dates.
+
+
+class _DateAxis:
+    """Index -> date tick labels for the current series."""
+    def __init__(self):
+        self.dates = []
+
+    def label(self, x, pos=None):
+        i = int(round(x))
+        return self.dates[i] if 0 <= i < len(self.dates) and abs(x - i) < 1e-6 else ""
+
+
+class ExerciseGraph:
+    def __init__(self):
+        self.canvas = None
+        self.master = None
+        self.dates = _DateAxis()
+        self.fig = self._build()
+
+    def _build(self):
+        raise NotImplementedError
+
+    def attach(self, master):
+        """(Re)parents the figure into master. Returns True when a new canvas had to be made."""
+        if self.canvas is not None and self.master is master and self.canvas.get_tk_widget().winfo_exists():
+            return False
+        self.master = master
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        return True
+
+    def _date_axis(self, ax):
+        ax.xaxis.set_major_locator(MaxNLocator(nbins=8, integer=True))
+        ax.xaxis.set_major_formatter(FuncFormatter(self.dates.label))
+
+    @staticmethod
+    def _rescale(ax, n):
+        ax.relim()
+        if n: ax.autoscale_view()
+        else: ax.set_ylim(0, 1) # relim() on empty lines keeps the previous exercise's range
+        ax.set_xlim(-0.5, max(n - 0.5, 0.5))
+
+    def _set_lines(self, lines, values):
+        xs = range(len(self.dates.dates))
+        every = max(1, len(xs) // MAX_MARKERS)
+        for line, ys in zip(lines, values):
+            line.set_data(xs, ys)
+            line.set_markevery(every)
+
+    def draw(self):
+        self.canvas.draw_idle()
+
+
+class PaneGraph(ExerciseGraph):
+    """Chart viewer strip: reps/time (left), max HR + HRV (right)."""
+    def _build(self):
+        fig = Figure(figsize=(10, 3), dpi=90, facecolor="#34495e") # Shorter height
+
+        # Ax1: Reps
+        self.ax1 = fig.add_subplot(121)
+        self.ax1.set_facecolor("#2c3e50")
+        self.line_reps, = self.ax1.plot([], [], marker='o', color='#2ecc71', linewidth=2, label="Score")
+        self.ax1.tick_params(axis='x', colors='white', labelsize=8, rotation=45)
+        self.ax1.tick_params(axis='y', colors='white')
+        self.ax1.grid(color='#7f8c8d', linestyle='--', linewidth=0.5)
+
+        # Ax2: HR / HRV
+        self.ax2 = fig.add_subplot(122)
+        self.ax2.set_facecolor("#2c3e50")
+        self.line_hr, = self.ax2.plot([], [], marker='s', color='#e74c3c', linewidth=2, label="Max HR")
+        self.ax2.set_title("Physiological Cost (HR & HRV)", color="white", fontsize=10)
+
+        self.ax2_b = self.ax2.twinx()
+        self.line_hrv, = self.ax2_b.plot([], [], marker='^', color='#f1c40f', linestyle='--', linewidth=1.5, label="HRV")
+
+        self.ax2.tick_params(axis='x', colors='white', labelsize=8, rotation=45)
+        self.ax2.tick_params(axis='y', colors='#e74c3c')
+        self.ax2_b.tick_params(axis='y', colors='#f1c40f')
+
+        # Combined Legend
+        self.ax2.legend([self.line_hr, self.line_hrv], ["Max HR", "HRV"], loc='upper left', fontsize=8)
+
+        for ax in (self.ax1, self.ax2): self._date_axis(ax)
+        return fig
+
+    def show(self, master, idx, series):
+        dates, reps, hrs, hrvs = series
+        self.dates.dates = dates
+        self._set_lines((self.line_reps, self.line_hr, self.line_hrv), (reps, hrs, hrvs))
+        self.ax1.set_title("Time (Seconds)" if idx >= 5 else "Reps Progress", color="white", fontsize=10)
+        for ax in (self.ax1, self.ax2, self.ax2_b): self._rescale(ax, len(dates))
+
+        if self.attach(master): self.fig.tight_layout() # Layout once per canvas, not per exercise
+        self.draw()
+
+
+class PopupGraph(ExerciseGraph):
+    """History popup: score (top), HR + HRV (bottom)."""
+    def _build(self):
+        fig = Figure(figsize=(8, 6), dpi=100, facecolor="#2c3e50")
+        fig.subplots_adjust(hspace=0.4) # spacing
+
+        # Subplot 1: Reps
+        self.ax1 = fig.add_subplot(211)
+        self.ax1.set_facecolor("#34495e")
+        self.line_reps, = self.ax1.plot([], [], marker='o', color='#2ecc71', linewidth=2, label="Score")
+        self.ax1.tick_params(colors='white', rotation=45)
+        self.ax1.grid(True, alpha=0.3)
+        self.ax1.legend()
+
+        # Subplot 2: Bio
+        self.ax2 = fig.add_subplot(212)
+        self.ax2.set_facecolor("#34495e")
+        self.line_hr, = self.ax2.plot([], [], marker='s', color='#ff5555', linestyle='--', label="Avg HR")
+
+        # HRV axis is hidden when the series has no HRV data
+        self.ax2_2 = self.ax2.twinx()
+        self.line_hrv, = self.ax2_2.plot([], [], marker='^', color='#f1c40f', linestyle=':', label="HRV (ms)")
+        self.ax2_2.tick_params(colors='#f1c40f')
+        self.ax2_2.spines['right'].set_color('#f1c40f')
+
+        self.ax2.set_title("Physiological Cost", color="white")
+        self.ax2.tick_params(colors='white', rotation=45)
+        self.ax2.grid(True, alpha=0.3)
+        self.ax2.legend(loc='upper left')
+
+        for ax in (self.ax1, self.ax2): self._date_axis(ax)
+        return fig
+
+    def show(self, master, title, idx, series):
+        dates, reps, hrs, hrvs = series
+        self.dates.dates = dates
+        self._set_lines((self.line_reps, self.line_hr, self.line_hrv), (reps, hrs, hrvs))
+        self.ax2_2.set_visible(any(h > 0 for h in hrvs))
+
+        y_label = "Time (Seconds)" if idx >= 5 else "Reps Count"
+        self.ax1.set_title(f"{y_label}: {title}", color="white")
+        for ax in (self.ax1, self.ax2, self.ax2_2): self._rescale(ax, len(dates))
+
+        self.attach(master)
+        self.draw()
@@ -0,0 +1,179 @@
+import os
+import re
+import math
+import sqlite3
+import collections
+
+INDEX_DB = "databases/manual_index.db"
+INSTRUCTIONS_SOURCE = "instructions" # Pseudo-source for the exercises.db3 Instructions table
+TITLE_WEIGHT = 5.0
+
+HEADING_RE = re.compile(r'^(#{1,4}) (.*)$')
+LINK_RE = re.compile(r'!?\[([^\]]*)\]\([^)]*\)')
+WORD_RE = re.compile(r'[a-z0-9]+')
+
+
+def _tokens(text):
+    return WORD_RE.findall(text.lower())
+
+
+def _clean(text):
+    """Markdown -> plain searchable text."""
+    text = LINK_RE.sub(r'\1', text)
+    return re.sub(r'[*|>#`]', ' ', text)
+
+
+def split_sections(content):
+    """
+    Splits a manual page into (anchor, heading, body) sections. anchor is the ordinal of the
+    heading in the page - ManualViewer marks headings in the same order ("heading_<n>").
+    Text before the first heading is anchor None.
+    """
+    sections = []
+    anchor, heading, body = None, "", []
+    for line in content.split('\n'):
+        stripped = line.strip()
+        match = HEADING_RE.match(stripped) if not stripped.startswith("|") else None
+        if match:
+            if heading or any(b.strip() for b in body):
+                sections.append((anchor, heading, _clean("\n".join(body))))
+            anchor = 0 if anchor is None else anchor + 1
+            heading, body = _clean(match.group(2)).strip(), []
+        else:
+            body.append(stripped)
+    if heading or any(b.strip() for b in body):
+        sections.append((anchor, heading, _clean("\n".join(body))))
+    return sections
+
+
+class ManualIndex:
+    """
+    Search over manual sections and exercise instructions.
+    Uses an SQLite FTS5 table when available, otherwise an in-memory inverted index over
+    the same stored rows. refresh() only re-indexes sources whose mtime changed.
+    """
+    def __init__(self, manual_files, exercises_db=None, index_db=INDEX_DB):
+        self.manual_files = list(manual_files)
+        self.exercises_db = exercises_db
+        self.conn = sqlite3.connect(index_db)
+        self.use_fts = self._init_schema()
+        self.inverted = None # Fallback: token -> {rowid: (title_tf, body_tf)}
+        self.doc_len = {}
+
+    def _init_schema(self):
+        c = self.conn.cursor()
+        c.execute("CREATE TABLE IF NOT EXISTS sources (path TEXT PRIMARY KEY, mtime INTEGER)")
+        try:
+            c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+                         title, body, source UNINDEXED, anchor UNINDEXED, tokenize='porter unicode61')""")
+            self.conn.commit()
+            return True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5
+            c.execute("CREATE TABLE IF NOT EXISTS docs (title TEXT, body TEXT, source TEXT, anchor INTEGER)")
+            self.conn.commit()
+            return False
+
+    # --- BUILD ---
+    def _source_docs(self, source):
+        if source == INSTRUCTIONS_SOURCE:
+            conn = sqlite3.connect(self.exercises_db)
+            try:
+                rows = conn.execute("SELECT id, chart, exercise, name, instructions FROM Instructions ORDER BY chart, exercise").fetchall()
+            finally:
+                conn.close()
+            return [(f"Chart {chart} Ex {ex}: {name or ''}".strip(), instr or "", row_id) for row_id, chart, ex, name, instr in rows]
+
+        with open(source, 'r') as f: content = f.read()
+        return [(heading, body, anchor) for anchor, heading, body in split_sections(content)]
+
+    def _source_paths(self):
+        paths = {f: f for f in self.manual_files if os.path.exists(f)}
+        if self.exercises_db and os.path.exists(self.exercises_db):
+            paths[INSTRUCTIONS_SOURCE] = self.exercises_db
+        return paths
+
+    def refresh(self):
+        """Re-index changed/new sources, drop removed ones. Returns the number of sources rebuilt."""
+        c = self.conn.cursor()
+        known = dict(c.execute("SELECT path, mtime FROM sources").fetchall())
+        current = self._source_paths()
+        rebuilt = 0
+
+        with self.conn:
+            for source in set(known) - set(current):
+                c.execute("DELETE FROM docs WHERE source=?", (source,))
+                c.execute("DELETE FROM sources WHERE path=?", (source,))
+                rebuilt += 1
+
+            for source, path in current.items():
+                mtime = os.stat(path).st_mtime_ns
+                if known.get(source) == mtime: continue
+                c.execute("DELETE FROM docs WHERE source=?", (source,))
+                c.executemany("INSERT INTO docs (title, body, source, anchor) VALUES (?, ?, ?, ?)",
+                              [(title, body, source, anchor) for title, body, anchor in self._source_docs(source)])
+                c.execute("INSERT OR REPLACE INTO sources (path, mtime) VALUES (?, ?)", (source, mtime))
+                rebuilt += 1
+
+        if rebuilt or (not self.use_fts and self.inverted is None):
+            self.inverted = None
+            if not self.use_fts: self._build_inverted()
+        return rebuilt
+
+    def _build_inverted(self):
+        self.inverted = collections.defaultdict(dict)
+        self.doc_len = {}
+        for rowid, title, body in self.conn.execute("SELECT rowid, title, body FROM docs"):
+            t_counts = collections.Counter(_tokens(title))
+            b_counts = collections.Counter(_tokens(body))
+            self.doc_len[rowid] = sum(b_counts.values()) + 1
+            for tok in set(t_counts) | set(b_counts):
+                self.inverted[tok][rowid] = (t_counts.get(tok, 0), b_counts.get(tok, 0))
+
+    # --- QUERY ---
+    def search(self, query, limit=10):
+        """Ranked hits: [{'source', 'anchor', 'title', 'snippet'}]. Every word must match (prefixes allowed)."""
+        words = _tokens(query)
+        if not words: return []
+        if self.use_fts: return self._search_fts(words, limit)
+        return self._search_inverted(words, limit)
+
+    def _search_fts(self, words, limit):
+        match = " ".join(f'"{w}"*' for w in words)
+        rows = self.conn.execute(f"""SELECT source, anchor, title, snippet(docs, 1, '', '', '…', 10)
+                                     FROM docs WHERE docs MATCH ?
+                                     ORDER BY bm25(docs, {TITLE_WEIGHT}, 1.0) LIMIT ?""", (match, limit)).fetchall()
+        return [{'source': s, 'anchor': a, 'title': t, 'snippet': snip.replace("\n", " ")} for s, a, t, snip in rows]
+
+    def _search_inverted(self, words, limit):
+        if self.inverted is None: self._build_inverted()
+        n_docs = max(1, len(self.doc_len))
+        scores = None
+        for w in words:
+            term_scores = collections.defaultdict(float)
+            for tok, postings in self.inverted.items():
+                if not tok.startswith(w): continue
+                idf = math.log(1 + n_docs / len(postings))
+                for rowid, (t_tf, b_tf) in postings.items():
+                    term_scores[rowid] += idf * (TITLE_WEIGHT * t_tf + b_tf / math.sqrt(self.doc_len[rowid]))
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {r: s + term_scores[r] for r, s in scores.items() if r in term_scores}
+            if not scores: return []
+
+        best = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+        hits = []
+        for rowid, _ in best:
+            source, anchor, title, body = self.conn.execute("SELECT source, anchor, title, body FROM docs WHERE rowid=?", (rowid,)).fetchone()
+            snippet = " ".join(body.split())[:80]
+            hits.append({'source': source, 'anchor': anchor, 'title': title, 'snippet': snippet})
+        return hits
+
+    def get_instruction(self, row_id):
+        """(title, text) for an Instructions hit."""
+        row = self.conn.execute("SELECT title, body FROM docs WHERE source=? AND anchor=?", (INSTRUCTIONS_SOURCE, row_id)).fetchone()
+        return row if row else ("", "")
+
+    def close(self):
+        self.conn.close()
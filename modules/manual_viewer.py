@@ -4,12 +4,146 @@ import os
 import re
 from PIL import Image, ImageTk
 
+from modules.manual_search import INSTRUCTIONS_SOURCE
+from modules.pdf_viewer import PdfViewer
+
+# --- PARSE STAGE (pure, cached) ---
+# A page is parsed once into a flat token list and replayed on every visit:
+#   ("text", chars, tags) | ("link", chars, tags, target) | ("image", path) | ("heading", n)
+# Tables and rules become plain "text" tokens, so a replay is a handful of batched inserts.
+LINK_RE = re.compile(r'(\[[^\]]+\]\([^)]+\))')
+LINK_PARTS_RE = re.compile(r'\[([^\]]+)\]\(([^)]+)\)')
+BOLD_RE = re.compile(r'(\*\*.*?\*\*)')
+ITALIC_RE = re.compile(r'(\*.*?\*)')
+
+_TOKEN_CACHE = {} # abs path -> (mtime_ns, tokens)
+_IMAGE_CACHE = {} # (abs path, mtime_ns) -> resized PIL image (PhotoImages are per window)
+IMAGE_WIDTH = 500
+
+
+def _parse_inline(text, context_tag=None, out=None):
+    """Links first, then **bold** / *italic* on the remaining text."""
+    if out is None: out = []
+    base = (context_tag,) if context_tag else ()
+
+    for p in LINK_RE.split(text):
+        if not p: continue
+        match = LINK_PARTS_RE.match(p)
+        if match:
+            out.append(("link", match.group(1), base + ("link",), match.group(2)))
+            continue
+        for bp in BOLD_RE.split(p):
+            if bp.startswith('**') and bp.endswith('**') and len(bp) > 4:
+                out.append(("text", bp[2:-2], base + ("bold",)))
+                continue
+            for sp in ITALIC_RE.split(bp):
+                if sp.startswith('*') and sp.endswith('*') and len(sp) > 2:
+                    out.append(("text", sp[1:-1], base + ("italic",)))
+                elif sp:
+                    out.append(("text", sp, base))
+    return out
+
+
+def _parse_table(buffer, out):
+    """Markdown table -> fixed-width rows (Courier) with header / alternating row tags."""
+    rows = []
+    for r_idx, l in enumerate(buffer):
+        # | Cell | Cell | -> ['Cell', 'Cell']
+        cells = [c.strip().replace("**", "") for c in l.strip().split('|')]
+        if len(cells) > 0 and cells[0] == '': cells.pop(0)
+        if len(cells) > 0 and cells[-1] == '': cells.pop(-1)
+        # Skip Divider Row (e.g. ---)
+        if all(c.replace('-', '').replace(':', '').strip() == '' for c in cells): continue
+        rows.append((r_idx, cells))
+    if not rows: return
+
+    n_cols = max(len(cells) for _, cells in rows)
+    widths = [max((len(cells[i]) for _, cells in rows if i < len(cells)), default=0) for i in range(n_cols)]
+    for r_idx, cells in rows:
+        padded = [cell.ljust(widths[i]) if i < n_cols - 1 else cell for i, cell in enumerate(cells)]
+        tag = "table_head" if r_idx == 0 else ("table_alt" if r_idx % 2 == 0 else "table_row")
+        out.append(("text", " " + "  │  ".join(padded) + " \n", (tag,)))
+
+
+def parse_markdown(content):
+    tokens = []
+    table_buffer = []
+    newline = ("text", "\n", ())
+    heading_n = 0 # Ordinal used for the "heading_<n>" marks (matches manual_search.split_sections)
+
+    for line in content.split('\n'):
+        stripped = line.strip()
+
+        # Check for Table Line
+        if stripped.startswith("|"):
+            table_buffer.append(stripped)
+            continue
+        elif table_buffer:
+            _parse_table(table_buffer, tokens)
+            table_buffer = []
+
+        # 1. Headers
+        if stripped.startswith('# '):
+            tokens.append(("heading", heading_n)); heading_n += 1
+            _parse_inline(stripped[2:], "h1", tokens); tokens.append(newline)
+        elif stripped.startswith('## '):
+            tokens.append(("heading", heading_n)); heading_n += 1
+            _parse_inline(stripped[3:], "h2", tokens); tokens.append(newline)
+        elif stripped.startswith('### '):
+            tokens.append(("heading", heading_n)); heading_n += 1
+            _parse_inline(stripped[4:], "h3", tokens); tokens.append(newline)
+        elif stripped.startswith('#### '):
+            tokens.append(("heading", heading_n)); heading_n += 1
+            _parse_inline(stripped[5:], "h4", tokens); tokens.append(newline)
+
+        # 2. Blockquotes
+        elif stripped.startswith('> '):
+            _parse_inline(stripped[2:], "quote", tokens); tokens.append(newline)
+
+        # Horizontal Rule (tagged newline - its background spans the widget width)
+        elif stripped.startswith('---') or stripped.startswith('***'):
+            tokens.append(("text", "\n", ("hr",)))
+
+        # 3. Images: ![alt](path)
+        elif stripped.startswith("!["):
+            tokens.append(("image", line[line.find("(") + 1:line.find(")")]))
+
+        # 4. List Items
+        elif stripped.startswith('* ') or stripped.startswith('- '):
+            tokens.append(("text", "  • ", ()))
+            _parse_inline(stripped[2:], None, tokens); tokens.append(newline)
+
+        # 5. Normal Text
+        else:
+            _parse_inline(stripped, None, tokens); tokens.append(newline)
+
+    if table_buffer: _parse_table(table_buffer, tokens)
+    return tokens
+
+
+def load_tokens(path):
+    """Tokens for a page, re-parsed only when the file's mtime changes."""
+    mtime = os.stat(path).st_mtime_ns
+    cached = _TOKEN_CACHE.get(path)
+    if cached and cached[0] == mtime: return cached[1]
+    with open(path, 'r') as f: content = f.read()
+    tokens = parse_markdown(content)
+    _TOKEN_CACHE[path] = (mtime, tokens)
+    return tokens
+
+
 class ManualViewer:
-    def __init__(self, title="Application Manual", geometry="1000x800", bg_color="#2c3e50", pages=None):
+    def __init__(self, title="Application Manual", geometry="1000x800", bg_color="#2c3e50", pages=None, search_index=None):
         self.root = None
         self.doc_text = None
-        self.doc_images = []
-        self.table_buffer = []
+        self.doc_images = {} # (path, mtime) -> PhotoImage, reused across page switches
+        self.link_targets = {} # Per-link tag ("link_<n>") -> target file
+        self.heading_marks = []
+        self.search_index = search_index # Optional manual_search.ManualIndex
+        self.search_var = None
+        self.search_results = None
+        self.search_hits = []
+        self._search_job = None
         self.title = title
         self.geometry = geometry
         self.bg_color = bg_color
@@ -59,14 +193,22 @@ class ManualViewer:
         self.doc_text.tag_config("quote", font=("Georgia", 11, "italic"), lmargin1=20, lmargin2=20, foreground="#7f8c8d")
         self.doc_text.tag_config("code", font=("Courier", 10), background="#ecf0f1")
         self.doc_text.tag_config("link", foreground="blue", underline=1, font=("Georgia", 11, "bold"))
+        self.doc_text.tag_config("hr", font=("Arial", 2), background="#bdc3c7")
         
         # Table Tags
-        self.doc_text.tag_config("table", font="TkFixedFont", background="#ecf0f1", 
-                                 tabs=("2c", "6c", "10c", "14c", "18c", "22c"))
+        self.doc_text.tag_config("table_head", font=("Courier", 10, "bold"), background="#34495e", foreground="white")
+        self.doc_text.tag_config("table_row", font=("Courier", 10), background="#ffffff")
+        self.doc_text.tag_config("table_alt", font=("Courier", 10), background="#ecf0f1")
+        
+        # One binding for every link (the target is looked up by the link's own tag)
+        self.doc_text.tag_bind("link", "<Button-1>", self._on_link_click)
 
         # Sidebar Title
         tk.Label(sidebar, text="📚 Manual", bg=sidebar_bg, fg="#bdc3c7", font=("Arial", 12, "bold")).pack(pady=20)
         
+        if self.search_index:
+            self._build_search(sidebar, sidebar_bg)
+        
         # Dynamic Buttons
         base_style = {"fg": "white", "font": ("Arial", 11, "bold")}
         
@@ -90,198 +232,149 @@ class ManualViewer:
     def load_doc(self, filename):
         path = os.path.join(os.getcwd(), filename)
         if not os.path.exists(path):
-             self.doc_text.config(state=tk.NORMAL)
-             self.doc_text.delete("1.0", tk.END)
-             self.doc_text.insert(tk.END, f"File not found: {filename}\n(Expected at {path})")
-             self.doc_text.config(state=tk.DISABLED)
+             self._show_message(f"File not found: {filename}\n(Expected at {path})")
              return
+
+        if filename.lower().endswith(".pdf"):
+            PdfViewer(filename, title=os.path.basename(filename)).show()
+            return
         
         try:
-            with open(path, 'r') as f: content = f.read()
-            self._render_markdown(content)
+            self._replay(load_tokens(path))
         except Exception as e:
-            self.doc_text.config(state=tk.NORMAL)
-            self.doc_text.delete("1.0", tk.END)
-            self.doc_text.insert(tk.END, f"Error loading file: {e}")
-            self.doc_text.config(state=tk.DISABLED)
+            self._show_message(f"Error loading file: {e}")
 
-    def _render_markdown(self, content):
+    def _show_message(self, text):
         self.doc_text.config(state=tk.NORMAL)
         self.doc_text.delete("1.0", tk.END)
-        self.doc_images = []
-        self.table_buffer = []
+        self.doc_text.insert(tk.END, text)
+        self.doc_text.config(state=tk.DISABLED)
 
-        def flush_table_buffer():
-            if not self.table_buffer: return
-            
-            # Create a Frame for the table
-            table_frame = tk.Frame(self.doc_text, bg="#bdc3c7", padx=1, pady=1) # Border effect
-            
-            # Parse Data
-            raw_rows = []
-            for l in self.table_buffer:
-                # | Cell | Cell | -> ['Cell', 'Cell']
-                cells = [c.strip() for c in l.strip().split('|')]
-                if len(cells) > 0 and cells[0] == '': cells.pop(0)
-                if len(cells) > 0 and cells[-1] == '': cells.pop(-1)
-                raw_rows.append(cells)
-            
-            # Render
-            for r_idx, row_data in enumerate(raw_rows):
-                # Check for Divider Row (e.g. ---)
-                if all(c.replace('-', '').replace(':', '').strip() == '' for c in row_data):
-                    continue
-                    
-                is_header = (r_idx == 0)
-                bg_color = "#34495e" if is_header else ("#ecf0f1" if r_idx % 2 == 0 else "#ffffff")
-                fg_color = "white" if is_header else "black"
-                font_style = ("Arial", 11, "bold") if is_header else ("Arial", 10)
-                
-                for c_idx, cell_text in enumerate(row_data):
-                    clean_text = cell_text.replace("**", "")
-                    lbl = tk.Label(table_frame, text=clean_text, font=font_style, 
-                                   bg=bg_color, fg=fg_color, padx=10, pady=5, borderwidth=1, relief="solid")
-                    lbl.grid(row=r_idx, column=c_idx, sticky="nsew")
-            
-            # Embed the frame
-            self.doc_text.window_create(tk.END, window=table_frame)
+    def _render_markdown(self, content):
+        self._replay(parse_markdown(content))
+
+    def _replay(self, tokens):
+        """RENDER STAGE: batch consecutive text runs into single multi-segment inserts."""
+        text = self.doc_text
+        text.config(state=tk.NORMAL)
+        text.delete("1.0", tk.END)
+        self.link_targets = {}
+        for mark in self.heading_marks: text.mark_unset(mark)
+        self.heading_marks = []
+        batch = []
+
+        def flush():
+            if batch:
+                text.insert(tk.END, *batch)
+                batch.clear()
+
+        for tok in tokens:
+            kind = tok[0]
+            if kind == "text":
+                batch.append(tok[1])
+                batch.append(tok[2])
+            elif kind == "link":
+                flush()
+                # Own tag per link: adjacent links would otherwise merge into one "link" range
+                tag = f"link_{len(self.link_targets)}"
+                self.link_targets[tag] = tok[3]
+                text.insert(tk.END, tok[1], tok[2] + (tag,))
+            elif kind == "image":
+                flush()
+                self._insert_image(tok[1])
+            elif kind == "heading":
+                flush()
+                mark = f"heading_{tok[1]}"
+                text.mark_set(mark, "end-1c")
+                text.mark_gravity(mark, tk.LEFT)
+                self.heading_marks.append(mark)
+        flush()
+        text.config(state=tk.DISABLED)
+
+    def _insert_image(self, path):
+        try:
+            full_path = os.path.join(os.getcwd(), path)
+            if not os.path.exists(full_path):
+                self.doc_text.insert(tk.END, f"[Image not found: {path}]\n")
+                return
+
+            key = (full_path, os.stat(full_path).st_mtime_ns)
+            photo = self.doc_images.get(key)
+            if photo is None:
+                img = _IMAGE_CACHE.get(key)
+                if img is None:
+                    img = Image.open(full_path)
+                    # Resize to fit
+                    w_percent = (IMAGE_WIDTH / float(img.size[0]))
+                    h_size = int((float(img.size[1]) * float(w_percent)))
+                    img = img.resize((IMAGE_WIDTH, h_size), Image.Resampling.LANCZOS)
+                    _IMAGE_CACHE[key] = img
+                photo = ImageTk.PhotoImage(img)
+                self.doc_images[key] = photo
+            self.doc_text.image_create(tk.END, image=photo)
             self.doc_text.insert(tk.END, "\n")
-            self.table_buffer = []
-
-        def insert_with_tags(text, context_tag=None):
-            # [NEW] Helper to merge tags
-            def get_tags(extra=None):
-                tags = []
-                if context_tag: tags.append(context_tag)
-                if extra: tags.append(extra)
-                return tuple(tags) if tags else None
-
-            # [NEW] Hyperlink Parsing: [Text](Target)
-            link_pattern = r'(\[[^\]]+\]\([^)]+\))'
-            parts = re.split(link_pattern, text)
-            
-            for p in parts:
-                match = re.match(r'\[([^\]]+)\]\(([^)]+)\)', p)
-                if match:
-                    link_text = match.group(1)
-                    target = match.group(2)
-                    
-                    # Insert Link with Tag
-                    tag_name = f"link_{len(self.doc_text.tag_names())}"
-                    # Combine link tag with context tag (e.g. h1+link)
-                    combined_tags = list(get_tags("link") or [])
-                    combined_tags.append(tag_name)
-                    
-                    self.doc_text.insert(tk.END, link_text, tuple(combined_tags))
-                    
-                    # Bind Click
-                    def on_link_click(e, t=target):
-                        # print(f"Link Clicked: {t}")
-                        self.load_doc(t)
-                        
-                    self.doc_text.tag_bind(tag_name, "<Button-1>", on_link_click)
-                else:
-                    # Proceed with Bold/Italic Parsing on non-link text
-                    parse_formatting(p, get_tags)
-
-        def parse_formatting(text, tag_getter):
-            # 1. Bold Parsing (**text**)
-            parts = re.split(r'(\*\*.*?\*\*)', text)
-            for p in parts:
-                if p.startswith('**') and p.endswith('**') and len(p) > 4:
-                    self.doc_text.insert(tk.END, p[2:-2], tag_getter("bold"))
-                else:
-                    # 2. Italic Parsing (*text*)
-                    sub_parts = re.split(r'(\*.*?\*)', p)
-                    for sp in sub_parts:
-                        if sp.startswith('*') and sp.endswith('*') and len(sp) > 2:
-                            self.doc_text.insert(tk.END, sp[1:-1], tag_getter("italic"))
-                        else:
-                            self.doc_text.insert(tk.END, sp, tag_getter())
-
-        lines = content.split('\n')
-        for line in lines:
-            stripped = line.strip()
-
-            # Check for Table Line
-            if stripped.startswith("|"):
-                self.table_buffer.append(stripped)
-                continue
-            else:
-                flush_table_buffer()
-            
-            # 1. Headers
-            if stripped.startswith('# '):
-                insert_with_tags(stripped[2:], "h1")
-                self.doc_text.insert(tk.END, "\n")
-            elif stripped.startswith('## '):
-                insert_with_tags(stripped[3:], "h2")
-                self.doc_text.insert(tk.END, "\n")
-            elif stripped.startswith('### '):
-                insert_with_tags(stripped[4:], "h3")
-                self.doc_text.insert(tk.END, "\n")
-            elif stripped.startswith('#### '):
-                insert_with_tags(stripped[5:], "h4")
-                self.doc_text.insert(tk.END, "\n")
-            
-            # 2. Blockquotes
-            elif stripped.startswith('> '):
-                 insert_with_tags(stripped[2:], "quote")
-                 self.doc_text.insert(tk.END, "\n")
-
-            # [NEW] Horizontal Rule
-            elif stripped.startswith('---') or stripped.startswith('***'):
-                # Draw a line using a Frame with explicit height and background color
-                # We need a small font to prevent large gaps, or just use window_create
-                hr_frame = tk.Frame(self.doc_text, height=2, bg="#bdc3c7", width=600) # Width is somewhat arbitrary, effectively fill X?
-                # Text widget width logic is tricky, but fixed width is OK for now.
-                # Better: Use a canvas line? Or simple text.
-                # A Frame with 'stretch' behavior in Text widget is hard.
-                # Let's try a full-width line using unicode if frame fails, but Frame is standard for this.
-                # Width=800 should cover most of the view.
-                hr_frame = tk.Frame(self.doc_text, height=2, bg="#bdc3c7", width=800)
-                self.doc_text.window_create(tk.END, window=hr_frame)
-                self.doc_text.insert(tk.END, "\n")
-
-            # 3. Images: ![alt](path)
-            elif stripped.startswith("!["):
-                try:
-                    s = line.find("(") + 1
-                    e = line.find(")")
-                    path = line[s:e]
-                    full_path = os.path.join(os.getcwd(), path)
-                    
-                    if os.path.exists(full_path):
-                        img = Image.open(full_path)
-                        # Resize to fit
-                        base_width = 500
-                        w_percent = (base_width / float(img.size[0]))
-                        h_size = int((float(img.size[1]) * float(w_percent)))
-                        img = img.resize((base_width, h_size), Image.Resampling.LANCZOS)
-                        
-                        photo = ImageTk.PhotoImage(img)
-                        self.doc_images.append(photo)
-                        self.doc_text.image_create(tk.END, image=photo)
-                        self.doc_text.insert(tk.END, "\n")
-                    else:
-                         self.doc_text.insert(tk.END, f"[Image not found: {path}]\n")
-                except Exception as e:
-                    self.doc_text.insert(tk.END, f"[Image Load Failed: {e}]\n")
-                 
-            # 4. List Items
-            elif stripped.startswith('* ') or stripped.startswith('- '):
-                 self.doc_text.insert(tk.END, "  • ")
-                 insert_with_tags(stripped[2:])
-                 self.doc_text.insert(tk.END, "\n") # [FIX] Add newline for list items
-            
-            # 5. Normal Text
-            else:
-                insert_with_tags(stripped)
-                self.doc_text.insert(tk.END, "\n") # Restore newline if was stripped
+        except Exception as e:
+            self.doc_text.insert(tk.END, f"[Image Load Failed: {e}]\n")
 
-        flush_table_buffer() 
-        self.doc_text.config(state=tk.DISABLED)
+    def _on_link_click(self, event):
+        tags = self.doc_text.tag_names(f"@{event.x},{event.y}")
+        target = next((self.link_targets[t] for t in tags if t in self.link_targets), None)
+        if target: self.load_doc(target)
     
+    # --- SEARCH ---
+    def _build_search(self, sidebar, sidebar_bg):
+        try:
+            self.search_index.refresh() # Only changed sources are re-indexed
+        except Exception as e:
+            print(f"Manual Index Error: {e}")
+            self.search_index = None
+            return
+
+        self.search_var = tk.StringVar()
+        entry = tk.Entry(sidebar, textvariable=self.search_var, font=("Arial", 11))
+        entry.pack(fill=tk.X, padx=10, pady=(0, 5))
+        entry.bind("<KeyRelease>", lambda e: self._schedule_search())
+        entry.bind("<Return>", lambda e: self._open_hit(0))
+
+        self.search_results = tk.Listbox(sidebar, height=8, bg="#2c3e50", fg="white", font=("Arial", 9),
+                                         selectbackground="#2980b9", activestyle="none", borderwidth=0)
+        self.search_results.pack(fill=tk.X, padx=10, pady=(0, 15))
+        self.search_results.bind("<<ListboxSelect>>", self._on_hit_select)
+
+    def _schedule_search(self):
+        # Debounce keystrokes
+        if self._search_job: self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(150, self._run_search)
+
+    def _run_search(self):
+        self._search_job = None
+        query = self.search_var.get()
+        try:
+            self.search_hits = self.search_index.search(query) if query.strip() else []
+        except Exception as e:
+            print(f"Manual Search Error: {e}")
+            self.search_hits = []
+        self.search_results.delete(0, tk.END)
+        for hit in self.search_hits:
+            self.search_results.insert(tk.END, hit['title'] or os.path.basename(hit['source']))
+
+    def _on_hit_select(self, event):
+        sel = self.search_results.curselection()
+        if sel: self._open_hit(sel[0])
+
+    def _open_hit(self, idx):
+        if idx >= len(self.search_hits): return
+        hit = self.search_hits[idx]
+        if hit['source'] == INSTRUCTIONS_SOURCE:
+            title, body = self.search_index.get_instruction(hit['anchor'])
+            self._replay(parse_markdown(f"# {title}\n\n{body}"))
+            return
+
+        self.load_doc(hit['source'])
+        if hit['anchor'] is not None:
+            mark = f"heading_{hit['anchor']}"
+            if mark in self.heading_marks: self.doc_text.yview(mark)
+
     def _adjust_color(self, hex_color, factor):
         # Placeholder for color adjustment if we want dynamic theming later
         return hex_color
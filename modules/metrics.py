@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import logging
+import datetime
+import threading
+import functools
+from logging.handlers import RotatingFileHandler
+
+# In-process counters / gauges / histograms for --metrics.
+# Everything is a no-op while `enabled` is False (one global check per call), so the
+# sensor, session logger, DB helpers and Tk loops can stay instrumented permanently.
+# Exporters: a rotating JSON-lines file (one snapshot per interval) and an optional
+# localhost HTTP endpoint serving the Prometheus text format.
+
+METRICS_FILE = "logs/metrics.jsonl"
+EXPORT_INTERVAL_SECS = 30
+MAX_FILE_BYTES = 1024 * 1024
+FILE_BACKUPS = 3
+MS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000) # Histogram upper bounds (ms)
+
+enabled = False
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_exporter = None
+_http = None
+
+
+class Histogram:
+    def __init__(self, buckets=MS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # Last slot: above the top bound
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        i = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max: self.max = value
+
+    def to_dict(self):
+        labels = [f"le_{b}" for b in self.buckets] + ["inf"]
+        return {'count': self.count, 'sum': round(self.sum, 3), 'max': round(self.max, 3),
+                'buckets': dict(zip(labels, self.counts))}
+
+
+def inc(name, n=1):
+    if not enabled: return
+    with _lock: _counters[name] = _counters.get(name, 0) + n
+
+
+def gauge(name, value):
+    if not enabled: return
+    with _lock: _gauges[name] = value
+
+
+def observe(name, value, buckets=MS_BUCKETS):
+    if not enabled: return
+    with _lock:
+        hist = _histograms.get(name)
+        if hist is None: hist = _histograms[name] = Histogram(buckets)
+        hist.observe(value)
+
+
+def timed(name, buckets=MS_BUCKETS):
+    """Decorator: observes the call's wall time in ms under `name`."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            if not enabled: return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                observe(name, (time.perf_counter() - start) * 1000, buckets)
+        return inner
+    return wrap
+
+
+def snapshot():
+    with _lock:
+        return {
+            'time': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'counters': dict(_counters),
+            'gauges': dict(_gauges),
+            'histograms': {k: h.to_dict() for k, h in _histograms.items()}
+        }
+
+
+def render_text():
+    """Prometheus text exposition of the current values."""
+    def metric(name): return "fivebx_" + name.replace(".", "_").replace("-", "_")
+    lines = []
+    with _lock:
+        for name, value in sorted(_counters.items()):
+            lines += [f"# TYPE {metric(name)} counter", f"{metric(name)} {value}"]
+        for name, value in sorted(_gauges.items()):
+            lines += [f"# TYPE {metric(name)} gauge", f"{metric(name)} {value}"]
+        for name, hist in sorted(_histograms.items()):
+            m = metric(name)
+            lines.append(f"# TYPE {m} histogram")
+            cumulative = 0
+            for bound, n in zip(list(hist.buckets) + ["+Inf"], hist.counts):
+                cumulative += n
+                lines.append(f'{m}_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f"{m}_sum {hist.sum}", f"{m}_count {hist.count}"]
+    return "\n".join(lines) + "\n"
+
+
+# --- EXPORTERS ---
+class _FileExporter:
+    def __init__(self, path, interval):
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.log = logging.getLogger("fivebx.metrics")
+        self.log.propagate = False
+        self.log.setLevel(logging.INFO)
+        self.handler = RotatingFileHandler(path, maxBytes=MAX_FILE_BYTES, backupCount=FILE_BACKUPS)
+        self.handler.setFormatter(logging.Formatter("%(message)s"))
+        self.log.addHandler(self.handler)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="metrics-export", daemon=True)
+        self.thread.start()
+
+    def write(self):
+        self.log.info(json.dumps(snapshot()))
+
+    def _run(self):
+        while not self.stopped.wait(self.interval): self.write()
+
+    def stop(self):
+        self.stopped.set()
+        self.write() # Final snapshot on exit
+        self.log.removeHandler(self.handler)
+        self.handler.close()
+
+
+def serve_http(port, host="127.0.0.1"):
+    """Serves render_text() at http://host:port/metrics on a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args): pass # Keep the console for the app
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start(path=METRICS_FILE, interval=EXPORT_INTERVAL_SECS, http_port=None):
+    """Turns collection on and starts the file exporter (and the HTTP endpoint if a port is given)."""
+    global enabled, _exporter, _http
+    enabled = True
+    if path and not _exporter: _exporter = _FileExporter(path, interval)
+    if http_port and not _http: _http = serve_http(http_port)
+
+
+def shutdown():
+    global enabled, _exporter, _http
+    if _exporter:
+        _exporter.stop()
+        _exporter = None
+    if _http:
+        _http.shutdown()
+        _http = None
+    enabled = False
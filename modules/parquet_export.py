@@ -0,0 +1,343 @@
+"""
+Columnar export for offline analytics (pandas / DuckDB / polars).
+
+    python -m modules.parquet_export                # incremental, into exports/parquet
+    python -m modules.parquet_export --full         # rebuild everything
+
+Layout (hive partitioned, so pd.read_parquet / duckdb read_parquet(..., hive_partitioning=1)
+prune by user and month):
+
+    exports/parquet/sessions/user=<name>/month=YYYY-MM/<session>.parquet   one file per recording
+    exports/parquet/history/user=<name>/month=YYYY-MM/history.parquet      one file per month
+    exports/parquet/_manifest.json                                         what has been exported
+
+Sessions are immutable once recorded, so only CSVs not yet in the manifest (or whose size
+changed) are converted. Recordings compacted before they were exported are read from their
+1 Hz series in session_archive (see modules/session_retention.py): HR, RMSSD and exercise
+only. --full rebuilds every session it still has a source for and keeps the files of the
+ones it has not (summary-only or deleted recordings). History months are rewritten when a user has new rows in them;
+if rows were removed (delete / undo) all of that user's months are rewritten.
+Label columns (exercise, chart level, state, verdict ...) are dictionary encoded.
+
+Requires pyarrow (optional, only for this exporter).
+"""
+import os
+import re
+import sys
+import csv
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import datetime
+
+from modules.session_retention import unpack_series
+
+USER_DB_FILE = "databases/user_progress.db"
+SESSION_DIR = "ant_sessions"
+EXPORT_DIR = "exports/parquet"
+MANIFEST = "_manifest.json"
+
+# session_5bx_<name>_<YYYYmmdd>_<HHMMSS>.csv (workout app) / session_<name>_... (ant_gui monitor)
+SESSION_RE = re.compile(r"session_(5bx_)?(.+)_(\d{8})_(\d{6})\.csv$")
+
+# CSV header -> column. Older recordings used different layouts, missing columns become null.
+SESSION_FIELDS = {
+    "HR_BPM": "hr_bpm", "RMSSD_MS": "rmssd_ms", "Raw_RR_MS": "rr_ms", "Cadence_SPM": "cadence_spm",
+    "Raw_Packet_Hex": "packet_hex", "Chart_Level": "chart_level", "Exercise_Note": "exercise",
+    "State": "state", "Trend": "trend", "Status": "status", "Battery_V": "battery_v",
+}
+HISTORY_LABELS = ("chart", "level", "verdict", "ex5_type")
+HISTORY_TEXT = ("segment_stats", "notes", "prev_levels", "new_levels")
+
+_pa = _pq = None
+
+
+class ExportError(Exception):
+    pass
+
+
+def _arrow():
+    """pyarrow is only needed here - import on first use."""
+    global _pa, _pq
+    if _pa is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ExportError("pyarrow is not installed (pip install pyarrow)")
+        _pa, _pq = pyarrow, pyarrow.parquet
+    return _pa, _pq
+
+
+def _label():
+    pa, _ = _arrow()
+    return pa.dictionary(pa.int16(), pa.string())
+
+
+def session_schema():
+    pa, _ = _arrow()
+    return pa.schema([
+        ("session", _label()), ("source", _label()), ("timestamp", pa.timestamp("ms")),
+        ("hr_bpm", pa.int16()), ("rmssd_ms", pa.float32()), ("rr_ms", pa.int32()), ("cadence_spm", pa.int16()),
+        ("packet_hex", pa.string()), ("chart_level", _label()), ("exercise", _label()),
+        ("state", _label()), ("trend", _label()), ("status", _label()), ("battery_v", pa.float32()),
+    ])
+
+
+def history_schema():
+    pa, _ = _arrow()
+    return pa.schema([
+        ("id", pa.int64()), ("timestamp", pa.timestamp("s")), ("chart", _label()), ("level", _label()),
+        ("verdict", _label()), ("avg_hr", pa.int16()), ("max_hr", pa.int16()), ("end_rmssd", pa.float32()),
+        ("ex1", pa.int16()), ("ex2", pa.int16()), ("ex3", pa.int16()), ("ex4", pa.int16()), ("ex5", pa.int16()),
+        ("ex5_type", _label()), ("ex5_duration", pa.int32()), ("segment_stats", pa.string()), ("notes", pa.string()),
+        ("prev_levels", pa.string()), ("new_levels", pa.string()),
+    ])
+
+
+def _num(value, cast):
+    if value in (None, "", "None", "nan"): return None
+    try:
+        return cast(float(value)) if cast is int else cast(value)
+    except ValueError:
+        return None
+
+
+def _text(value):
+    return value if value not in (None, "", "None") else None
+
+
+def _user_dir(root, user):
+    # '/' is the only character that can't go in a partition directory name
+    return os.path.join(root, f"user={user.replace('/', '_')}")
+
+
+def _partition(root, user, month):
+    return os.path.join(_user_dir(root, user), f"month={month}")
+
+
+def _write(table, path):
+    _, pq = _arrow()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, path) # Readers never see a half-written file
+
+
+# --- SESSIONS ---
+def read_session(path):
+    """Parses one recording CSV into (user, month, arrow table), or None if the name doesn't match."""
+    pa, _ = _arrow()
+    m = SESSION_RE.search(os.path.basename(path))
+    if not m: return None
+    source, user, day, hms = "5bx" if m.group(1) else "monitor", m.group(2), m.group(3), m.group(4)
+    start = datetime.datetime.strptime(day + hms, "%Y%m%d%H%M%S")
+    session = os.path.basename(path)[:-4]
+
+    cols = {name: [] for name in session_schema().names}
+    prev = start
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            # Rows hold time-of-day only: anchor to the file's date and roll over past midnight
+            try:
+                tod = datetime.datetime.strptime(row.get("Timestamp", ""), "%H:%M:%S.%f").time()
+            except ValueError:
+                continue
+            ts = datetime.datetime.combine(prev.date(), tod)
+            if ts < prev - datetime.timedelta(hours=12): ts += datetime.timedelta(days=1)
+            prev = ts
+
+            cols["session"].append(session)
+            cols["source"].append(source)
+            cols["timestamp"].append(ts)
+            for header, name in SESSION_FIELDS.items():
+                raw = row.get(header)
+                if name in ("hr_bpm", "rr_ms", "cadence_spm"): cols[name].append(_num(raw, int))
+                elif name in ("rmssd_ms", "battery_v"): cols[name].append(_num(raw, float))
+                else: cols[name].append(_text(raw))
+    return user, start.strftime("%Y-%m"), pa.table(cols, schema=session_schema())
+
+
+def read_archived(source_file, started, series, exercises):
+    """Like read_session() for a compacted recording (session_archive tier 1 row), or None."""
+    pa, _ = _arrow()
+    m = SESSION_RE.search(source_file)
+    if not m: return None
+    start = datetime.datetime.strptime(started, "%Y-%m-%d %H:%M:%S")
+    names = [e["exercise"] for e in json.loads(exercises)]
+    samples = unpack_series(series)
+    cols = {name: [None] * len(samples) for name in session_schema().names}
+    cols["session"] = [source_file[:-4]] * len(samples)
+    cols["source"] = ["5bx" if m.group(1) else "monitor"] * len(samples)
+    cols["timestamp"] = [start + datetime.timedelta(seconds=t) for t, _, _, _ in samples]
+    cols["hr_bpm"] = [hr for _, hr, _, _ in samples]
+    cols["rmssd_ms"] = [rmssd / 10.0 for _, _, rmssd, _ in samples]
+    cols["exercise"] = [_text(names[ex]) for _, _, _, ex in samples]
+    return m.group(2), start.strftime("%Y-%m"), pa.table(cols, schema=session_schema())
+
+
+def _archived_sessions(db_file):
+    """(source_file, started, series, exercises) of the compacted recordings that still have a series."""
+    if not os.path.exists(db_file): return []
+    conn = sqlite3.connect(db_file)
+    try:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='session_archive'").fetchone(): return []
+        return conn.execute("""SELECT source_file, started, series, exercises FROM session_archive
+                               WHERE series IS NOT NULL ORDER BY source_file""").fetchall()
+    finally:
+        conn.close()
+
+
+def export_sessions(out_dir, manifest, session_dir=SESSION_DIR, full=False, db_file=USER_DB_FILE):
+    """Converts new / changed recordings (CSV, else the compacted series). Returns the number written."""
+    previous = manifest.get("sessions", {})
+    done = {} if full else manifest.setdefault("sessions", {})
+    written = 0
+    for name in sorted(os.listdir(session_dir)) if os.path.isdir(session_dir) else []:
+        path = os.path.join(session_dir, name)
+        size = os.path.getsize(path)
+        if done.get(name, {}).get("size") == size: continue
+        parsed = read_session(path)
+        if parsed is None: continue
+        user, month, table = parsed
+        target = os.path.join(_partition(os.path.join(out_dir, "sessions"), user, month), name[:-4] + ".parquet")
+        _write(table, target)
+        done[name] = {"size": size, "rows": table.num_rows, "file": os.path.relpath(target, out_dir)}
+        written += 1
+
+    for source_file, started, series, exercises in _archived_sessions(db_file):
+        if source_file in done: continue # Exported from the CSV (or already from the archive)
+        prior = previous.get(source_file)
+        if full and prior and not prior.get("archived") and os.path.exists(os.path.join(out_dir, prior["file"])):
+            continue # Its earlier export from the CSV has every column: kept below
+        parsed = read_archived(source_file, started, series, exercises)
+        if parsed is None: continue
+        user, month, table = parsed
+        target = os.path.join(_partition(os.path.join(out_dir, "sessions"), user, month), source_file[:-4] + ".parquet")
+        _write(table, target)
+        done[source_file] = {"archived": True, "rows": table.num_rows, "file": os.path.relpath(target, out_dir)}
+        written += 1
+
+    if full:
+        # No source left to rebuild from (summary-only / deleted): keep what the last export wrote
+        for name, entry in previous.items():
+            if name not in done and os.path.exists(os.path.join(out_dir, entry["file"])): done[name] = entry
+        keep = {os.path.normpath(os.path.join(out_dir, entry["file"])) for entry in done.values()}
+        for folder, _, files in os.walk(os.path.join(out_dir, "sessions")):
+            for f in files:
+                if os.path.normpath(os.path.join(folder, f)) not in keep: os.remove(os.path.join(folder, f))
+    manifest["sessions"] = done
+    return written
+
+
+# --- HISTORY ---
+def _history_table(rows):
+    pa, _ = _arrow()
+    schema = history_schema()
+    cols = {name: [] for name in schema.names}
+    for r in rows:
+        for name in schema.names:
+            value = r.get(name)
+            if name == "timestamp": value = datetime.datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+            elif name in HISTORY_LABELS or name in HISTORY_TEXT: value = _text(value if value is None else str(value))
+            elif name == "end_rmssd": value = _num(value, float)
+            else: value = _num(value, int)
+            cols[name].append(value)
+    return pa.table(cols, schema=schema)
+
+
+def export_history(out_dir, manifest, db_file=USER_DB_FILE, full=False):
+    """Rewrites the history months that changed since the last export. Returns months written."""
+    state = {} if full else manifest.setdefault("history", {})
+    root = os.path.join(out_dir, "history")
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    written = 0
+    try:
+        users = conn.execute("SELECT id, name FROM users").fetchall()
+        for gone in set(state) - {name for _, name in users}:
+            shutil.rmtree(_user_dir(root, gone), ignore_errors=True)
+            del state[gone]
+        for uid, user in users:
+            last_id, count = conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM history WHERE user_id=?", (uid,)).fetchone()
+            prev = state.get(user, {"last_id": 0, "rows": 0})
+            if (last_id, count) == (prev["last_id"], prev["rows"]): continue
+
+            if count < prev["rows"] + conn.execute("SELECT COUNT(*) FROM history WHERE user_id=? AND id>?", (uid, prev["last_id"])).fetchone()[0]:
+                # Rows were removed: months can't be patched, rewrite the user
+                shutil.rmtree(_user_dir(root, user), ignore_errors=True)
+                months = None
+            else:
+                months = {r[0] for r in conn.execute("SELECT DISTINCT substr(timestamp, 1, 7) FROM history WHERE user_id=? AND id>?", (uid, prev["last_id"]))}
+
+            sql, args = "SELECT * FROM history WHERE user_id=?", [uid]
+            if months is not None:
+                sql += f" AND substr(timestamp, 1, 7) IN ({', '.join('?' * len(months))})"
+                args += sorted(months)
+            by_month = {}
+            for r in conn.execute(sql + " ORDER BY id", args):
+                by_month.setdefault(r["timestamp"][:7], []).append(dict(r))
+            for month, rows in by_month.items():
+                _write(_history_table(rows), os.path.join(_partition(root, user, month), "history.parquet"))
+                written += 1
+            state[user] = {"last_id": last_id, "rows": count}
+    finally:
+        conn.close()
+    manifest["history"] = state
+    return written
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(path):
+        try:
+            with open(path) as f: return json.load(f)
+        except ValueError:
+            pass
+    return {}
+
+
+def save_manifest(out_dir, manifest):
+    manifest["updated"] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    tmp = os.path.join(out_dir, MANIFEST + ".tmp")
+    with open(tmp, "w") as f: json.dump(manifest, f, indent=2)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+
+
+def export_all(out_dir=EXPORT_DIR, db_file=USER_DB_FILE, session_dir=SESSION_DIR, full=False):
+    """Returns (sessions written, history months written)."""
+    _arrow()
+    # --full rewrites in place: session files without a source any more are kept (export_sessions)
+    if full: shutil.rmtree(os.path.join(out_dir, "history"), ignore_errors=True)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    try:
+        sessions = export_sessions(out_dir, manifest, session_dir, full, db_file)
+        months = export_history(out_dir, manifest, db_file, full)
+    finally:
+        save_manifest(out_dir, manifest) # Keep partial progress if one file fails
+    return sessions, months
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export sessions and history to partitioned Parquet.")
+    parser.add_argument("-o", "--output", default=EXPORT_DIR)
+    parser.add_argument("--db", default=USER_DB_FILE)
+    parser.add_argument("--session-dir", default=SESSION_DIR)
+    parser.add_argument("--full", action="store_true", help="Rebuild the export (sessions with no source left are kept)")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    try:
+        sessions, months = export_all(args.output, args.db, args.session_dir, args.full)
+    except ExportError as e:
+        print(f"Export Error: {e}")
+        return 1
+    print(f"Parquet export: {sessions} new session files, {months} history months rewritten -> {args.output} ({time.perf_counter() - t0:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,260 @@
+import os
+import platform
+import subprocess
+import threading
+import collections
+import tkinter as tk
+from PIL import Image, ImageTk
+
+# Optional rasterizers (PyMuPDF preferred, pypdfium2 second), imported on first use.
+# Without either, PDFs are handed to the OS viewer.
+fitz = None
+pdfium = None
+_backend_checked = False
+
+PLAN_PDF = "pdfs/5bx-plan.pdf"
+
+# pdfs/5bx-plan.pdf is a scan (no text layer, no outline), so the chart spreads
+# (rating table + exercise drawings) are listed explicitly. 0-based page index.
+PLAN_CHART_PAGES = {1: 11, 2: 12, 3: 13, 4: 14, 5: 15, 6: 16}
+
+CACHE_PAGES = 8      # Rendered bitmaps kept (LRU)
+SIZE_STEP = 50       # Render sizes are rounded to this so small resizes reuse the cache
+POLL_MS = 30
+
+
+def has_renderer():
+    global fitz, pdfium, _backend_checked
+    if not _backend_checked:
+        _backend_checked = True
+        try:
+            import pymupdf as fitz
+        except ImportError:
+            try:
+                import fitz
+            except ImportError:
+                fitz = None
+        if fitz is None:
+            try:
+                import pypdfium2 as pdfium
+            except ImportError:
+                pdfium = None
+    return fitz is not None or pdfium is not None
+
+
+def open_external(path):
+    """Hand the file to the OS viewer (fallback when no rasterizer is installed)."""
+    system_os = platform.system()
+    if system_os == "Windows": os.startfile(path)
+    elif system_os == "Darwin": subprocess.Popen(["open", path])
+    else: subprocess.Popen(["xdg-open", path])
+
+
+class PdfPageRenderer:
+    """
+    Rasterizes pages on a worker thread. The document is opened lazily by the worker
+    (the only thread that touches it) and pages are decoded on demand, so nothing but
+    the requested pages is ever held in memory. Results are PIL images in an LRU;
+    the Tk side collects finished pages with poll().
+    """
+    def __init__(self, path, cache_pages=CACHE_PAGES):
+        self.path = path
+        self.cache_pages = cache_pages
+        self.cache = collections.OrderedDict() # (page, (width, height)) -> PIL image
+        self.page_count = None
+        self.lock = threading.Condition()
+        self.pending = collections.deque() # (page, size), most urgent on the left
+        self.done = collections.deque()    # (page, size) finished since the last poll
+        self.running = True
+        self.doc = None
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    # --- TK SIDE ---
+    def get(self, page, size):
+        key = (page, size)
+        with self.lock:
+            img = self.cache.get(key)
+            if img is not None: self.cache.move_to_end(key)
+            return img
+
+    def request(self, page, size, prefetch=()):
+        """Queue page (urgent) and neighbours (background). Stale requests are dropped."""
+        with self.lock:
+            wanted = [(page, size)] + [(p, size) for p in prefetch]
+            self.pending.clear()
+            for key in wanted:
+                if key not in self.cache: self.pending.append(key)
+            self.lock.notify()
+
+    def poll(self):
+        with self.lock:
+            finished = list(self.done)
+            self.done.clear()
+        return finished
+
+    def close(self):
+        with self.lock:
+            self.running = False
+            self.pending.clear()
+            self.lock.notify()
+
+    # --- WORKER ---
+    def _open(self):
+        if fitz is not None:
+            self.doc = fitz.open(self.path)
+            return self.doc.page_count
+        self.doc = pdfium.PdfDocument(self.path)
+        return len(self.doc)
+
+    def _render(self, page, size):
+        """Renders page scaled to fit inside size (width, height)."""
+        width, height = size
+        p = self.doc[page]
+        if fitz is not None:
+            zoom = min(width / p.rect.width, height / p.rect.height)
+            pix = p.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            return Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        page_w, page_h = p.get_size()
+        zoom = min(width / page_w, height / page_h)
+        return p.render(scale=zoom).to_pil().convert("RGB")
+
+    def _worker(self):
+        try:
+            count = self._open()
+        except Exception as e:
+            print(f"PDF Open Error: {e}")
+            count = 0
+        with self.lock:
+            self.page_count = count
+            self.done.append(None) # Wake the UI so it can show the page count
+
+        while True:
+            with self.lock:
+                while self.running and not self.pending: self.lock.wait()
+                if not self.running: break
+                key = self.pending.popleft()
+                if key in self.cache: continue
+
+            page, size = key
+            if not (0 <= page < count): continue
+            try:
+                img = self._render(page, size)
+            except Exception as e:
+                print(f"PDF Render Error (page {page + 1}): {e}")
+                continue
+
+            with self.lock:
+                self.cache[key] = img
+                self.cache.move_to_end(key)
+                while len(self.cache) > self.cache_pages: self.cache.popitem(last=False)
+                self.done.append(key)
+
+        if self.doc is not None and hasattr(self.doc, "close"): self.doc.close()
+
+
+class PdfViewer:
+    """Page-at-a-time viewer window; renders to fit the window and prefetches page +/- 1."""
+    def __init__(self, path=PLAN_PDF, title="5BX Plan", page=0):
+        self.path = path
+        self.title = title
+        self.page = page
+        self.root = None
+        self.renderer = None
+        self.photo = None
+        self.size = None
+        self._resize_job = None
+        self._poll_job = None
+
+    def show(self):
+        if not has_renderer():
+            open_external(os.path.abspath(self.path))
+            return
+
+        try:
+            self.root = tk.Toplevel()
+        except RuntimeError:
+            self.root = tk.Tk()
+        self.root.title(self.title)
+        self.root.geometry("1100x900")
+        self.root.configure(bg="#2c3e50")
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self.root.bind("<Escape>", lambda e: self.close())
+        self.root.bind("<Left>", lambda e: self.go(-1))
+        self.root.bind("<Right>", lambda e: self.go(1))
+
+        nav = tk.Frame(self.root, bg="#34495e")
+        nav.pack(fill=tk.X, side=tk.TOP)
+        tk.Button(nav, text="◀ Prev", font=("Arial", 12, "bold"), command=lambda: self.go(-1)).pack(side=tk.LEFT, padx=10, pady=8)
+        self.lbl_page = tk.Label(nav, text="Loading...", font=("Helvetica", 14, "bold"), bg="#34495e", fg="white")
+        self.lbl_page.pack(side=tk.LEFT, padx=10)
+        tk.Button(nav, text="Next ▶", font=("Arial", 12, "bold"), command=lambda: self.go(1)).pack(side=tk.LEFT, padx=10, pady=8)
+        tk.Button(nav, text="Open Externally", command=lambda: open_external(os.path.abspath(self.path))).pack(side=tk.RIGHT, padx=10)
+        tk.Button(nav, text="Close", bg="#c0392b", fg="white", command=self.close).pack(side=tk.RIGHT, padx=10)
+
+        self.lbl_image = tk.Label(self.root, bg="#2c3e50")
+        self.lbl_image.pack(fill=tk.BOTH, expand=True)
+        self.lbl_image.bind("<Configure>", self._on_resize)
+
+        self.renderer = PdfPageRenderer(self.path)
+        self._poll()
+
+    def go(self, delta):
+        count = self.renderer.page_count if self.renderer else None
+        if not count: return
+        new_page = max(0, min(count - 1, self.page + delta))
+        if new_page != self.page:
+            self.page = new_page
+            self._display()
+
+    def _on_resize(self, event):
+        # Debounce: only re-render once resizing settles
+        if self._resize_job: self.root.after_cancel(self._resize_job)
+        self._resize_job = self.root.after(150, lambda: self._set_size(event.width, event.height))
+
+    def _set_size(self, width, height):
+        self._resize_job = None
+        size = (max(SIZE_STEP, (width // SIZE_STEP) * SIZE_STEP), max(SIZE_STEP, (height // SIZE_STEP) * SIZE_STEP))
+        if size != self.size:
+            self.size = size
+            self._display()
+
+    def _display(self):
+        count = self.renderer.page_count
+        if not self.size or count is None: return
+        if count == 0:
+            self.lbl_page.config(text="Could not open PDF")
+            return
+        self.page = max(0, min(count - 1, self.page))
+        self.lbl_page.config(text=f"Page {self.page + 1} / {count}")
+
+        img = self.renderer.get(self.page, self.size)
+        if img is not None:
+            self.photo = ImageTk.PhotoImage(img)
+            self.lbl_image.config(image=self.photo, text="")
+        elif self.photo is None:
+            self.lbl_image.config(text="Rendering...", fg="white", font=("Arial", 14))
+        neighbours = [p for p in (self.page + 1, self.page - 1) if 0 <= p < count]
+        self.renderer.request(self.page, self.size, prefetch=neighbours)
+
+    def _poll(self):
+        if not self.root or not self.root.winfo_exists(): return
+        for key in self.renderer.poll():
+            # None = document opened; otherwise refresh only if the visible page arrived
+            if key is None or key == (self.page, self.size): self._display()
+        self._poll_job = self.root.after(POLL_MS, self._poll)
+
+    def close(self):
+        if self.renderer: self.renderer.close()
+        if self.root:
+            if self._poll_job: self.root.after_cancel(self._poll_job)
+            self.root.destroy()
+            self.root = None
+
+
+def open_plan(chart=None, path=PLAN_PDF):
+    """Opens the 5BX plan, at the chart's page when one is given."""
+    viewer = PdfViewer(path, title="5BX Plan" + (f" - Chart {chart}" if chart else ""),
+                       page=PLAN_CHART_PAGES.get(int(chart), 0) if chart else 0)
+    viewer.show()
+    return viewer
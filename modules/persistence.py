@@ -0,0 +1,175 @@
+import os
+import json
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from modules import metrics
+
+# Write-behind persistence for the trainer: one worker thread owns every disk write the UI
+# would otherwise block on (history / level rows, the profile JSON, session CSV batches).
+#
+#   fut = worker.execute(progress_db.insert_history, user_id, ts, ...)   # fn(conn, *args)
+#   worker.execute(progress_db.merge_cardio_metrics, fut, cardio)       # a Future arg = that command's result
+#   worker.write_json(path, data)                                        # atomic replace
+#   worker.flush()                                                       # barrier: everything queued is on disk
+#
+# Commands run in submission order. Consecutive DB commands share one transaction (each in a
+# SAVEPOINT, so one failure doesn't sink the rest); file commands commit the DB work queued
+# before them first. Repeated writes of one file in a batch collapse into the last, appends
+# into one write. A DB command's Future resolves once its transaction is committed.
+
+BATCH_MAX = 64
+
+
+class PersistenceWorker:
+    def __init__(self, db_file, ready=None):
+        """ready: Event to wait for before the first DB command (schema migrations)."""
+        self.db_file = db_file
+        self.ready = ready
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name="persistence", daemon=True)
+        self.thread.start()
+
+    # --- COMMANDS ---
+    def _submit(self, kind, *payload):
+        fut = Future()
+        self.queue.put((kind, payload, fut))
+        metrics.gauge("persist.queue", self.queue.qsize())
+        return fut
+
+    def execute(self, fn, *args):
+        """fn(conn, *args) inside the batch transaction. Future args are replaced by their result."""
+        return self._submit("db", fn, args)
+
+    def call(self, fn, *args):
+        """fn(*args) on the worker, after the DB commands queued before it are committed."""
+        return self._submit("call", fn, args)
+
+    def write_text(self, path, text):
+        return self._submit("write", path, text)
+
+    def write_json(self, path, data, indent=4):
+        # Serialised now, so the caller may keep mutating `data`
+        return self.write_text(path, json.dumps(data, indent=indent))
+
+    def append_text(self, path, text):
+        return self._submit("append", path, text)
+
+    def flush(self, timeout=None):
+        """Blocks until everything queued so far has been written. False on timeout."""
+        if threading.current_thread() is self.thread or not self.thread.is_alive(): return True
+        fut = self.call(lambda: None)
+        try:
+            fut.result(timeout)
+            return True
+        except FutureTimeout:
+            return False
+
+    def close(self, timeout=10.0):
+        """Flushes and stops the worker (shutdown)."""
+        if not self.thread.is_alive(): return
+        self._submit("stop")
+        self.thread.join(timeout)
+
+    # --- WORKER ---
+    def _run(self):
+        if self.ready: self.ready.wait()
+        conn = sqlite3.connect(self.db_file, isolation_level=None) # Transactions are managed below
+        try:
+            while True:
+                batch = [self.queue.get()]
+                while len(batch) < BATCH_MAX:
+                    try: batch.append(self.queue.get_nowait())
+                    except queue.Empty: break
+                metrics.observe("persist.batch_size", len(batch), (1, 2, 4, 8, 16, 32, 64))
+                if not self._process(conn, batch): return
+        finally:
+            conn.close()
+
+    @metrics.timed("persist.batch_ms")
+    def _process(self, conn, batch):
+        done = {} # DB futures of the open transaction -> result
+        last_write = {payload[0]: i for i, (kind, payload, _) in enumerate(batch) if kind == "write"}
+        i = 0
+        while i < len(batch):
+            kind, payload, fut = batch[i]
+            if kind == "db":
+                if not done: conn.execute("BEGIN")
+                fn, args = payload
+                try:
+                    args = [(done[a] if a in done else a.result()) if isinstance(a, Future) else a for a in args]
+                    conn.execute("SAVEPOINT cmd")
+                    try:
+                        done[fut] = fn(conn, *args)
+                        conn.execute("RELEASE cmd")
+                    except Exception:
+                        conn.execute("ROLLBACK TO cmd")
+                        conn.execute("RELEASE cmd")
+                        raise
+                except Exception as e:
+                    print(f"Persistence Error ({getattr(fn, '__name__', fn)}): {e}")
+                    fut.set_exception(e)
+                    if not done: conn.execute("COMMIT") # Nothing else in it yet
+                i += 1
+                continue
+
+            self._commit(conn, done)
+            if kind == "stop":
+                fut.set_result(None)
+                for _, _, later in batch[i + 1:]: later.set_exception(RuntimeError("Persistence worker stopped"))
+                return False
+            if kind == "append":
+                # Join consecutive appends to the same file into one write
+                path, text = payload
+                futs, parts = [fut], [text]
+                while i + 1 < len(batch) and batch[i + 1][0] == "append" and batch[i + 1][1][0] == path:
+                    i += 1
+                    parts.append(batch[i][1][1])
+                    futs.append(batch[i][2])
+                self._finish(futs, self._append, path, "".join(parts))
+            elif kind == "write":
+                path, text = payload
+                if last_write[path] == i: self._finish([fut], self._replace, path, text)
+                else: fut.set_result(None) # Superseded later in this batch
+            else:
+                fn, args = payload
+                self._finish([fut], fn, *args)
+            i += 1
+        self._commit(conn, done)
+        return True
+
+    def _commit(self, conn, done):
+        if not done: return
+        try:
+            conn.execute("COMMIT")
+            for fut, result in done.items(): fut.set_result(result)
+        except Exception as e:
+            print(f"Persistence Commit Error: {e}")
+            if conn.in_transaction: conn.execute("ROLLBACK")
+            for fut in done: fut.set_exception(e)
+        done.clear()
+
+    @staticmethod
+    def _finish(futs, fn, *args):
+        try:
+            result = fn(*args)
+        except Exception as e:
+            print(f"Persistence Error ({getattr(fn, '__name__', fn)}): {e}")
+            for fut in futs: fut.set_exception(e)
+            return
+        for fut in futs: fut.set_result(result)
+
+    @staticmethod
+    def _replace(path, text):
+        tmp = path + ".tmp"
+        with open(tmp, 'w') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _append(path, text):
+        with open(path, 'a', newline='') as f: f.write(text)
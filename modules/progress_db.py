@@ -0,0 +1,273 @@
+import re
+import json
+import sqlite3
+
+import modules.five_bx_data as bx
+import modules.user_stats as user_stats
+from modules import metrics
+
+# Schema + migrations for user_progress.db (shared by the trainer and the data generators)
+
+# --- LEVEL SNAPSHOTS ---
+# history.prev_levels / new_levels hold the user's levels before and after the session as
+# "s_chart/s_level/c_chart/c_level", so undoing a session restores its levels instead of
+# replaying the progression rules over the history.
+
+def pack_levels(s_c, s_l, c_c, c_l):
+    return f"{s_c}/{s_l}/{c_c}/{c_l}"
+
+def unpack_levels(text):
+    """(s_chart, s_level, c_chart, c_level) or None."""
+    parts = str(text or "").split("/")
+    return tuple(parts) if len(parts) == 4 else None
+
+def levels_from_row(chart, level):
+    """Snapshot implied by a row's (start-of-session) chart/level fields."""
+    s_c, c_c = bx.split_component(chart)
+    s_l, c_l = bx.split_component(level)
+    return pack_levels(s_c, s_l, c_c, c_l)
+
+_LEVEL_NUMBERS = {name: num for num, name in bx.LEVEL_MAP.items()}
+_VERDICT_TARGET = re.compile(r"to C(\d+) ([A-D][+-]?)\)")
+
+def _levels_from_verdict(verdict, start):
+    """Snapshot a session ended on, read from its verdict ("... to C3 A+)"; MAINTAIN keeps the start)."""
+    s_c, s_l, c_c, c_l = unpack_levels(start)
+    strength, _, cardio = str(verdict or "").partition("Cardio")
+    s_hit, c_hit = _VERDICT_TARGET.search(strength), _VERDICT_TARGET.search(cardio)
+    if s_hit: s_c, s_l = s_hit.group(1), str(_LEVEL_NUMBERS[s_hit.group(2)])
+    if c_hit: c_c, c_l = c_hit.group(1), str(_LEVEL_NUMBERS[c_hit.group(2)])
+    return pack_levels(s_c, s_l, c_c, c_l)
+
+def _backfill_level_snapshots(c):
+    # Per user, oldest first. Sessions: prev = the row's own start-of-session fields; new = the
+    # next session's start, or what the verdict says when a MANUAL SET follows, or the user's
+    # current levels for their latest row. MANUAL SET rows store the levels that were set (as
+    # progression_engine.replay_history treats them): new = those, prev = the previous row's new.
+    current = {}
+    for uid, s_c, s_l, c_c, c_l in c.execute("SELECT id, strength_chart, strength_level, cardio_chart, cardio_level FROM users").fetchall():
+        current[uid] = pack_levels(s_c or "1", s_l or "1", c_c or "1", c_l or "1")
+    histories = {}
+    for hid, uid, chart, level, verdict in c.execute("SELECT id, user_id, chart, level, verdict FROM history ORDER BY user_id, timestamp, id").fetchall():
+        histories.setdefault(uid, []).append((hid, levels_from_row(chart, level), str(verdict or "").startswith("MANUAL SET"), verdict))
+    updates = []
+    for uid, rows in histories.items():
+        last_new = None
+        for i, (hid, own, manual, verdict) in enumerate(rows):
+            if manual:
+                prev, new = last_new or own, own
+            else:
+                nxt = rows[i + 1] if i + 1 < len(rows) else None
+                if nxt is None: new = current.get(uid, own)
+                elif nxt[2]: new = _levels_from_verdict(verdict, own)
+                else: new = nxt[1]
+                prev = own
+            updates.append((prev, new, hid))
+            last_new = new
+    c.executemany("UPDATE history SET prev_levels=?, new_levels=? WHERE id=?", updates)
+
+# --- SESSION WRITES (shared by the trainer and the headless runner; caller commits) ---
+@metrics.timed("db.insert_history_ms")
+def insert_history(conn, user_id, ts, chart, level, verdict, avg_hr, max_hr, rmssd, reps_list=None, stats_json=None,
+                   ex5_type="standard", ex5_duration=0, notes=None, prev_levels=None, new_levels=None, session_file=None):
+    """prev_levels / new_levels: (s_chart, s_level, c_chart, c_level) before / after the session.
+       Stored on the row so it can be undone by restoring a snapshot. prev defaults to chart/level.
+       session_file: SessionLogger.index() of the recording, linked to the new row.
+       Returns the new history id; user_stats is updated in the same transaction."""
+    reps_list = list(reps_list or [])
+    while len(reps_list) < 5: reps_list.append(0)
+    prev_snap = pack_levels(*prev_levels) if prev_levels else levels_from_row(chart, level)
+    new_snap = pack_levels(*new_levels) if new_levels else prev_snap
+    c = conn.execute("""INSERT INTO history (user_id, timestamp, chart, level, verdict, avg_hr, max_hr, end_rmssd, ex1, ex2, ex3, ex4, ex5, segment_stats, ex5_type, ex5_duration, notes, prev_levels, new_levels)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                     (user_id, ts, chart, level, verdict, int(avg_hr), int(max_hr), int(rmssd),
+                      reps_list[0], reps_list[1], reps_list[2], reps_list[3], reps_list[4], stats_json, ex5_type, ex5_duration, notes, prev_snap, new_snap))
+    new_id = c.lastrowid
+    user_stats.record_session(conn, new_id)
+    if session_file: record_session_file(conn, new_id, session_file)
+    return new_id
+
+def record_session_file(conn, history_id, entry):
+    conn.execute("""INSERT OR REPLACE INTO session_file (history_id, path, bytes, rows, start_mono, end_mono, segments)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                 (history_id, entry['path'], entry['bytes'], entry['rows'], entry['start_mono'], entry['end_mono'],
+                  json.dumps(entry['segments'])))
+
+def load_session_file(conn, history_id):
+    """The recording linked to a history row (same keys as SessionLogger.index()), or None."""
+    row = conn.execute("SELECT path, bytes, rows, start_mono, end_mono, segments FROM session_file WHERE history_id=?",
+                       (history_id,)).fetchone()
+    if not row: return None
+    return {'path': row[0], 'bytes': row[1], 'rows': row[2], 'start_mono': row[3], 'end_mono': row[4],
+            'segments': json.loads(row[5] or "[]")}
+
+def update_split_level(conn, user_id, s_c, s_l, c_c, c_l):
+    conn.execute("UPDATE users SET strength_chart=?, strength_level=?, cardio_chart=?, cardio_level=? WHERE id=?",
+                 (s_c, s_l, c_c, c_l, user_id))
+
+def merge_cardio_metrics(conn, history_id, cardio):
+    """Merges the (late) Ex 5 HRR result into the row's segment_stats JSON."""
+    row = conn.execute("SELECT segment_stats FROM history WHERE id=?", (history_id,)).fetchone()
+    if not row: return
+    data = json.loads(row[0]) if row[0] else {}
+    if not isinstance(data, dict): data = {"version": "2.0", "segments": data}
+    data['cardio'] = cardio
+    conn.execute("UPDATE history SET segment_stats=? WHERE id=?", (json.dumps(data), history_id))
+
+def init_db(db_file):
+    conn = sqlite3.connect(db_file)
+    try:
+        c = conn.cursor()
+        c.execute('''CREATE TABLE IF NOT EXISTS users (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     name TEXT UNIQUE,
+                     age INTEGER,
+                     linked_file TEXT,
+                     current_chart TEXT,
+                     current_level TEXT,
+                     goal_chart TEXT,
+                     goal_level TEXT,
+                     dob TEXT
+                     )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS history (
+                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     user_id INTEGER,
+                     timestamp TEXT,
+                     chart TEXT,
+                     level TEXT,
+                     verdict TEXT,
+                     avg_hr INTEGER,
+                     max_hr INTEGER,
+                     end_rmssd INTEGER,
+                     ex1 INTEGER,
+                     ex2 INTEGER,
+                     ex3 INTEGER,
+                     ex4 INTEGER,
+                     ex5 INTEGER,
+                     segment_stats TEXT,
+                     FOREIGN KEY(user_id) REFERENCES users(id)
+                     )''')
+
+        # --- MIGRATION: Check if ex1..ex5 and segment_stats exist ---
+        c.execute("PRAGMA table_info(history)")
+        cols = [info[1] for info in c.fetchall()]
+
+        if "ex1" not in cols:
+            print("Migrating DB: Adding rep columns to history...")
+            for i in range(1, 6):
+                try: c.execute(f"ALTER TABLE history ADD COLUMN ex{i} INTEGER DEFAULT 0")
+                except: pass
+
+        if "segment_stats" not in cols:
+            print("Migrating DB: Adding segment stats to history...")
+            try: c.execute("ALTER TABLE history ADD COLUMN segment_stats TEXT")
+            except: pass
+
+        # --- MIGRATION: Check for DOB in users ---
+        c.execute("PRAGMA table_info(users)")
+        u_cols = [info[1] for info in c.fetchall()]
+        if "dob" not in u_cols:
+            print("Migrating DB: Adding DOB to users...")
+            try: c.execute("ALTER TABLE users ADD COLUMN dob TEXT")
+            except: pass
+
+        # --- MIGRATION V9: Split Strength/Cardio ---
+        if "strength_chart" not in u_cols:
+             print("Migrating DB: Adding Split Levels to users...")
+             try:
+                 c.execute("ALTER TABLE users ADD COLUMN strength_chart TEXT DEFAULT '1'")
+                 c.execute("ALTER TABLE users ADD COLUMN strength_level TEXT DEFAULT '1'")
+                 c.execute("ALTER TABLE users ADD COLUMN cardio_chart TEXT DEFAULT '1'")
+                 c.execute("ALTER TABLE users ADD COLUMN cardio_level TEXT DEFAULT '1'")
+             except: pass
+
+        # --- MIGRATION V9.1: Fix Legacy History Chart IDs ("3" -> "3/3") ---
+        # This ensures old data works with new split logic
+        try:
+            # Update chart to chart/chart where it doesn't contain '/'
+            # We limit by length to avoid messing up anything weird, though checking for / is safest
+            c.execute("UPDATE history SET chart = chart || '/' || chart WHERE chart NOT LIKE '%/%'")
+        except Exception as e:
+            print("Migration V9.1 Error:", e)
+
+        # --- MIGRATION V11: Add Notes Column ---
+        if "notes" not in cols:
+            print("Migrating DB: Adding Notes to history...")
+            try: c.execute("ALTER TABLE history ADD COLUMN notes TEXT")
+            except: pass
+
+        # --- MIGRATION V12: Ex 5 Mode (Run/Walk/Jog time is stored in ex5_duration) ---
+        if "ex5_type" not in cols:
+            print("Migrating DB: Adding Ex 5 mode to history...")
+            try:
+                c.execute("ALTER TABLE history ADD COLUMN ex5_type TEXT DEFAULT 'standard'")
+                c.execute("ALTER TABLE history ADD COLUMN ex5_duration INTEGER DEFAULT 0")
+            except: pass
+
+        # --- MIGRATION V13: Per-user aggregates (kept current by modules/user_stats.py) ---
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_stats'")
+        if not c.fetchone():
+            print("Migrating DB: Building user_stats aggregates...")
+            c.execute('''CREATE TABLE user_stats (
+                         user_id INTEGER PRIMARY KEY,
+                         sessions INTEGER DEFAULT 0,
+                         training_secs INTEGER DEFAULT 0,
+                         strength_streak INTEGER DEFAULT 0,
+                         cardio_streak INTEGER DEFAULT 0,
+                         last_history_id INTEGER,
+                         last_avg_hr INTEGER,
+                         last_rmssd INTEGER,
+                         bests TEXT,
+                         FOREIGN KEY(user_id) REFERENCES users(id)
+                         )''')
+            user_stats.rebuild(conn)
+
+        # --- MIGRATION V14: Level snapshots for undo ---
+        if "prev_levels" not in cols:
+            print("Migrating DB: Adding level snapshots to history...")
+            try:
+                c.execute("ALTER TABLE history ADD COLUMN prev_levels TEXT")
+                c.execute("ALTER TABLE history ADD COLUMN new_levels TEXT")
+                _backfill_level_snapshots(c)
+            except Exception as e:
+                print("Migration V14 Error:", e)
+
+        # --- MIGRATION V15: Compacted session recordings (see modules/session_retention.py) ---
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='session_archive'")
+        if not c.fetchone():
+            print("Migrating DB: Adding session archive...")
+            c.execute('''CREATE TABLE session_archive (
+                         id INTEGER PRIMARY KEY AUTOINCREMENT,
+                         user_id INTEGER,
+                         history_id INTEGER,
+                         source_file TEXT UNIQUE,
+                         started TEXT,
+                         tier INTEGER,
+                         samples INTEGER,
+                         raw_bytes INTEGER,
+                         series BLOB,
+                         exercises TEXT,
+                         FOREIGN KEY(user_id) REFERENCES users(id),
+                         FOREIGN KEY(history_id) REFERENCES history(id)
+                         )''')
+            c.execute("CREATE INDEX idx_session_archive_history ON session_archive(history_id)")
+            c.execute("CREATE INDEX idx_session_archive_user ON session_archive(user_id, started)")
+
+        # --- MIGRATION V16: History row -> session recording (path, size, per-exercise byte offsets) ---
+        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='session_file'")
+        if not c.fetchone():
+            print("Migrating DB: Adding session file index...")
+            c.execute('''CREATE TABLE session_file (
+                         history_id INTEGER PRIMARY KEY,
+                         path TEXT,
+                         bytes INTEGER,
+                         rows INTEGER,
+                         start_mono REAL,
+                         end_mono REAL,
+                         segments TEXT,
+                         FOREIGN KEY(history_id) REFERENCES history(id)
+                         )''')
+
+        conn.commit()
+    finally:
+        conn.close()
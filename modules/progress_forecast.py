@@ -0,0 +1,159 @@
+import datetime
+
+import modules.five_bx_data as bx
+
+HUBER_K = 1.5        # Residual cut-off (in robust std units) before a session is down-weighted
+IRLS_ITERATIONS = 5  # Enough for the Huber weights to settle on short histories
+MIN_POINTS = 3
+MAX_FORECAST_DAYS = 3650
+
+
+class ComponentTrend:
+    """
+    Weighted least-squares trend of score vs days for ONE component (Strength or Cardio).
+    Stores only weighted sufficient statistics so new sessions are an O(1) update.
+    """
+    def __init__(self):
+        self.sw = 0.0
+        self.swx = 0.0
+        self.swy = 0.0
+        self.swxx = 0.0
+        self.swxy = 0.0
+        self.n = 0
+        self.scale = 1.0 # Robust residual scale from the last full fit
+
+    def fit(self, days, scores):
+        """Vectorised robust (Huber IRLS) fit over the whole history."""
+        import numpy as np # Deferred: only needed once a user with history logs in
+        x = np.asarray(days, dtype=float)
+        y = np.asarray(scores, dtype=float)
+        w = np.ones_like(x)
+        for _ in range(IRLS_ITERATIONS):
+            slope, intercept = self._solve(x, y, w)
+            resid = y - (intercept + slope * x)
+            mad = np.median(np.abs(resid - np.median(resid))) if len(resid) else 0.0
+            self.scale = max(1.4826 * mad, 1.0) # Scores are integers, floor the scale at 1 level
+            u = np.abs(resid) / (HUBER_K * self.scale)
+            w = np.where(u <= 1.0, 1.0, 1.0 / np.maximum(u, 1e-9))
+
+        self.n = len(x)
+        self.sw = float(w.sum())
+        self.swx = float((w * x).sum())
+        self.swy = float((w * y).sum())
+        self.swxx = float((w * x * x).sum())
+        self.swxy = float((w * x * y).sum())
+
+    def _solve(self, x, y, w):
+        sw, swx, swy = w.sum(), (w * x).sum(), (w * y).sum()
+        swxx, swxy = (w * x * x).sum(), (w * x * y).sum()
+        denom = sw * swxx - swx * swx
+        if denom <= 0: return 0.0, (swy / sw if sw else 0.0)
+        slope = float((sw * swxy - swx * swy) / denom)
+        return slope, float((swy - slope * swx) / sw)
+
+    def add(self, day, score):
+        """Incremental update: Huber weight the new point against the current fit."""
+        w = 1.0
+        line = self.line()
+        if line:
+            slope, intercept = line
+            u = abs(score - (intercept + slope * day)) / (HUBER_K * self.scale)
+            if u > 1.0: w = 1.0 / u
+        self.n += 1
+        self.sw += w
+        self.swx += w * day
+        self.swy += w * score
+        self.swxx += w * day * day
+        self.swxy += w * day * score
+
+    def line(self):
+        """Returns (slope per day, intercept) or None if not enough data."""
+        if self.n < MIN_POINTS or self.sw <= 0: return None
+        denom = self.sw * self.swxx - self.swx * self.swx
+        if denom <= 1e-9: return None
+        slope = (self.sw * self.swxy - self.swx * self.swy) / denom
+        return slope, (self.swy - slope * self.swx) / self.sw
+
+
+class ProgressForecaster:
+    """
+    Fits each user's Strength and Cardio score (bx.get_total_score) against time and
+    predicts when the next level, the age target and the elite target will be reached.
+    """
+    def __init__(self, user_id=None, age=30):
+        self.user_id = user_id
+        self.age = age
+        self.origin = None # Datetime of the first session (day 0)
+        self.trends = {"Strength": ComponentTrend(), "Cardio": ComponentTrend()}
+
+    def _day(self, ts):
+        if isinstance(ts, str): ts = datetime.datetime.fromisoformat(ts)
+        if self.origin is None: self.origin = ts
+        return (ts - self.origin).total_seconds() / 86400.0
+
+    def fit(self, history_rows):
+        """history_rows: dicts/rows with timestamp, chart, level (any order)."""
+        points = []
+        for r in history_rows:
+            try:
+                ts = datetime.datetime.fromisoformat(r['timestamp']) # ~10x faster than strptime
+                s_c, c_c = bx.split_component(r['chart'])
+                s_l, c_l = bx.split_component(r['level'])
+                points.append((ts, bx.get_total_score(s_c, s_l), bx.get_total_score(c_c, c_l)))
+            except (ValueError, TypeError, KeyError):
+                continue
+        points.sort(key=lambda p: p[0])
+        if not points: return self
+
+        self.origin = points[0][0]
+        days = [(p[0] - self.origin).total_seconds() / 86400.0 for p in points]
+        self.trends["Strength"].fit(days, [p[1] for p in points])
+        self.trends["Cardio"].fit(days, [p[2] for p in points])
+        return self
+
+    def add_session(self, timestamp, chart, level):
+        """Call after db_add_history with the stored chart/level fields."""
+        try:
+            day = self._day(timestamp)
+            s_c, c_c = bx.split_component(chart)
+            s_l, c_l = bx.split_component(level)
+            self.trends["Strength"].add(day, bx.get_total_score(s_c, s_l))
+            self.trends["Cardio"].add(day, bx.get_total_score(c_c, c_l))
+        except (ValueError, TypeError):
+            pass
+
+    def _eta(self, component, current_score, target_score, now):
+        if current_score >= target_score: return "Reached"
+        line = self.trends[component].line()
+        if not line or self.origin is None: return None
+        slope = line[0]
+        if slope <= 0: return None # Flat or declining - no honest forecast
+        days = (target_score - current_score) / slope
+        if days > MAX_FORECAST_DAYS: return None
+        return now + datetime.timedelta(days=days)
+
+    def forecast(self, s_chart, s_level, c_chart, c_level, goal=None, now=None):
+        """
+        Returns {component: {'rate_per_week', 'next_level', 'age_target', 'elite_target', 'goal'}}
+        Dates are datetime objects, "Reached", or None when no upward trend exists.
+        """
+        if now is None: now = datetime.datetime.now()
+        targets = {"age_target": bx.get_age_goal(self.age), "elite_target": bx.get_elite_goal(self.age), "goal": goal}
+        current = {"Strength": (s_chart, s_level), "Cardio": (c_chart, c_level)}
+
+        result = {}
+        for comp, (chart, level) in current.items():
+            score = bx.get_total_score(chart, level)
+            line = self.trends[comp].line()
+            res = {"rate_per_week": round(line[0] * 7, 2) if line else None}
+            res["next_level"] = self._eta(comp, score, score + 1, now)
+            for key, target in targets.items():
+                res[key] = self._eta(comp, score, bx.get_total_score(*target), now) if target else None
+            result[comp] = res
+        return result
+
+
+def format_eta(eta):
+    if eta is None: return "--"
+    if eta == "Reached": return "✅"
+    return eta.strftime("%d %b %Y")
@@ -0,0 +1,428 @@
+"""
+Pure (side-effect free) 5BX progression rules.
+
+finish_workout() and the batch replay below both run through evaluate_strength() /
+evaluate_cardio(), so changing a rule here changes it everywhere. All chart data comes
+from an in-memory ChartTable, which is what makes replaying thousands of sessions per
+second possible (the bx.* helpers open a SQLite connection per call).
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import collections
+
+import modules.five_bx_data as bx
+
+# Rule set used by the trainer. Pass a modified copy to evaluate a variant.
+DEFAULT_RULES = {
+    "demotion_strikes": 3,  # Consecutive misses that trigger a demotion
+    "leapfrog": True,       # Allow jumping several levels on a strong session
+    "fail_lookback": 10     # History rows inspected when counting strikes
+}
+
+MAX_CHART, MAX_LEVEL = "6", "12"
+DEFAULT_TARGETS = [5, 5, 5, 5, 100, 0, 0]
+
+
+class ChartTable:
+    """In-memory copy of ExerciseTimes with the same lookups as the bx helpers."""
+    def __init__(self, rows):
+        # rows: (chart, level, ex1, ex2, ex3, ex4, ex5, ex5_run, ex5_walk)
+        self.rows = {}
+        self.by_chart = collections.defaultdict(list)
+        for r in rows:
+            chart, level = int(r[0]), int(r[1])
+            vals = [v or 0 for v in r[2:9]]
+            self.rows[(chart, level)] = vals
+            self.by_chart[chart].append((level, vals))
+        for chart in self.by_chart:
+            self.by_chart[chart].sort(key=lambda x: x[0], reverse=True) # Hardest first
+
+    @classmethod
+    def load(cls, db_name=None):
+        db_name = db_name or bx.DB_NAME
+        if not os.path.exists(db_name): return cls([])
+        conn = sqlite3.connect(db_name)
+        try:
+            rows = conn.execute("SELECT chart, level, ex1, ex2, ex3, ex4, ex5, ex5_run, ex5_walk FROM ExerciseTimes").fetchall()
+        finally:
+            conn.close()
+        return cls(rows)
+
+    def targets(self, chart, level):
+        vals = self.rows.get((int(chart), int(level)))
+        return list(vals) if vals else list(DEFAULT_TARGETS)
+
+    def time_target(self, chart, level, mode):
+        col = 5 if "Run" in mode else 6
+        vals = self.rows.get((int(chart), int(level)))
+        if vals and vals[col]: return vals[col]
+        return 600
+
+    def strength_placement(self, reps, chart):
+        for level, vals in self.by_chart.get(int(chart), []):
+            if all(vals[i] <= reps[i] for i in range(4)):
+                return str(int(chart)), str(level)
+        return str(chart), "1"
+
+    def cardio_placement(self, reps, chart):
+        for level, vals in self.by_chart.get(int(chart), []):
+            if vals[4] <= reps[4]:
+                return str(int(chart)), str(level)
+        return str(chart), "1"
+
+    def cardio_time_placement(self, time_secs, mode, chart):
+        col = 5 if "Run" in mode else 6
+        for level, vals in self.by_chart.get(int(chart), []):
+            if vals[col] > 0 and vals[col] >= time_secs:
+                return str(int(chart)), str(level)
+        return str(chart), "1"
+
+
+_TABLE = None
+
+def get_chart_table():
+    """Shared table for the trainer (ExerciseTimes never changes at runtime)."""
+    global _TABLE
+    if _TABLE is None: _TABLE = ChartTable.load()
+    return _TABLE
+
+
+def is_alt_cardio(mode):
+    mode_str = str(mode).lower()
+    return bool(mode) and any(m in mode_str for m in ["run", "walk", "jog"]) and "stationary" not in mode_str
+
+
+# --- STRIKE COUNTING ---
+def breaks_fail_streak(row, component="Strength"):
+    """True if this session ends a fail streak (an UP, or a Maintain at Chart 6 A+)."""
+    v_str = row['verdict'] or ""
+    # Format: "Strength (MAINTAIN) / Cardio (UP)" or "Strength (...) | Cardio (...)"
+    part = v_str
+    if " | " in v_str:
+        parts = v_str.split(" | ")
+        if len(parts) >= 2:
+            part = parts[0] if component == "Strength" else parts[1]
+    elif "/" in v_str: # Legacy support
+        parts = v_str.split("/")
+        if len(parts) >= 2:
+            part = parts[0] if component == "Strength" else parts[1]
+
+    if "UP" in part or "PROMOTION" in part or "LEAPFROG" in part or "LEVEL UP" in part:
+        return True # Success breaks the streak
+
+    if "MAINTAIN" in part:
+        s_c, c_c = bx.split_component(row['chart'])
+        s_l, c_l = bx.split_component(row['level'])
+        chart, level = (s_c, s_l) if component == "Strength" else (c_c, c_l)
+        if str(chart) == MAX_CHART and str(level) == MAX_LEVEL:
+            return True # Max Level Pass
+    # Maintain below the top, Demotion, Down, etc.
+    return False
+
+
+def count_consecutive_fails(rows, component="Strength"):
+    """
+    Count consecutive fails/non-upgrades backwards in history.
+    rows: newest first, each with chart, level, verdict.
+    Stops when it finds an UP, or a Max Level Maintain (Pass).
+    """
+    fails = 0
+    for r in rows:
+        if breaks_fail_streak(r, component): break
+        fails += 1
+    return fails
+
+
+# --- VERDICT TEXT ---
+def describe_progression(old_c, old_l, new_c, new_l, status, score_old, score_new, strikes=0, rules=DEFAULT_RULES):
+    if status == "DOWN":
+        return f"DEMOTION to C{new_c} {bx.get_level_display(new_l)}"
+    if status != "UP":
+        loc = f"C{old_c} {bx.get_level_display(old_l)}"
+        if strikes > 0:
+            return f"MAINTAIN {loc} ({strikes}/{rules['demotion_strikes']} Strikes)"
+        return f"MAINTAIN {loc}"
+
+    diff = score_new - score_old
+    dest = f"C{new_c} {bx.get_level_display(new_l)}"
+    if diff > 1: return f"LEAPFROG to {dest}"
+    if str(new_c) != str(old_c): return f"PROMOTION to {dest}"
+    return f"LEVEL UP to {dest}"
+
+
+def _up_line(prefix, new_c, new_l, steps):
+    dest = f"C{new_c} {bx.get_level_display(new_l)}"
+    if steps > 1:
+        return f"{prefix}: 🚀 PROMOTION! (Jumped {steps} Levels to {dest})"
+    return f"{prefix}: ✅ LEVEL UP! (Now at {dest})"
+
+
+def _promote(chart, level, perf_c, perf_l, rules):
+    """Meeting the target always earns at least the next level; leapfrog may go further."""
+    next_c, next_l = bx.get_next_level(chart, level)
+    if not rules.get("leapfrog", True) or bx.get_total_score(perf_c, perf_l) < bx.get_total_score(next_c, next_l):
+        return next_c, next_l
+    return perf_c, perf_l
+
+
+def _result(chart, level, new_c, new_l, status, missed, streak, report, rules):
+    score_old = bx.get_total_score(chart, level)
+    score_new = bx.get_total_score(new_c, new_l)
+    strikes = streak if (missed > 0 and status == "MAINTAIN") else 0
+    return {
+        "status": status,
+        "old": (str(chart), str(level)),
+        "new": (str(new_c), str(new_l)),
+        "missed": missed,
+        "streak": streak,
+        "verdict": describe_progression(chart, level, new_c, new_l, status, score_old, score_new, strikes, rules),
+        "report": report
+    }
+
+
+# --- COMPONENT EVALUATION ---
+def evaluate_strength(chart, level, reps, targets, prior_fails, table, rules=DEFAULT_RULES):
+    """Strength verdict for Ex 1-4. prior_fails: count_consecutive_fails() BEFORE this session."""
+    chart, level = str(chart), str(level)
+    report = []
+    status = "MAINTAIN"
+    new_c, new_l = chart, level
+    streak = 0
+    perf_c, perf_l = table.strength_placement(reps, chart)
+    missed = sum(1 for i in range(4) if reps[i] < targets[i])
+
+    if missed == 0:
+        perf_c, perf_l = _promote(chart, level, perf_c, perf_l, rules)
+        steps = bx.get_total_score(perf_c, perf_l) - bx.get_total_score(chart, level)
+        if steps > 0:
+            status = "UP"
+            new_c, new_l = perf_c, perf_l
+            report.append(_up_line("💪 Strength", new_c, new_l, steps))
+    else:
+        streak = 1 + prior_fails
+        if streak >= rules['demotion_strikes']:
+            status = "DOWN"
+            # Logic: Drop to performance level.
+            # Constraint: Don't drop CHART unless we were already at the bottom (Level 1 / D-)
+            if level != "1" and int(perf_c) < int(chart):
+                perf_c, perf_l = chart, "1"
+            elif level == "1" and perf_l == "1":
+                l1_targets = table.targets(chart, "1")
+                failed_l1 = any(reps[i] < l1_targets[i] for i in range(4))
+                if failed_l1 and int(chart) > 1:
+                    perf_c, perf_l = str(int(chart) - 1), "12" # A+
+            new_c, new_l = perf_c, perf_l
+            report.append(f"💪 Strength: 📉 DEMOTION: {streak} Consecutive Failures. Dropped to C{new_c} {bx.get_level_display(new_l)}")
+        else:
+            report.append(f"💪 Strength: Missed Target (Streak {streak}/{rules['demotion_strikes']})")
+
+    return _result(chart, level, new_c, new_l, status, missed, streak, report, rules)
+
+
+def evaluate_cardio(chart, level, reps, targets, mode, prior_fails, table, rules=DEFAULT_RULES):
+    """
+    Cardio verdict for Ex 5. For Run/Walk/Jog reps[4] / targets[4] are times in seconds
+    (lower is better), otherwise stationary run reps.
+    """
+    chart, level = str(chart), str(level)
+    report = []
+    status = "MAINTAIN"
+    new_c, new_l = chart, level
+    streak = 0
+    missed = 0
+    prefix = f"🏃 Cardio ({mode})"
+
+    if is_alt_cardio(mode):
+        user_time, target_time = reps[4], targets[4]
+        report.append(f"{prefix}: {user_time // 60}:{user_time % 60:02d} (Target {target_time // 60}:{target_time % 60:02d})")
+
+        if user_time <= target_time:
+            perf_c, perf_l = table.cardio_time_placement(user_time, mode, chart)
+            perf_c, perf_l = _promote(chart, level, perf_c, perf_l, rules)
+            steps = bx.get_total_score(perf_c, perf_l) - bx.get_total_score(chart, level)
+            if steps > 0:
+                status = "UP"
+                new_c, new_l = perf_c, perf_l
+                report.append(_up_line(prefix, new_c, new_l, steps))
+        else:
+            missed = 1
+            streak = 1 + prior_fails
+            if streak >= rules['demotion_strikes']:
+                status = "DOWN"
+                perf_c, perf_l = table.cardio_time_placement(user_time, mode, chart)
+                if level != "1" and int(perf_c) < int(chart):
+                    perf_c, perf_l = chart, "1"
+                elif level == "1":
+                    # Confirm explicitly against the L1 time before dropping a chart
+                    l1_time = table.time_target(chart, "1", mode)
+                    if user_time > l1_time and int(chart) > 1:
+                        perf_c, perf_l = str(int(chart) - 1), "12"
+                    else:
+                        perf_c, perf_l = chart, "1"
+                new_c, new_l = perf_c, perf_l
+                report.append(f"{prefix}: 📉 DEMOTIION: {streak} Consecutive Failures. Dropped to C{new_c} {bx.get_level_display(new_l)}")
+            else:
+                report.append(f"{prefix}: Missed Target (Streak {streak}/{rules['demotion_strikes']})")
+    else:
+        if reps[4] < targets[4]: missed = 1
+
+        if missed == 0:
+            perf_c, perf_l = table.cardio_placement(reps, chart)
+            perf_c, perf_l = _promote(chart, level, perf_c, perf_l, rules)
+            steps = bx.get_total_score(perf_c, perf_l) - bx.get_total_score(chart, level)
+            if steps > 0:
+                status = "UP"
+                new_c, new_l = perf_c, perf_l
+                report.append(_up_line(prefix, new_c, new_l, steps))
+            else:
+                report.append(f"{prefix}: MAINTAIN (Max Level or Scored Equal)")
+        else:
+            streak = 1 + prior_fails
+            if streak >= rules['demotion_strikes']:
+                status = "DOWN"
+                perf_c, perf_l = table.cardio_placement(reps, chart)
+                if level != "1" and int(perf_c) < int(chart):
+                    perf_c, perf_l = chart, "1"
+                elif level == "1":
+                    l1_targets = table.targets(chart, "1")
+                    if reps[4] < l1_targets[4] and int(chart) > 1:
+                        perf_c, perf_l = str(int(chart) - 1), "12"
+                    else:
+                        perf_c, perf_l = chart, "1"
+                new_c, new_l = perf_c, perf_l
+                report.append(f"{prefix}: 📉 DEMOTIION: {streak} Consecutive Failures. Dropped to C{new_c} {bx.get_level_display(new_l)}")
+            else:
+                report.append(f"{prefix}: Missed Target (Streak {streak}/{rules['demotion_strikes']})")
+
+    return _result(chart, level, new_c, new_l, status, missed, streak, report, rules)
+
+
+def format_verdict(s_res, c_res):
+    return f"Strength ({s_res['verdict']}) | Cardio ({c_res['verdict']})"
+
+
+def session_reason(s_res, c_res):
+    def component_reason(name, res):
+        if res['status'] == "UP": return f"{name} improved!"
+        if res['status'] == "DOWN": return f"{name} level reduced to match ability."
+        if res['missed'] > 0: return f"{name} targets missed."
+        return f"{name} maintained."
+
+    s_reason = component_reason("Strength", s_res)
+    c_reason = component_reason("Cardio", c_res)
+    if s_reason != c_reason: return f"{s_reason} {c_reason}"
+
+    # Combined
+    if s_res['status'] == "UP": return "Great Job! Both Strength and Cardio improved!"
+    if s_res['status'] == "DOWN": return "Both levels adjusted to match current performance."
+    if s_res['missed'] > 0: return "Standards not met. Improvement required to advance."
+    return "Maintained status in both areas. Keep pushing!"
+
+
+def session_targets(table, s_chart, s_level, c_chart, c_level, mode):
+    """Targets list as the trainer builds it: Ex 1-4 from Strength, Ex 5 from Cardio for the chosen mode."""
+    s_targets = table.targets(s_chart, s_level)
+    c_targets = table.targets(c_chart, c_level)
+    ex5 = c_targets[4]
+    if is_alt_cardio(mode):
+        ex5 = c_targets[5] if "Run" in str(mode) else c_targets[6]
+    return s_targets[:4] + [ex5]
+
+
+# --- BATCH REPLAY ---
+def replay_history(rows, rules=DEFAULT_RULES, table=None, start=None):
+    """
+    Replays a user's sessions (oldest first) under a rule set.
+    rows: history dicts (chart, level, verdict, ex1..ex5, ex5_type, ex5_duration).
+    start: optional (s_c, s_l, c_c, c_l); defaults to the first row's starting levels.
+    Returns (path, final_state) where path holds one entry per replayed row.
+    """
+    table = table or get_chart_table()
+    state = start
+    recent = collections.deque(maxlen=rules.get('fail_lookback', 10)) # Newest first
+    path = []
+
+    for r in rows:
+        s_c, c_c = bx.split_component(r['chart'])
+        s_l, c_l = bx.split_component(r['level'])
+        if state is None: state = (s_c, s_l, c_c, c_l)
+
+        verdict = r['verdict'] or ""
+        if verdict.startswith("MANUAL SET"):
+            # Manual override rows store the levels that were set
+            state = (s_c, s_l, c_c, c_l)
+            recent.appendleft({'chart': r['chart'], 'level': r['level'], 'verdict': verdict})
+            path.append({'id': r.get('id'), 'timestamp': r.get('timestamp'), 'state': state, 'verdict': verdict})
+            continue
+
+        mode = r.get('ex5_type') or "Standard"
+        reps = [r.get(f'ex{i}') or 0 for i in range(1, 6)]
+        if is_alt_cardio(mode): reps[4] = r.get('ex5_duration') or 0
+
+        cur_s_c, cur_s_l, cur_c_c, cur_c_l = state
+        targets = session_targets(table, cur_s_c, cur_s_l, cur_c_c, cur_c_l, mode)
+        s_res = evaluate_strength(cur_s_c, cur_s_l, reps, targets, count_consecutive_fails(recent, "Strength"), table, rules)
+        c_res = evaluate_cardio(cur_c_c, cur_c_l, reps, targets, mode, count_consecutive_fails(recent, "Cardio"), table, rules)
+        verdict = format_verdict(s_res, c_res)
+
+        recent.appendleft({'chart': f"{cur_s_c}/{cur_c_c}", 'level': f"{cur_s_l}/{cur_c_l}", 'verdict': verdict})
+        state = s_res['new'] + c_res['new']
+        path.append({'id': r.get('id'), 'timestamp': r.get('timestamp'), 'state': state, 'verdict': verdict})
+
+    return path, state
+
+
+def load_user_histories(db_file, user=None):
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    try:
+        sql = """SELECT u.name AS user_name, h.* FROM history h JOIN users u ON u.id = h.user_id"""
+        args = ()
+        if user:
+            sql += " WHERE u.name=?"
+            args = (user,)
+        histories = collections.OrderedDict()
+        for row in conn.execute(sql + " ORDER BY u.name, h.id ASC", args):
+            histories.setdefault(row['user_name'], []).append(dict(row))
+        return histories
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay 5BX history under different progression rules.")
+    parser.add_argument("--db", default="databases/user_progress.db")
+    parser.add_argument("--user", help="Only replay this user")
+    parser.add_argument("--rules", action="append", default=[],
+                        help='Rule overrides as JSON, e.g. \'{"demotion_strikes": 2}\' (repeat to compare variants)')
+    args = parser.parse_args(argv)
+
+    variants = [("default", dict(DEFAULT_RULES))]
+    for i, raw in enumerate(args.rules, 1):
+        rules = dict(DEFAULT_RULES)
+        rules.update(json.loads(raw))
+        variants.append((f"variant {i}", rules))
+
+    table = get_chart_table()
+    histories = load_user_histories(args.db, args.user)
+    total_rows = sum(len(h) for h in histories.values())
+
+    for label, rules in variants:
+        t0 = time.perf_counter()
+        finals = {name: replay_history(rows, rules, table)[1] for name, rows in histories.items()}
+        elapsed = time.perf_counter() - t0
+        rate = total_rows / elapsed if elapsed > 0 else 0
+        print(f"== {label} {json.dumps(rules)} ({total_rows} sessions, {rate:,.0f}/s)")
+        for name, state in finals.items():
+            if not state: continue
+            s_c, s_l, c_c, c_l = state
+            print(f"   {name}: Strength C{s_c} {bx.get_level_display(s_l)} | Cardio C{c_c} {bx.get_level_display(c_l)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import time
+
+# Readiness thresholds (relative to the calibrated profile)
+# HR must settle within HR_MARGIN_BPM of resting and RMSSD must rebound above
+# RMSSD_FRACTION of baseline, both held for HOLD_SECS before we call "Ready".
+HR_MARGIN_BPM = 20
+RMSSD_FRACTION = 0.5
+HOLD_SECS = 5
+MAX_REST_SECS = 120   # Never hold the athlete longer than this
+EMA_ALPHA = 0.3       # Smoothing for the 1 Hz stream (higher = more responsive)
+
+
+class RecoveryTracker:
+    """
+    Streaming between-exercise recovery monitor.
+    Feed it one (hr, rmssd) sample per tick; memory use is constant regardless
+    of how long the rest lasts (EMA state + a handful of running extremes).
+    """
+    def __init__(self, resting_hr, baseline_rmssd, exercise_name="",
+                 hr_margin=HR_MARGIN_BPM, rmssd_fraction=RMSSD_FRACTION,
+                 hold_secs=HOLD_SECS, max_rest_secs=MAX_REST_SECS):
+        self.exercise_name = exercise_name
+        self.resting_hr = resting_hr or 60
+        self.baseline_rmssd = baseline_rmssd or 40
+        self.hr_target = self.resting_hr + hr_margin
+        self.rmssd_target = self.baseline_rmssd * rmssd_fraction
+        self.hold_secs = hold_secs
+        self.max_rest_secs = max_rest_secs
+
+        self.start_time = None
+        self.last_time = None
+        self.samples = 0
+
+        # Smoothed curves
+        self.hr_ema = None
+        self.rmssd_ema = None
+
+        # Running extremes
+        self.start_hr = 0
+        self.peak_hr = 0
+        self.min_hr = 0
+        self.peak_rmssd = 0.0
+        self.hr_at_60 = None
+
+        # Readiness
+        self.hold_start = None
+        self.ready_secs = None
+        self.state = "RECOVERING"
+
+    def update(self, hr, rmssd, now=None):
+        """Consume one sample. Returns the current state string."""
+        if now is None: now = time.time()
+        if hr <= 0: return self.state
+
+        if self.start_time is None:
+            self.start_time = now
+            self.start_hr = hr
+            self.min_hr = hr
+        self.last_time = now
+        self.samples += 1
+        elapsed = now - self.start_time
+
+        # 1. Smooth
+        if self.hr_ema is None:
+            self.hr_ema = float(hr)
+            self.rmssd_ema = float(rmssd)
+        else:
+            self.hr_ema += EMA_ALPHA * (hr - self.hr_ema)
+            self.rmssd_ema += EMA_ALPHA * (rmssd - self.rmssd_ema)
+
+        # 2. Extremes
+        self.peak_hr = max(self.peak_hr, hr)
+        self.min_hr = min(self.min_hr, hr)
+        self.peak_rmssd = max(self.peak_rmssd, self.rmssd_ema)
+        if self.hr_at_60 is None and elapsed >= 60:
+            self.hr_at_60 = self.hr_ema
+
+        # 3. Readiness (must hold for hold_secs to ignore single-beat dips)
+        if self.ready_secs is None:
+            hr_ok = self.hr_ema <= self.hr_target
+            hrv_ok = self.rmssd_ema >= self.rmssd_target
+            if hr_ok and hrv_ok:
+                if self.hold_start is None: self.hold_start = now
+                if (now - self.hold_start) >= self.hold_secs:
+                    self.ready_secs = int(self.hold_start - self.start_time)
+                    self.state = "READY"
+            else:
+                self.hold_start = None
+                if elapsed >= self.max_rest_secs:
+                    self.state = "LIMIT"
+        return self.state
+
+    def elapsed(self):
+        if self.start_time is None: return 0
+        return int(self.last_time - self.start_time)
+
+    def get_advice(self):
+        """Returns (text, color) for the live advice label."""
+        if self.hr_ema is None:
+            return "⏳ Recovering...", "#95a5a6"
+        if self.state == "READY":
+            return f"✅ Recovered ({self.ready_secs}s) - Ready for next exercise", "#2ecc71"
+        if self.state == "LIMIT":
+            return "➡️ Rest limit reached - Continue when ready", "#f1c40f"
+
+        hr_gap = int(round(self.hr_ema - self.hr_target))
+        if hr_gap > 0:
+            return f"⏳ Recovering... HR {hr_gap} bpm above target", "#e67e22"
+        return f"⏳ Recovering... HRV {int(self.rmssd_ema)}/{int(self.rmssd_target)} ms", "#e67e22"
+
+    def summary(self):
+        """Compact per-exercise recovery metrics for segment_stats."""
+        if self.samples == 0: return None
+        hr_end = int(round(self.hr_ema))
+        rebound = round(self.peak_rmssd / self.baseline_rmssd, 2) if self.baseline_rmssd else 0
+        return {
+            "rest_secs": self.elapsed(),
+            "ready_secs": self.ready_secs,
+            "start_hr": self.start_hr,
+            "end_hr": hr_end,
+            "hr_drop": self.start_hr - hr_end,
+            "hr_drop_60": int(round(self.start_hr - self.hr_at_60)) if self.hr_at_60 is not None else None,
+            "rmssd_rebound": rebound
+        }
@@ -0,0 +1,88 @@
+import csv
+import time
+import bisect
+import datetime
+
+# Plays a recorded session CSV (ant_sessions/*.csv) back through the AntHrvSensor
+# interface (start / stop / running / status / get_data), so the engines can be driven
+# without a USB stick. Time comes from `clock` (seconds), which lets the headless runner
+# replay an 11 minute workout at any speed.
+
+
+def _num(value, cast, default=0):
+    try:
+        return cast(float(value)) if cast is int else cast(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class ReplaySensor:
+    def __init__(self, path, clock=time.monotonic, loop=True):
+        self.path = path
+        self.clock = clock
+        self.loop = loop # Wrap around when the workout outlasts the recording
+        self.running = False
+        self.status = "Initializing"
+        self.times = []
+        self.rows = []
+        self.t0 = 0.0
+
+    def _load(self):
+        times, rows, start, prev = [], [], None, None
+        with open(self.path, newline="") as f:
+            for row in csv.DictReader(f):
+                try:
+                    tod = datetime.datetime.strptime(row.get("Timestamp", ""), "%H:%M:%S.%f")
+                except ValueError:
+                    continue
+                secs = tod.hour * 3600 + tod.minute * 60 + tod.second + tod.microsecond / 1e6
+                if prev is not None and secs < prev - 43200: secs += 86400 # Past midnight
+                if start is None: start = secs
+                prev = secs
+                times.append(secs - start)
+                rows.append({
+                    'bpm': _num(row.get("HR_BPM"), int),
+                    'rmssd': _num(row.get("RMSSD_MS"), float, 0.0),
+                    'raw_rr_ms': _num(row.get("Raw_RR_MS"), int),
+                    'raw_hex': row.get("Raw_Packet_Hex") or "",
+                    'battery_volts': _num(row.get("Battery_V"), float, None),
+                })
+        return times, rows
+
+    def start(self):
+        if self.running: return
+        self.times, self.rows = self._load()
+        if not self.rows: raise ValueError(f"No samples in {self.path}")
+        self.t0 = self.clock()
+        self.running = True
+        self.status = "Active"
+
+    def stop(self):
+        self.running = False
+
+    def get_data(self):
+        row = {'bpm': 0, 'rmssd': 0.0, 'raw_rr_ms': 0, 'raw_hex': "", 'battery_volts': None}
+        if self.running:
+            t = self.clock() - self.t0
+            end = self.times[-1]
+            if t > end and not self.loop:
+                self.status = "Signal Lost"
+            else:
+                if self.loop and end > 0: t %= end + 1.0
+                row = self.rows[max(0, bisect.bisect_right(self.times, t) - 1)]
+        return {
+            'bpm': row['bpm'],
+            'rmssd': row['rmssd'],
+            'rr_ms': row['raw_rr_ms'],
+            'raw_rr_ms': row['raw_rr_ms'],
+            'raw_hex': row['raw_hex'],
+            'status': self.status,
+            'manufacturer': "Replay",
+            'serial': None,
+            'battery_volts': row['battery_volts'],
+            'battery_state': "Unknown",
+            'uptime_hours': 0.0,
+            'beats_recovered': 0,
+            'beats_interpolated': 0,
+            'beats_lost': 0
+        }
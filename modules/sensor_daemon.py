@@ -0,0 +1,313 @@
+"""
+Local sensor daemon - one process owns the ANT+ USB stick and shares it.
+
+    python -m modules.sensor_daemon [--socket PATH]
+
+The trainer, the calibration wizard and the headless runner get their sensor from
+create_sensor(): a SensorClient when the daemon is running, otherwise a direct
+AntHrvSensor as before. Switching screens then just drops / opens a socket instead of
+releasing and re-opening the USB device.
+
+Hot data (every HR packet: bpm, RR, RMSSD, raw packet) goes into a shared memory ring
+that clients read without a round trip. Everything else (status, device info, battery,
+beat counters) is pushed over the Unix socket as JSON lines when it changes, the link
+telemetry every few seconds. The first line a client receives names the ring.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import signal
+import struct
+import argparse
+import tempfile
+import threading
+from multiprocessing import shared_memory, resource_tracker
+
+SOCKET_PATH = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(), "5bx-ant.sock")
+RING_SLOTS = 256 # ~1 minute of packets at the HRM's 4 Hz
+HEADER = struct.Struct("<QII") # newest seq, slots, record size
+RECORD = struct.Struct("<QdHHHf8sQ") # seq, wall time, bpm, rr_ms, raw_rr_ms, rmssd, raw packet, seq again
+STATE_KEYS = ('status', 'manufacturer', 'serial', 'battery_volts', 'battery_state', 'uptime_hours',
+              'beats_recovered', 'beats_interpolated', 'beats_lost', 'device_number', 'transmission_type')
+STATE_POLL_SECS = 0.5
+TELEMETRY_SECS = 5.0
+RESTART_SECS = 5.0
+
+
+def _daemon_alive(path):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        s.close()
+
+
+def create_sensor(path=SOCKET_PATH, pin=None):
+    """A not-yet-started sensor: the daemon's client if it is up, else the USB driver
+       (channel pinned to `pin`, a device_registry entry, when given)."""
+    if os.path.exists(path) and _daemon_alive(path):
+        return SensorClient(path)
+    from modules.ant_driver import AntHrvSensor
+    return AntHrvSensor(pin=pin)
+
+
+# --- DAEMON ---
+class SensorDaemon:
+    def __init__(self, path=SOCKET_PATH, slots=RING_SLOTS):
+        self.path = path
+        self.slots = slots
+        self.running = False
+        self.sensor = None
+        self.seq = 0
+        self.state = {k: None for k in STATE_KEYS}
+        self.state['status'] = "Initializing"
+        self.telemetry = {}
+        self.clients = []
+        self.lock = threading.Lock()
+        self.shm = None
+        self.server = None
+
+    def serve_forever(self):
+        if os.path.exists(self.path):
+            if _daemon_alive(self.path): raise RuntimeError(f"Sensor daemon already running on {self.path}")
+            os.unlink(self.path) # Stale socket from a crashed daemon
+
+        try:
+            self.shm = shared_memory.SharedMemory(name=f"fivebx_ant_{os.getpid()}", create=True,
+                                                  size=HEADER.size + self.slots * RECORD.size)
+            HEADER.pack_into(self.shm.buf, 0, 0, self.slots, RECORD.size)
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(self.path)
+            self.server.listen()
+            self.running = True
+            threading.Thread(target=self._accept_loop, name="sensor-accept", daemon=True).start()
+            print(f"Sensor daemon listening on {self.path}")
+            self._sensor_loop()
+        finally:
+            self.close()
+
+    def close(self):
+        self.running = False
+        if self.sensor:
+            try: self.sensor.stop()
+            except: pass
+            self.sensor = None
+        with self.lock:
+            for conn in self.clients:
+                try: conn.close()
+                except OSError: pass
+            self.clients = []
+        if self.server:
+            self.server.close()
+            self.server = None
+            try: os.unlink(self.path)
+            except OSError: pass
+        if self.shm:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def _sensor_loop(self):
+        # Keeps one AntHrvSensor alive (the same restart rules as the trainer's auto-reconnect)
+        from modules.ant_driver import AntHrvSensor
+        import modules.device_registry as device_registry
+        next_telemetry = 0
+        while self.running:
+            sensor = self.sensor
+            if sensor is None or not sensor.running or str(sensor.status).startswith("Error"):
+                if sensor:
+                    try: sensor.stop()
+                    except: pass
+                    self.sensor = None
+                    time.sleep(RESTART_SECS) # Let the OS release the USB handle
+                try:
+                    sensor = AntHrvSensor(pin=device_registry.lookup()) # Last strap seen by any app
+                    sensor.on_packet = self._publish
+                    sensor.start()
+                    self.sensor = sensor
+                except Exception as e:
+                    self._update_state({'status': f"Error: {e}"})
+                    time.sleep(RESTART_SECS)
+                    continue
+            data = sensor.get_data() # Also applies the driver's signal-lost timeout
+            self._update_state({k: data.get(k) for k in STATE_KEYS})
+            if time.time() >= next_telemetry:
+                self.telemetry = sensor.get_telemetry()
+                self._broadcast({'telemetry': self.telemetry})
+                next_telemetry = time.time() + TELEMETRY_SECS
+            time.sleep(STATE_POLL_SECS)
+
+    def _publish(self, sensor):
+        # Driver thread: one ring record per decoded packet
+        try: raw = bytes.fromhex(sensor.last_raw_hex)
+        except ValueError: raw = b""
+        seq = self.seq + 1
+        off = HEADER.size + ((seq - 1) % self.slots) * RECORD.size
+        RECORD.pack_into(self.shm.buf, off, seq, time.time(), sensor.bpm, min(sensor.rr_ms, 0xFFFF),
+                         min(sensor.raw_rr_ms, 0xFFFF), sensor.rmssd, raw, seq)
+        HEADER.pack_into(self.shm.buf, 0, seq, self.slots, RECORD.size)
+        self.seq = seq
+
+    def _update_state(self, new_state):
+        changed = {k: v for k, v in new_state.items() if self.state.get(k) != v}
+        if not changed: return
+        self.state.update(changed)
+        self._broadcast({'state': changed})
+
+    def _broadcast(self, msg):
+        line = (json.dumps(msg) + "\n").encode()
+        with self.lock:
+            for conn in list(self.clients):
+                try:
+                    conn.sendall(line)
+                except OSError:
+                    self.clients.remove(conn)
+                    conn.close()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return # Socket closed
+            conn.settimeout(1.0) # A stuck client must not stall the broadcasts
+            hello = {'shm': self.shm.name, 'state': self.state, 'telemetry': self.telemetry}
+            try:
+                with self.lock:
+                    conn.sendall((json.dumps(hello) + "\n").encode())
+                    self.clients.append(conn)
+            except OSError:
+                conn.close()
+
+
+# --- CLIENT ---
+class SensorClient:
+    """AntHrvSensor interface (start / stop / running / status / get_data) over the daemon."""
+    shared = True # Doesn't hold the USB stick: stop() is instant, no release delay needed
+
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+        self.running = False
+        self.status = "Initializing"
+        self.state = {k: None for k in STATE_KEYS}
+        self.telemetry = {}
+        self.sock = None
+        self.shm = None
+        self.slots = 0
+        self.thread = None
+
+    def start(self):
+        if self.running: return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            reader = sock.makefile("r")
+            hello = json.loads(reader.readline() or "null")
+            if not hello: raise ConnectionError("Sensor daemon closed the connection")
+            self.shm = shared_memory.SharedMemory(name=hello['shm'])
+            # Python < 3.13 registers attached segments too and would unlink the daemon's ring at exit
+            try: resource_tracker.unregister(self.shm._name, "shared_memory")
+            except Exception: pass
+        except Exception:
+            sock.close()
+            raise
+        self.slots = HEADER.unpack_from(self.shm.buf, 0)[1]
+        self.sock = sock
+        self._apply(hello)
+        self.running = True
+        self.thread = threading.Thread(target=self._read_loop, args=(reader,), name="sensor-client", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.sock:
+            try: self.sock.shutdown(socket.SHUT_RDWR)
+            except OSError: pass
+            self.sock.close()
+            self.sock = None
+        if self.thread and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=1.0)
+        if self.shm:
+            try: self.shm.close()
+            except BufferError: pass # A get_data() still holds a view; freed with the object
+            self.shm = None
+
+    def _apply(self, msg):
+        self.state.update(msg.get('state', {}))
+        self.status = self.state.get('status') or self.status
+        if 'telemetry' in msg: self.telemetry = msg['telemetry']
+
+    def _read_loop(self, reader):
+        try:
+            for line in reader:
+                self._apply(json.loads(line))
+        except (OSError, ValueError):
+            pass
+        if self.running:
+            # Daemon went away: report it like a driver failure so callers reconnect
+            self.status = "Error: sensor daemon stopped"
+            self.running = False
+
+    def _latest(self):
+        buf = self.shm.buf if self.shm else None
+        if buf is None: return None
+        for _ in range(3):
+            seq = HEADER.unpack_from(buf, 0)[0]
+            if seq == 0: return None
+            rec = RECORD.unpack_from(buf, HEADER.size + ((seq - 1) % self.slots) * RECORD.size)
+            if rec[0] == rec[-1] == seq: return rec
+            # Torn read (the daemon was mid-write) - try again
+        return None
+
+    def get_data(self):
+        rec = self._latest()
+        if rec:
+            _, _, bpm, rr_ms, raw_rr_ms, rmssd, raw, _ = rec
+            raw_hex = raw.hex().upper() if any(raw) else ""
+        else:
+            bpm, rr_ms, raw_rr_ms, rmssd, raw_hex = 0, 0, 0, 0.0, ""
+        if self.status == "Signal Lost": bpm = 0
+        data = {
+            'bpm': bpm,
+            'rmssd': rmssd,
+            'rr_ms': rr_ms,
+            'raw_rr_ms': raw_rr_ms,
+            'raw_hex': raw_hex
+        }
+        data.update(self.state)
+        data['status'] = self.status
+        data['manufacturer'] = data['manufacturer'] or "Unknown"
+        data['battery_state'] = data['battery_state'] or "Unknown"
+        data['uptime_hours'] = data['uptime_hours'] or 0.0
+        for k in ('beats_recovered', 'beats_interpolated', 'beats_lost'): data[k] = data[k] or 0
+        return data
+
+    def get_telemetry(self):
+        """The daemon's AntHrvSensor.get_telemetry(), as of its last push."""
+        return self.telemetry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Share the ANT+ HR sensor with all 5BX apps.")
+    parser.add_argument("--socket", default=SOCKET_PATH, help=f"Unix socket path (default {SOCKET_PATH})")
+    args = parser.parse_args(argv)
+
+    signal.signal(signal.SIGTERM, lambda *a: sys.exit(0)) # Clean up socket + ring on kill
+    daemon = SensorDaemon(args.socket)
+    try:
+        daemon.serve_forever()
+    except (RuntimeError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
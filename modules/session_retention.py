@@ -0,0 +1,208 @@
+"""
+Tiered retention for the workout recordings in ant_sessions/.
+
+    python -m modules.session_retention                   # compact with the default windows
+    python -m modules.session_retention --raw-days 14 --dry-run
+
+Tier 0  recordings newer than --raw-days stay as the raw CSV (packet hex, battery, status).
+Tier 1  older ones are replaced by a zlib-compressed 1 Hz series (HR, RMSSD, exercise) in
+        the session_archive table, plus a per-exercise summary.
+Tier 2  after --summary-days only the per-exercise summary is kept.
+
+Archive rows are linked to the history row the workout produced, taken from the session_file
+index written with the row (older recordings fall back to the user's first history entry
+within a few hours of the recording's start), so old sessions are read with one indexed
+lookup instead of a CSV parse. Once a CSV is gone its session_file entry is dropped. The trainer runs compact() in the background at
+startup; the CSV is only deleted after its archive row is committed.
+"""
+import os
+import re
+import sys
+import csv
+import json
+import zlib
+import time
+import struct
+import sqlite3
+import argparse
+import datetime
+
+USER_DB_FILE = "databases/user_progress.db"
+SESSION_DIR = "ant_sessions"
+RAW_DAYS = 30
+SUMMARY_DAYS = 365
+LINK_WINDOW_HOURS = 3 # Unindexed recordings: history is written when the workout finishes
+
+SESSION_RE = re.compile(r"session_5bx_(.+)_(\d{8}_\d{6})\.csv$")
+SAMPLE = struct.Struct("<IBHB") # offset (s), hr, rmssd x10, exercise index
+
+
+def _num(value, cast=float):
+    try: return cast(float(value))
+    except (TypeError, ValueError): return 0
+
+
+def _safe_name(name):
+    # Same sanitising as SessionLogger.start()
+    return "".join([c for c in name if c.isalpha() or c.isdigit() or c == ' ']).rstrip()
+
+
+def _seconds(ts):
+    tod = datetime.datetime.strptime(ts, "%H:%M:%S.%f")
+    return tod.hour * 3600 + tod.minute * 60 + tod.second + tod.microsecond / 1e6
+
+
+def summarise(path):
+    """(1 Hz samples [(offset, hr, rmssd, exercise idx)], exercise summaries) from a session CSV."""
+    samples, exercises, index = {}, [], {}
+    start = prev = None
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            try: secs = _seconds(row.get("Timestamp", ""))
+            except ValueError: continue
+            if prev is not None and secs < prev - 43200: secs += 86400 # Past midnight
+            if start is None: start = secs
+            prev = secs
+            hr = _num(row.get("HR_BPM"), int)
+            if hr <= 0: continue
+            rmssd = _num(row.get("RMSSD_MS"))
+            note = row.get("Exercise_Note") or ""
+            if note not in index:
+                index[note] = len(exercises)
+                exercises.append({"exercise": note, "first": secs, "last": secs, "hr": [], "rmssd": []})
+            ex = exercises[index[note]]
+            ex["last"] = secs
+            ex["hr"].append(hr)
+            if rmssd > 0: ex["rmssd"].append(rmssd)
+            samples[int(secs - start)] = (int(secs - start), min(hr, 255), min(int(round(rmssd * 10)), 0xFFFF), index[note])
+
+    summary = [{
+        "exercise": ex["exercise"],
+        "secs": int(ex["last"] - ex["first"]) + 1,
+        "samples": len(ex["hr"]),
+        "avg_hr": round(sum(ex["hr"]) / len(ex["hr"]), 1),
+        "min_hr": min(ex["hr"]),
+        "max_hr": max(ex["hr"]),
+        "avg_rmssd": round(sum(ex["rmssd"]) / len(ex["rmssd"]), 1) if ex["rmssd"] else None
+    } for ex in exercises]
+    return [samples[k] for k in sorted(samples)], summary
+
+
+def pack_series(samples):
+    return zlib.compress(b"".join(SAMPLE.pack(*s) for s in samples), 9)
+
+
+def unpack_series(blob):
+    data = zlib.decompress(blob)
+    return [SAMPLE.unpack_from(data, i) for i in range(0, len(data), SAMPLE.size)]
+
+
+# --- QUERIES ---
+def load_series(conn, history_id):
+    """[{'t', 'hr', 'rmssd', 'exercise'}] for an archived session (tier 1), else None."""
+    row = conn.execute("SELECT series, exercises FROM session_archive WHERE history_id=? AND series IS NOT NULL",
+                       (history_id,)).fetchone()
+    if not row: return None
+    names = [e["exercise"] for e in json.loads(row[1])]
+    return [{'t': t, 'hr': hr, 'rmssd': rmssd / 10.0, 'exercise': names[ex]} for t, hr, rmssd, ex in unpack_series(row[0])]
+
+
+def exercise_summary(conn, history_id):
+    """Per-exercise HR / RMSSD summary of an archived session, else None."""
+    row = conn.execute("SELECT exercises FROM session_archive WHERE history_id=?", (history_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+# --- COMPACTION ---
+def _link_history(conn, user_id, started):
+    if user_id is None: return None
+    until = (datetime.datetime.strptime(started, "%Y-%m-%d %H:%M:%S") + datetime.timedelta(hours=LINK_WINDOW_HOURS)).strftime("%Y-%m-%d %H:%M:%S")
+    row = conn.execute("""SELECT id FROM history WHERE user_id=? AND timestamp>=? AND timestamp<=?
+                          AND id NOT IN (SELECT history_id FROM session_archive WHERE history_id IS NOT NULL)
+                          AND id NOT IN (SELECT history_id FROM session_file)
+                          ORDER BY timestamp LIMIT 1""", (user_id, started, until)).fetchone()
+    return row[0] if row else None
+
+
+def compact(db_file=USER_DB_FILE, session_dir=SESSION_DIR, raw_days=RAW_DAYS, summary_days=SUMMARY_DAYS,
+            dry_run=False, now=None):
+    """Moves recordings down the tiers. Returns {'archived', 'empty', 'summarised', 'bytes_freed', 'skipped'}."""
+    now = now or datetime.datetime.now()
+    raw_cutoff = now - datetime.timedelta(days=raw_days)
+    summary_cutoff = (now - datetime.timedelta(days=summary_days)).strftime("%Y-%m-%d %H:%M:%S")
+    result = {'archived': 0, 'empty': 0, 'summarised': 0, 'bytes_freed': 0, 'skipped': 0}
+
+    conn = sqlite3.connect(db_file)
+    try:
+        users = {_safe_name(name): uid for uid, name in conn.execute("SELECT id, name FROM users")}
+        indexed = {os.path.basename(p): hid for hid, p in conn.execute("SELECT history_id, path FROM session_file")}
+        names = sorted(os.listdir(session_dir)) if os.path.isdir(session_dir) else []
+        for name in names:
+            m = SESSION_RE.match(name)
+            if not m: continue
+            started = datetime.datetime.strptime(m.group(2), "%Y%m%d_%H%M%S")
+            if started >= raw_cutoff: continue
+            path = os.path.join(session_dir, name)
+            size = os.path.getsize(path)
+            try:
+                samples, summary = summarise(path)
+            except (OSError, csv.Error, UnicodeDecodeError):
+                result['skipped'] += 1 # Unreadable: leave it for a human
+                continue
+            result['bytes_freed'] += size
+            if not samples:
+                # Abandoned before any HR was logged (header only)
+                result['empty'] += 1
+                if not dry_run:
+                    os.remove(path)
+                    if name in indexed:
+                        with conn: conn.execute("DELETE FROM session_file WHERE history_id=?", (indexed[name],))
+                continue
+            result['archived'] += 1
+            if dry_run: continue
+
+            ts = started.strftime("%Y-%m-%d %H:%M:%S")
+            user_id = users.get(m.group(1))
+            history_id = indexed.get(name) or _link_history(conn, user_id, ts)
+            with conn:
+                conn.execute("""INSERT OR REPLACE INTO session_archive
+                                (user_id, history_id, source_file, started, tier, samples, raw_bytes, series, exercises)
+                                VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?)""",
+                             (user_id, history_id, name, ts, len(samples), size, pack_series(samples), json.dumps(summary)))
+                if name in indexed: conn.execute("DELETE FROM session_file WHERE history_id=?", (history_id,))
+            os.remove(path)
+
+        # Tier 1 -> 2, and tidy rows whose user / history row was deleted
+        result['summarised'] = conn.execute("SELECT COUNT(*) FROM session_archive WHERE tier=1 AND started<?", (summary_cutoff,)).fetchone()[0]
+        if not dry_run:
+            with conn:
+                conn.execute("UPDATE session_archive SET tier=2, series=NULL WHERE tier=1 AND started<?", (summary_cutoff,))
+                conn.execute("DELETE FROM session_archive WHERE user_id IS NOT NULL AND user_id NOT IN (SELECT id FROM users)")
+                conn.execute("UPDATE session_archive SET history_id=NULL WHERE history_id NOT IN (SELECT id FROM history)")
+                conn.execute("DELETE FROM session_file WHERE history_id NOT IN (SELECT id FROM history)")
+    finally:
+        conn.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compact old session recordings into the progress DB.")
+    parser.add_argument("--raw-days", type=int, default=RAW_DAYS, help="Keep raw CSVs this long")
+    parser.add_argument("--summary-days", type=int, default=SUMMARY_DAYS, help="Keep 1 Hz series this long")
+    parser.add_argument("--db", default=USER_DB_FILE)
+    parser.add_argument("--session-dir", default=SESSION_DIR)
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args(argv)
+
+    from modules import progress_db
+    progress_db.init_db(args.db)
+    t0 = time.perf_counter()
+    r = compact(args.db, args.session_dir, args.raw_days, args.summary_days, args.dry_run)
+    verb = "Would archive" if args.dry_run else "Archived"
+    print(f"{verb} {r['archived']} recordings + {r['empty']} empty ({r['bytes_freed'] / 1024:.0f} KB of CSV), "
+          f"{r['summarised']} series reduced to summaries, {r['skipped']} unreadable skipped ({time.perf_counter() - t0:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import time
+import threading
+
+# Startup timing for --profile-startup.
+# Marks are always recorded (a perf_counter call each), report() only prints when enabled.
+# mark() closes a sequential main-thread step; phase() times work that may overlap it
+# (background init, lazy imports). Phases that finish after report() print as they land.
+T0 = time.perf_counter()
+
+enabled = False
+_lock = threading.Lock()
+_records = [] # (name, start, end, thread name)
+_last_mark = T0
+_reported = False
+
+
+def _record(name, start, end):
+    rec = (name, start - T0, end - start, threading.current_thread().name)
+    with _lock:
+        _records.append(rec)
+        late = _reported
+    if enabled and late: _print(rec)
+
+
+def _print(rec):
+    name, offset, duration, thread = rec
+    where = "" if thread == "MainThread" else f"  [{thread}]"
+    print(f"  {offset * 1000:8.1f} ms  {duration * 1000:8.1f} ms  {name}{where}")
+
+
+def mark(name):
+    """Records the main-thread step since the previous mark."""
+    global _last_mark
+    now = time.perf_counter()
+    start, _last_mark = _last_mark, now
+    _record(name, start, now)
+
+
+class phase:
+    """with phase("name"): ... - times a block on any thread."""
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.start, time.perf_counter())
+        return False
+
+
+def report(title="Startup profile"):
+    """Prints everything recorded so far; later phases are printed as they finish."""
+    global _reported
+    with _lock:
+        records = sorted(_records, key=lambda r: r[1])
+        _reported = True
+    if not enabled: return
+    print(f"--- {title} (offset from launch / duration) ---")
+    for rec in records: _print(rec)
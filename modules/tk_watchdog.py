@@ -0,0 +1,127 @@
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+import tkinter
+
+from modules import metrics
+
+# Opt-in (--watchdog) Tk main loop stall detector.
+# A heartbeat after() callback measures how late it runs (scheduled vs actual). While it is
+# overdue, a background thread samples the main thread's Python stack to see which callback
+# is holding the loop (sensor_loop, render_chart_grid, finish_workout, ...). Each stall is
+# attributed to the callback seen in most samples; stop() prints and saves the per-callback
+# counts / durations with an example stack.
+
+HEARTBEAT_MS = 100
+STALL_MS = 250 # Heartbeat this late = a stall
+SAMPLE_MS = 50
+STACK_DEPTH = 12
+REPORT_FILE = "logs/tk_stalls.json"
+_TK_DIR = os.path.dirname(tkinter.__file__)
+_SKIP = (_TK_DIR, os.path.abspath(__file__))
+
+
+def _callback_name(frame):
+    """The callback Tk is running now (lambda wrappers skipped), or None if idle: the first app
+       frame after the innermost dispatch, so a nested loop (wait_window in input_results /
+       finish_workout) blames the callback it dispatched, not the one that opened it."""
+    stack = []
+    while frame:
+        stack.append(frame)
+        frame = frame.f_back
+    dispatched = False
+    name = None
+    for f in reversed(stack): # Outermost first
+        code = f.f_code
+        if code.co_filename.startswith(_SKIP):
+            # tkinter's CallWrapper.__call__ / after()'s callit run every callback
+            if code.co_name in ("__call__", "callit"): dispatched = True
+            continue
+        if dispatched and code.co_name != "<lambda>":
+            name = getattr(code, "co_qualname", code.co_name)
+            dispatched = False
+    return name
+
+
+class TkWatchdog:
+    def __init__(self, root, threshold_ms=STALL_MS, interval_ms=HEARTBEAT_MS, report_path=REPORT_FILE):
+        self.root = root
+        self.threshold = threshold_ms / 1000.0
+        self.interval_ms = interval_ms
+        self.report_path = report_path
+        self.main_id = threading.main_thread().ident
+        self.lock = threading.Lock()
+        self.samples = {} # Current stall: callback -> [sample count, example stack]
+        self.stats = {} # callback -> {'stalls', 'total_ms', 'max_ms', 'stack'}
+        self.due = None
+        self.task = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.due = time.perf_counter() + self.interval_ms / 1000.0
+        self.task = self.root.after(self.interval_ms, self._beat)
+        self.thread = threading.Thread(target=self._sample_loop, name="tk-watchdog", daemon=True)
+        self.thread.start()
+        return self
+
+    def _beat(self):
+        now = time.perf_counter()
+        late = now - self.due
+        metrics.observe("ui.loop_lag_ms", late * 1000)
+        if late >= self.threshold: self._record(late * 1000)
+        else:
+            with self.lock: self.samples = {}
+        self.due = now + self.interval_ms / 1000.0
+        if not self.stopped.is_set(): self.task = self.root.after(self.interval_ms, self._beat)
+
+    def _sample_loop(self):
+        while not self.stopped.wait(SAMPLE_MS / 1000.0):
+            if time.perf_counter() - self.due < self.threshold: continue
+            frame = sys._current_frames().get(self.main_id)
+            if frame is None: continue
+            name = _callback_name(frame) or "(Tk event processing)"
+            with self.lock:
+                entry = self.samples.setdefault(name, [0, None])
+                entry[0] += 1
+                if entry[1] is None: entry[1] = "".join(traceback.format_stack(frame, limit=STACK_DEPTH))
+
+    def _record(self, late_ms):
+        with self.lock:
+            samples, self.samples = self.samples, {}
+        if samples:
+            name, (_, stack) = max(samples.items(), key=lambda kv: kv[1][0])
+        else:
+            name, stack = "(unsampled)", None # Too short for the sampler to catch
+        s = self.stats.setdefault(name, {'stalls': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'stack': None})
+        s['stalls'] += 1
+        s['total_ms'] += late_ms
+        if late_ms > s['max_ms']:
+            s['max_ms'] = late_ms
+            s['stack'] = stack or s['stack']
+        metrics.inc("ui.stalls")
+
+    def report(self):
+        rows = sorted(self.stats.items(), key=lambda kv: kv[1]['total_ms'], reverse=True)
+        return [{'callback': name, 'stalls': s['stalls'], 'total_ms': round(s['total_ms'], 1),
+                 'max_ms': round(s['max_ms'], 1), 'stack': s['stack']} for name, s in rows]
+
+    def stop(self):
+        """Stops sampling, prints the per-callback summary and saves it to report_path."""
+        self.stopped.set()
+        if self.task:
+            try: self.root.after_cancel(self.task)
+            except tkinter.TclError: pass
+        report = self.report()
+        print(f"\n--- Tk stalls (> {self.threshold * 1000:.0f} ms) ---")
+        if not report: print("  none")
+        for r in report:
+            print(f"  {r['callback']:<40} {r['stalls']:>4} stalls  {r['total_ms']:>9.0f} ms total  {r['max_ms']:>7.0f} ms max")
+        if self.report_path:
+            if os.path.dirname(self.report_path): os.makedirs(os.path.dirname(self.report_path), exist_ok=True)
+            with open(self.report_path, 'w') as f: json.dump(report, f, indent=2)
+            print(f"  (stacks in {self.report_path})")
+        return report
@@ -0,0 +1,364 @@
+"""
+Portable per-user archive (.tar.gz): DB rows, profile JSON (+ backups) and session recordings
+(raw CSVs plus the compacted ones in session_archive and the session_file index).
+
+    python -m modules.user_archive export "Matthew" -o matthew.5bx.tar.gz
+    python -m modules.user_archive import matthew.5bx.tar.gz --on-conflict merge
+
+Export streams: history rows go to a JSONL temp file one row at a time and every file is
+copied into the tar in chunks, so memory stays flat however many sessions a user has.
+Import reads the archive front to back (no extraction to disk first) and inserts history
+with executemany in batches.
+"""
+import io
+import os
+import re
+import sys
+import json
+import base64
+import time
+import shutil
+import sqlite3
+import tarfile
+import argparse
+import datetime
+import tempfile
+
+import modules.progress_db as progress_db
+import modules.user_stats as user_stats
+
+USER_DB_FILE = "databases/user_progress.db"
+PROFILE_DIR = "ant_user_profiles"
+BACKUP_DIR = "ant_user_profiles/backups"
+SESSION_DIR = "ant_sessions"
+
+ARCHIVE_FORMAT = "5bx-user-archive"
+ARCHIVE_VERSION = 2 # 2: session_archive / session_file rows
+BATCH_ROWS = 500
+CONFLICT_POLICIES = ("merge", "replace", "rename", "skip")
+
+# history columns that are local to a database and never exported
+LOCAL_COLUMNS = ("id", "user_id")
+# A history row is the same session if these match (ids differ between machines)
+SESSION_KEY = ("timestamp", "chart", "level", "verdict")
+# Tables linked to history rows: exported with the row's SESSION_KEY, re-linked on import
+LINKED_TABLES = ("session_archive", "session_file")
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def session_prefix(user_name):
+    # Same sanitising as SessionLogger.start()
+    return "session_5bx_" + "".join([c for c in user_name if c.isalpha() or c.isdigit() or c == ' ']).rstrip() + "_"
+
+
+def rename_session(filename, old_prefix, new_prefix):
+    """Recording filename moved to another user's prefix (import under a new name)."""
+    if old_prefix == new_prefix or not filename.startswith(old_prefix): return filename
+    return new_prefix + filename[len(old_prefix):]
+
+
+def session_files(user_name, session_dir=SESSION_DIR):
+    if not os.path.isdir(session_dir): return []
+    pattern = re.compile(re.escape(session_prefix(user_name)) + r"\d{8}_\d{6}\.csv$")
+    return sorted(os.path.join(session_dir, f) for f in os.listdir(session_dir) if pattern.match(f))
+
+
+def _profile_file(user_row):
+    linked = user_row.get('linked_file')
+    if linked and linked != 'none': return linked
+    return f"{user_row['name'].lower().replace(' ', '_')}_profile.json"
+
+
+def _add_bytes(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, fileobj=io.BytesIO(data))
+
+
+def _add_temp(tar, name, tmp):
+    info = tarfile.TarInfo(name)
+    info.size = tmp.tell()
+    info.mtime = int(time.time())
+    tmp.seek(0)
+    tar.addfile(info, fileobj=tmp)
+
+
+def _linked_rows(conn, table, user_id):
+    """A user's rows of a LINKED_TABLES table with their history row's SESSION_KEY (key_*; None if unlinked)."""
+    keys = ", ".join(f"h.{k} AS key_{k}" for k in SESSION_KEY)
+    if table == "session_archive":
+        return conn.execute(f"""SELECT t.*, {keys} FROM session_archive t LEFT JOIN history h ON h.id = t.history_id
+                                WHERE t.user_id=? ORDER BY t.id""", (user_id,))
+    return conn.execute(f"""SELECT t.*, {keys} FROM {table} t JOIN history h ON h.id = t.history_id
+                            WHERE h.user_id=? ORDER BY t.history_id""", (user_id,))
+
+
+def _linked_record(row):
+    rec = {k: row[k] for k in row.keys() if k not in ("id", "user_id", "history_id") and not k.startswith("key_")}
+    rec["history_key"] = [row[f"key_{k}"] for k in SESSION_KEY] if row["key_timestamp"] is not None else None
+    if rec.get("path"): rec["path"] = os.path.basename(rec["path"]) # Re-rooted in the importer's session dir
+    if rec.get("series") is not None: rec["series"] = base64.b64encode(rec["series"]).decode("ascii")
+    return rec
+
+
+# --- EXPORT ---
+def export_user(name, out_path, db_file=USER_DB_FILE, profile_dir=PROFILE_DIR, backup_dir=BACKUP_DIR, session_dir=SESSION_DIR):
+    """Writes one user's data to out_path. Returns the manifest."""
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    try:
+        user = conn.execute("SELECT * FROM users WHERE name=?", (name,)).fetchone()
+        if not user: raise ArchiveError(f"No user named {name!r}")
+        user = dict(user)
+        profile = _profile_file(user)
+
+        manifest = {
+            "format": ARCHIVE_FORMAT, "version": ARCHIVE_VERSION,
+            "user": name, "exported": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "history_rows": 0, "files": []
+        }
+        for table in LINKED_TABLES: manifest[f"{table}_rows"] = 0
+
+        with tempfile.TemporaryFile() as tmp, tempfile.TemporaryFile() as tmp_archive, tempfile.TemporaryFile() as tmp_file:
+            c = conn.execute("SELECT * FROM history WHERE user_id=? ORDER BY id", (user['id'],))
+            for row in c:
+                rec = {k: row[k] for k in row.keys() if k not in LOCAL_COLUMNS}
+                tmp.write((json.dumps(rec) + "\n").encode("utf-8"))
+                manifest["history_rows"] += 1
+
+            linked = {"session_archive": tmp_archive, "session_file": tmp_file}
+            for table, out in linked.items():
+                for row in _linked_rows(conn, table, user['id']):
+                    out.write((json.dumps(_linked_record(row)) + "\n").encode("utf-8"))
+                    manifest[f"{table}_rows"] += 1
+
+            files = []
+            prof_path = os.path.join(profile_dir, profile)
+            if os.path.exists(prof_path): files.append((prof_path, f"profiles/{profile}"))
+            if os.path.isdir(backup_dir):
+                for f in sorted(os.listdir(backup_dir)):
+                    if f.startswith(profile + "."): files.append((os.path.join(backup_dir, f), f"profiles/backups/{f}"))
+            for path in session_files(name, session_dir):
+                files.append((path, f"sessions/{os.path.basename(path)}"))
+            manifest["files"] = [arc for _, arc in files]
+
+            with tarfile.open(out_path, "w:gz") as tar:
+                # Manifest first so import can validate before touching anything
+                _add_bytes(tar, "manifest.json", json.dumps(manifest, indent=2).encode("utf-8"))
+                user_rec = {k: v for k, v in user.items() if k != "id"}
+                _add_bytes(tar, "user.json", json.dumps(user_rec, indent=2).encode("utf-8"))
+
+                _add_temp(tar, "history.jsonl", tmp)
+                # After history: import re-links them to the rows it has just inserted
+                for table, out in linked.items(): _add_temp(tar, f"{table}.jsonl", out)
+
+                for path, arcname in files:
+                    tar.add(path, arcname=arcname, recursive=False)
+        return manifest
+    finally:
+        conn.close()
+
+
+# --- IMPORT ---
+def _unique_name(conn, name):
+    i = 2
+    while conn.execute("SELECT 1 FROM users WHERE name=?", (f"{name} ({i})",)).fetchone(): i += 1
+    return f"{name} ({i})"
+
+
+def _resolve_user(conn, user_rec, policy):
+    """Returns (user_id, existing_keys or None, action, profile file). existing_keys drives merge de-duplication."""
+    user_cols = [r[1] for r in conn.execute("PRAGMA table_info(users)")]
+    rec = {k: v for k, v in user_rec.items() if k in user_cols and k != "id"}
+    row = conn.execute("SELECT id FROM users WHERE name=?", (rec['name'],)).fetchone()
+
+    if row and policy == "skip":
+        return None, None, "skipped", None
+    if row and policy == "merge":
+        keys = set(conn.execute(f"SELECT {', '.join(SESSION_KEY)} FROM history WHERE user_id=?", (row[0],)).fetchall())
+        return row[0], keys, "merged", _profile_file(rec)
+    if row and policy == "replace":
+        conn.execute("DELETE FROM session_file WHERE history_id IN (SELECT id FROM history WHERE user_id=?)", (row[0],))
+        conn.execute("DELETE FROM session_archive WHERE user_id=?", (row[0],))
+        conn.execute("DELETE FROM history WHERE user_id=?", (row[0],))
+        cols = [k for k in rec if k != "name"]
+        conn.execute(f"UPDATE users SET {', '.join(f'{k}=?' for k in cols)} WHERE id=?", [rec[k] for k in cols] + [row[0]])
+        return row[0], None, "replaced", _profile_file(rec)
+    if row and policy == "rename":
+        rec['name'] = _unique_name(conn, rec['name'])
+        rec['linked_file'] = f"{rec['name'].lower().replace(' ', '_')}_profile.json"
+
+    cols = list(rec)
+    c = conn.execute(f"INSERT INTO users ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})", [rec[k] for k in cols])
+    return c.lastrowid, None, "created" if not row else f"created as {rec['name']!r}", _profile_file(rec)
+
+
+def _import_history(conn, fileobj, user_id, existing_keys):
+    hist_cols = [r[1] for r in conn.execute("PRAGMA table_info(history)") if r[1] not in LOCAL_COLUMNS]
+    sql = f"INSERT INTO history (user_id, {', '.join(hist_cols)}) VALUES (?, {', '.join('?' * len(hist_cols))})"
+    batch, inserted, duplicates = [], 0, 0
+    for line in fileobj:
+        if not line.strip(): continue
+        rec = json.loads(line)
+        if existing_keys is not None:
+            key = tuple(rec.get(k) for k in SESSION_KEY)
+            if key in existing_keys:
+                duplicates += 1
+                continue
+            existing_keys.add(key)
+        batch.append([user_id] + [rec.get(k) for k in hist_cols])
+        if len(batch) >= BATCH_ROWS:
+            conn.executemany(sql, batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+        inserted += len(batch)
+    return inserted, duplicates
+
+
+def _import_linked(conn, fileobj, table, user_id, history_ids, session_dir, prefixes):
+    """Inserts a LINKED_TABLES member, re-linked via history_ids ({SESSION_KEY: id}); recording
+       names are moved by rename_session(name, *prefixes). Rows the DB already has (same recording /
+       history row) are kept. Returns rows inserted."""
+    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})") if r[1] != "id"]
+    sql = f"INSERT OR IGNORE INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+    batch, inserted = [], 0
+    for line in fileobj:
+        if not line.strip(): continue
+        rec = json.loads(line)
+        key = rec.pop("history_key", None)
+        rec["history_id"] = history_ids.get(tuple(key)) if key else None
+        rec["user_id"] = user_id
+        if table == "session_file":
+            if rec["history_id"] is None: continue
+            rec["path"] = os.path.join(session_dir, rename_session(rec["path"], *prefixes))
+        if rec.get("source_file"): rec["source_file"] = rename_session(rec["source_file"], *prefixes)
+        if rec.get("series") is not None: rec["series"] = base64.b64decode(rec["series"])
+        batch.append([rec.get(k) for k in cols])
+        if len(batch) >= BATCH_ROWS:
+            inserted += conn.executemany(sql, batch).rowcount
+            batch = []
+    if batch: inserted += conn.executemany(sql, batch).rowcount
+    return inserted
+
+
+def _safe_target(arcname, profile_dir, backup_dir, session_dir):
+    """Maps an archive member to a local path; None for anything unexpected (no path traversal)."""
+    parts = arcname.split("/")
+    if any(p in ("", ".", "..") for p in parts) or os.path.isabs(arcname): return None
+    if len(parts) == 2 and parts[0] == "profiles": return os.path.join(profile_dir, parts[1])
+    if len(parts) == 3 and parts[:2] == ["profiles", "backups"]: return os.path.join(backup_dir, parts[2])
+    if len(parts) == 2 and parts[0] == "sessions": return os.path.join(session_dir, parts[1])
+    return None
+
+
+def _same_content(tar, member, path):
+    if os.path.getsize(path) != member.size: return False
+    src = tar.extractfile(member)
+    with open(path, "rb") as f:
+        while True:
+            a, b = src.read(65536), f.read(65536)
+            if a != b: return False
+            if not a: return True
+
+
+def _write_member(tar, member, target, policy, is_profile, backup_dir):
+    """Sessions and backups are never overwritten. An existing profile is only overwritten
+       on replace; otherwise the imported copy is kept next to the backups."""
+    if os.path.exists(target):
+        if not is_profile or _same_content(tar, member, target): return False
+        if policy != "replace":
+            target = os.path.join(backup_dir, f"{os.path.basename(target)}.{datetime.datetime.now():%Y%m%d_%H%M%S}.imported.bak")
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    src = tar.extractfile(member)
+    with open(target, "wb") as dst: shutil.copyfileobj(src, dst)
+    return True
+
+
+def import_archive(path, policy="merge", db_file=USER_DB_FILE, profile_dir=PROFILE_DIR, backup_dir=BACKUP_DIR, session_dir=SESSION_DIR):
+    """Merges an archive into the local DB and folders. Returns a summary dict."""
+    if policy not in CONFLICT_POLICIES: raise ArchiveError(f"Unknown conflict policy {policy!r}")
+    progress_db.init_db(db_file)
+    conn = sqlite3.connect(db_file)
+    summary = {"user": None, "action": None, "inserted": 0, "duplicates": 0, "archived": 0, "files": 0}
+    user_id = existing_keys = profile_map = history_ids = prefixes = None
+    try:
+        with conn, tarfile.open(path, "r:gz") as tar: # Streamed: members are read in archive order
+            for member in tar:
+                if member.name == "manifest.json":
+                    manifest = json.load(tar.extractfile(member))
+                    if manifest.get("format") != ARCHIVE_FORMAT or manifest.get("version", 0) > ARCHIVE_VERSION:
+                        raise ArchiveError("Not a 5BX user archive (or made by a newer version)")
+                    summary["user"] = manifest.get("user")
+                elif member.name == "user.json":
+                    if summary["user"] is None: raise ArchiveError("Archive has no manifest")
+                    user_rec = json.load(tar.extractfile(member))
+                    user_id, existing_keys, summary["action"], profile = _resolve_user(conn, user_rec, policy)
+                    if user_id is None: break # skipped
+                    profile_map = {f"profiles/{_profile_file(user_rec)}": profile} # differs after a rename
+                    # Recordings are named after the user: follow a rename, or they stay the original user's
+                    new_name = conn.execute("SELECT name FROM users WHERE id=?", (user_id,)).fetchone()[0]
+                    prefixes = (session_prefix(user_rec['name']), session_prefix(new_name))
+                elif member.name == "history.jsonl":
+                    inserted, duplicates = _import_history(conn, tar.extractfile(member), user_id, existing_keys)
+                    summary["inserted"] += inserted
+                    summary["duplicates"] += duplicates
+                elif member.name in (f"{t}.jsonl" for t in LINKED_TABLES):
+                    if history_ids is None:
+                        history_ids = {tuple(r[:-1]): r[-1] for r in conn.execute(
+                            f"SELECT {', '.join(SESSION_KEY)}, id FROM history WHERE user_id=?", (user_id,))}
+                    table = member.name[:-len(".jsonl")]
+                    inserted = _import_linked(conn, tar.extractfile(member), table, user_id, history_ids, session_dir, prefixes)
+                    if table == "session_archive": summary["archived"] += inserted
+                elif member.isfile():
+                    target = _safe_target(member.name, profile_dir, backup_dir, session_dir)
+                    is_profile = member.name.count("/") == 1 and member.name.startswith("profiles/")
+                    if profile_map and member.name in profile_map: target = os.path.join(profile_dir, profile_map[member.name])
+                    if target and member.name.startswith("sessions/"):
+                        target = os.path.join(session_dir, rename_session(os.path.basename(target), *prefixes))
+                    if target and _write_member(tar, member, target, policy, is_profile, backup_dir): summary["files"] += 1
+
+            if user_id is not None: user_stats.rebuild(conn, [user_id])
+    finally:
+        conn.close()
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export / import a 5BX user as a portable archive.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="Write a user's history, profile and sessions to an archive")
+    exp.add_argument("user")
+    exp.add_argument("-o", "--output", help="Archive path (default: <user>_<date>.5bx.tar.gz)")
+    imp = sub.add_parser("import", help="Merge an archive into this machine's data")
+    imp.add_argument("archive")
+    imp.add_argument("--on-conflict", choices=CONFLICT_POLICIES, default="merge",
+                     help="If the user already exists: merge new sessions (default), replace, import under a new name, or skip")
+    for p in (exp, imp):
+        p.add_argument("--db", default=USER_DB_FILE)
+        p.add_argument("--profile-dir", default=PROFILE_DIR)
+        p.add_argument("--session-dir", default=SESSION_DIR)
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    try:
+        if args.command == "export":
+            out = args.output or f"{args.user.lower().replace(' ', '_')}_{datetime.date.today():%Y%m%d}.5bx.tar.gz"
+            manifest = export_user(args.user, out, args.db, args.profile_dir, os.path.join(args.profile_dir, "backups"), args.session_dir)
+            print(f"Exported {args.user}: {manifest['history_rows']} history rows, {manifest['session_archive_rows']} archived sessions, {len(manifest['files'])} files -> {out} ({time.perf_counter() - t0:.2f}s)")
+        else:
+            s = import_archive(args.archive, args.on_conflict, args.db, args.profile_dir, os.path.join(args.profile_dir, "backups"), args.session_dir)
+            print(f"Imported {s['user']} ({s['action']}): {s['inserted']} history rows, {s['duplicates']} duplicates skipped, {s['archived']} archived sessions, {s['files']} files ({time.perf_counter() - t0:.2f}s)")
+    except ArchiveError as e:
+        print(f"Archive Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import json
+
+import modules.five_bx_data as bx
+import modules.progression_engine as pe
+from modules.exercise_series import row_points, RUN_IDX, WALK_IDX
+
+# Per-user aggregates (user_stats table), kept current by the data layer:
+#   record_session() folds one new history row in (same transaction as the INSERT),
+#   rebuild() recomputes from history in (timestamp, id) order (deletes, bulk imports, migration backfill).
+# Reading them is a single-row SELECT whatever the history size.
+
+STRENGTH_SECS = sum(bx.TIME_LIMITS[:4])
+STATIONARY_SECS = bx.TIME_LIMITS[4]
+HISTORY_COLUMNS = "id, user_id, timestamp, chart, level, verdict, avg_hr, end_rmssd, ex1, ex2, ex3, ex4, ex5, segment_stats, ex5_type, ex5_duration"
+STATS_COLUMNS = ("user_id", "sessions", "training_secs", "strength_streak", "cardio_streak",
+                 "last_history_id", "last_avg_hr", "last_rmssd", "bests")
+
+
+def empty(user_id):
+    return {'user_id': user_id, 'sessions': 0, 'training_secs': 0, 'strength_streak': 0, 'cardio_streak': 0,
+            'last_history_id': None, 'last_avg_hr': None, 'last_rmssd': None, 'bests': {}}
+
+
+def _is_workout(row):
+    # Manual level edits are logged as history rows with no reps
+    reps = [row['ex1'], row['ex2'], row['ex3'], row['ex4'], row['ex5']]
+    return any(r and r > 0 for r in reps) or (row['ex5_duration'] or 0) > 0
+
+
+def session_seconds(row):
+    """Nominal training time: the four timed strength slots plus Ex 5 (actual time for a run/walk)."""
+    return STRENGTH_SECS + ((row['ex5_duration'] or 0) or STATIONARY_SECS)
+
+
+def fold(stats, row):
+    """Applies one history row (newer than everything already folded in). Returns stats."""
+    for comp, key in (("Strength", 'strength_streak'), ("Cardio", 'cardio_streak')):
+        stats[key] = 0 if pe.breaks_fail_streak(row, comp) else stats[key] + 1
+    stats['last_history_id'] = row['id']
+
+    if not _is_workout(row): return stats
+    stats['sessions'] += 1
+    stats['training_secs'] += session_seconds(row)
+    if row['avg_hr']:
+        stats['last_avg_hr'] = row['avg_hr']
+        stats['last_rmssd'] = row['end_rmssd']
+
+    # Personal bests per chart: most reps for Ex 1-5, fastest time for Run / Walk
+    alt_cardio = pe.is_alt_cardio(row['ex5_type'])
+    for (chart, idx), point in row_points(row).items():
+        if idx == 4 and alt_cardio:
+            continue # Reps column only holds the 'completed' flag for timed cardio
+        bests = stats['bests'].setdefault(str(chart), [0] * 7)
+        best = bests[idx]
+        if idx in (RUN_IDX, WALK_IDX):
+            if not best or point.value < best: bests[idx] = point.value
+        elif point.value > best:
+            bests[idx] = point.value
+    return stats
+
+
+def _columns(cursor):
+    return [d[0] for d in cursor.description]
+
+
+def load(conn, user_id):
+    """Stats dict for user_id, or None if it has never been computed."""
+    row = conn.execute(f"SELECT {', '.join(STATS_COLUMNS)} FROM user_stats WHERE user_id=?", (user_id,)).fetchone()
+    if not row: return None
+    stats = dict(zip(STATS_COLUMNS, row))
+    stats['bests'] = json.loads(stats['bests']) if stats['bests'] else {}
+    return stats
+
+
+def save(conn, stats):
+    values = [stats[k] for k in STATS_COLUMNS]
+    values[-1] = json.dumps(stats['bests'])
+    conn.execute(f"INSERT OR REPLACE INTO user_stats ({', '.join(STATS_COLUMNS)}) VALUES ({', '.join('?' * len(STATS_COLUMNS))})", values)
+
+
+def record_session(conn, history_id):
+    """Folds a just-inserted history row into its user's stats. Call before the INSERT is committed."""
+    c = conn.execute(f"SELECT {HISTORY_COLUMNS} FROM history WHERE id=?", (history_id,))
+    row = c.fetchone()
+    if not row: return None
+    row = dict(zip(_columns(c), row))
+    stats = load(conn, row['user_id'])
+    last = None
+    if stats and stats['last_history_id'] is not None:
+        last = conn.execute("SELECT timestamp, id FROM history WHERE id=?", (stats['last_history_id'],)).fetchone()
+    if stats is None or (stats['last_history_id'] is not None and (last is None or tuple(last) > (row['timestamp'], row['id']))):
+        # Missing, or not the newest by (timestamp, id) (e.g. a merged import): recompute instead of folding
+        return rebuild(conn, [row['user_id']])[row['user_id']]
+    stats = fold(stats, row)
+    save(conn, stats)
+    return stats
+
+
+def rebuild(conn, user_ids=None):
+    """Recomputes stats from history for user_ids (all users if None). Returns {user_id: stats}."""
+    if user_ids is None:
+        user_ids = [r[0] for r in conn.execute("SELECT id FROM users")]
+    result = {}
+    for uid in user_ids:
+        stats = empty(uid)
+        # Time order, as undo and the level snapshots use: imported rows can have newer ids than later sessions
+        c = conn.execute(f"SELECT {HISTORY_COLUMNS} FROM history WHERE user_id=? ORDER BY timestamp, id", (uid,))
+        cols = _columns(c)
+        for row in c:
+            fold(stats, dict(zip(cols, row)))
+        save(conn, stats)
+        result[uid] = stats
+    return result
+
+
+def format_duration(secs):
+    hours, mins = divmod(int(secs) // 60, 60)
+    return f"{hours}h {mins:02d}m" if hours else f"{mins}m"
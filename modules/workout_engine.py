@@ -0,0 +1,537 @@
+import io
+import os
+import csv
+import json
+import time
+import datetime
+
+import modules.five_bx_data as bx
+import modules.progression_engine as pe
+import modules.workout_journal as wj
+from modules import metrics
+from modules.recovery_engine import RecoveryTracker
+from modules.cardio_analyzer import CardioAnalyzer
+
+# UI-independent 5BX session state machine. The Tk trainer and the headless runner
+# (fivebx.py) both drive it: they own the timing (Tk after() / a simulated clock) and
+# the presentation, the engine owns the targets, the per-exercise samples and the verdict.
+#
+#   engine.start()
+#   for each exercise:  [select_cardio()] -> begin_exercise() -> start_timer()
+#                       -> sample() once a second -> stop_timer() -> record_result()
+#   result = engine.finish(fails_fn, age)
+#
+# With a WorkoutJournal attached those inputs are journaled as they happen, and after a
+# crash engine.resume(records) replays them to rebuild the session.
+
+SESSION_DIR = "ant_sessions"
+CSV_HEADER = ["Timestamp", "HR_BPM", "RMSSD_MS", "Raw_RR_MS", "Raw_Packet_Hex", "Chart_Level", "Exercise_Note", "Status", "Battery_V"]
+TELEMETRY_LOG_SECS = 10
+LOG_BATCH_ROWS = 10 # With a PersistenceWorker: rows handed over per batch (~10 s)
+STATIONARY_MODE = "Standard (Stationary)"
+EXERCISE_NAMES = ["Toe Touch", "Sit-up", "Back Extension", "Push-up", "Cardio"]
+
+
+class SessionLogger:
+    def __init__(self, user_name, session_dir=SESSION_DIR, now=datetime.datetime.now, mono=time.monotonic, persist=None):
+        self.user_name = user_name
+        self.session_dir = session_dir
+        self.now = now
+        self.mono = mono
+        self.persist = persist # PersistenceWorker: rows go to disk in batches, off the caller's thread
+        self.started = None
+        self.filename = None
+        self.file = None
+        self.active = False
+        self.pending = []
+        self.telemetry_file = None
+        # Index of what was written (see index()): size, rows, monotonic span, where each exercise starts
+        self.size = 0
+        self.rows = 0
+        self.start_mono = None
+        self.end_mono = None
+        self.segments = []
+        if not os.path.exists(session_dir): os.makedirs(session_dir)
+
+    def _path(self, started):
+        ts = started.strftime("%Y%m%d_%H%M%S")
+        safe_name = "".join([c for c in self.user_name if c.isalpha() or c.isdigit() or c==' ']).rstrip()
+        return os.path.join(self.session_dir, f"session_5bx_{safe_name}_{ts}.csv")
+
+    @staticmethod
+    def _csv_line(row):
+        buf = io.StringIO()
+        csv.writer(buf).writerow(row)
+        return buf.getvalue()
+
+    def _write(self, text):
+        self.size += len(text.encode())
+        if self.persist:
+            self.pending.append(text)
+            if len(self.pending) >= LOG_BATCH_ROWS: self._hand_over()
+        else:
+            self.file.write(text)
+            self.file.flush()
+
+    def _hand_over(self):
+        if self.pending: self.persist.append_text(self.filename, "".join(self.pending))
+        self.pending = []
+
+    def start(self):
+        self.started = self.now()
+        self.filename = self._path(self.started)
+        self.rows = 0
+        self.size = 0
+        self.segments = []
+        header = self._csv_line(CSV_HEADER)
+        if self.persist:
+            self.persist.write_text(self.filename, header)
+            self.size = len(header.encode())
+        else:
+            self.file = open(self.filename, 'w', newline='')
+            self._write(header)
+        self.active = True
+        self.start_mono = self.mono()
+        self.end_mono = None
+
+    def resume(self, started):
+        """Reopens the recording start() made at `started` for appending (crash resume).
+           The row count and exercise offsets are rebuilt from the file; a torn last row is cut."""
+        self.started = started
+        self.filename = self._path(started)
+        self.rows = 0
+        self.size = 0
+        self.segments = []
+        exists = os.path.exists(self.filename)
+        if exists:
+            with open(self.filename, 'rb') as f:
+                good = len(f.readline())
+                for line in f:
+                    if not line.endswith(b"\n"): break
+                    row = next(csv.reader([line.decode()]), [])
+                    note = row[6] if len(row) > 6 else ""
+                    if not self.segments or self.segments[-1]['exercise'] != note:
+                        self.segments.append({'exercise': note, 'offset': good, 'row': self.rows, 'mono': None})
+                    self.rows += 1
+                    good += len(line)
+            if os.path.getsize(self.filename) != good: os.truncate(self.filename, good)
+            self.size = good
+        if not self.persist: self.file = open(self.filename, 'a', newline='')
+        self.active = True
+        if not exists: self._write(self._csv_line(CSV_HEADER))
+        self.start_mono = self.mono()
+        self.end_mono = None
+
+    @metrics.timed("session.log_ms")
+    def log(self, hr, rmssd, raw_rr, raw_hex, state, trend, status, bat):
+        if self.active:
+            if not self.segments or self.segments[-1]['exercise'] != trend:
+                # New exercise: remember the byte offset its first row is written at
+                self.segments.append({'exercise': trend, 'offset': self.size, 'row': self.rows, 'mono': round(self.mono(), 3)})
+            ts = self.now().strftime("%H:%M:%S.%f")[:-3]
+            self._write(self._csv_line([ts, hr, rmssd, raw_rr, raw_hex, state, trend, status, bat]))
+            self.rows += 1
+            metrics.inc("session.rows")
+
+    def log_telemetry(self, snapshot):
+        """Appends a sensor link snapshot to <session>.telemetry.jsonl next to the CSV."""
+        if not self.filename: return
+        if not self.telemetry_file:
+            self.telemetry_file = open(os.path.splitext(self.filename)[0] + ".telemetry.jsonl", 'w')
+        self.telemetry_file.write(json.dumps({'time': self.now().strftime("%H:%M:%S"), **snapshot}) + "\n")
+        self.telemetry_file.flush()
+
+    def stop(self):
+        if self.active: self.end_mono = self.mono()
+        self.active = False
+        if self.persist: self._hand_over()
+        if self.file: self.file.close()
+        if self.telemetry_file: self.telemetry_file.close()
+
+    def index(self):
+        """session_file entry for progress_db.insert_history, or None if nothing was started."""
+        if not self.filename: return None
+        return {
+            'path': self.filename,
+            'bytes': self.size,
+            'rows': self.rows,
+            'start_mono': self.start_mono,
+            'end_mono': self.end_mono if self.end_mono is not None else self.mono(),
+            'segments': list(self.segments)
+        }
+
+
+def read_segment(entry, i):
+    """CSV rows (dicts) of exercise segment i of a session_file entry: one seek, no scan."""
+    segments = entry['segments']
+    start = segments[i]['offset']
+    end = segments[i + 1]['offset'] if i + 1 < len(segments) else None
+    with open(entry['path'], 'rb') as f:
+        header = next(csv.reader([f.readline().decode()]))
+        f.seek(start)
+        raw = f.read(end - start) if end is not None else f.read()
+    return list(csv.DictReader(raw.decode().splitlines(), fieldnames=header))
+
+
+def format_secs(secs):
+    return f"{int(secs // 60)}:{int(secs % 60):02d}"
+
+
+def result_badge(value, target, alt_cardio):
+    """Report-card badge for one exercise: (text, colour) or None."""
+    if alt_cardio:
+        # Time: Lower is better
+        diff = target - value # Positive if faster (better)
+        if diff >= 60: return "🔥 UNSTOPPABLE", "#e74c3c"
+        if diff >= 10: return "🚀 SMASHED IT", "#9b59b6"
+        if diff >= 0: return "🎯 TARGET HIT", "#2ecc71"
+    else:
+        # Reps: Higher is better
+        diff = value - target
+        if diff >= target * 0.2 and target > 10: return "🔥 UNSTOPPABLE", "#e74c3c"
+        if diff >= target * 0.1 and target > 10: return "🚀 SMASHED IT", "#9b59b6"
+        if diff >= 0: return "🎯 TARGET HIT", "#2ecc71"
+    return None
+
+
+class WorkoutEngine:
+    def __init__(self, user_data, true_max_hr, bio_profile, logger=None, now=time.time, journal=None):
+        self.user_data = user_data
+        self.true_max_hr = true_max_hr
+        self.bio_profile = bio_profile
+        self.logger = logger
+        self.journal = journal # WorkoutJournal (crash resume), optional
+        self.now = now # Clock for the analyzers (simulated in headless runs)
+
+        self.idx = 0
+        self.session_metrics = []
+        self.reps_achieved = []
+        self.target_reps_list = []
+        self.cardio_targets_all = []
+        self.cardio_mode = None
+        self.cardio_analyzer = None # Ex 5 zones / drift / HRR
+        self.recovery_tracker = None # Between-exercise HR/HRV recovery monitor
+        self.recovery_idx = 0
+        self.timer_running = False
+        self.active = False
+        self.next_telemetry = 0
+
+    # --- SETUP ---
+    def levels(self):
+        """(s_chart, s_level, c_chart, c_level) at the start of the session."""
+        u = self.user_data
+        return (u.get("strength_chart") or u.get("current_chart") or "1",
+                u.get("strength_level") or u.get("current_level") or "1",
+                u.get("cardio_chart") or u.get("current_chart") or "1",
+                u.get("cardio_level") or u.get("current_level") or "1")
+
+    def _load_targets(self):
+        s_chart, s_level, c_chart, c_level = self.levels()
+        strength_targets = bx.get_targets(s_chart, s_level)
+        # [ex1..ex5, run, walk]; Ex 5 target is fixed once the variant is chosen
+        self.cardio_targets_all = bx.get_targets(c_chart, c_level)
+        self.target_reps_list = strength_targets[:4] + [self.cardio_targets_all[4]]
+        self.cardio_mode = None
+        self.active = True
+        self.timer_running = False
+
+    def start(self):
+        self._load_targets()
+        if self.logger: self.logger.start()
+        started = self.logger.started.timestamp() if self.logger else time.time()
+        self._journal(wj.BEGIN, t=started, value=self.user_data.get('id') or 0, sync=True)
+
+    def _journal(self, kind, idx=0, hr=0, t=None, value=0.0, sync=False):
+        if self.journal: self.journal.append(kind, idx, hr, self.now() if t is None else t, value, sync)
+
+    def resume(self, records):
+        """
+        Rebuilds an interrupted session from its journal (workout_journal.pending()). Everything
+        up to the last recorded result is replayed through the normal methods at the journaled
+        times, then the rest period after it (samples, Ex 5 choice, recovery end) so the finished
+        exercise keeps its recovery summary; the exercise that was in progress starts over.
+        Returns the records used (reopen the journal with records=those).
+        """
+        last = max((i for i, r in enumerate(records) if r.kind == wj.RESULT), default=0)
+        used = list(records[:last + 1])
+        resting = True
+        for r in records[last + 1:]:
+            if r.kind == wj.RECOVERY_END:
+                used.append(r)
+                break
+            if r.kind == wj.TIMER_START: resting = False # Only its RECOVERY_END may follow
+            elif resting and r.kind in (wj.SAMPLE, wj.CARDIO): used.append(r)
+        self._load_targets()
+        logger, journal, now = self.logger, self.journal, self.now
+        self.logger = self.journal = None # Replay: nothing is re-logged
+        try:
+            for r in used[1:]:
+                self.now = lambda t=r.t: t
+                if r.kind == wj.CARDIO: self.select_cardio(*self.cardio_options()[r.idx])
+                elif r.kind == wj.EXERCISE: self.begin_exercise()
+                elif r.kind == wj.TIMER_START: self.start_timer()
+                elif r.kind == wj.TIMER_STOP: self.stop_timer()
+                elif r.kind == wj.RECOVERY_END: self.end_recovery()
+                elif r.kind == wj.SAMPLE: self.sample({'bpm': r.hr, 'rmssd': r.value})
+                elif r.kind == wj.RESULT: self.record_result(int(r.value))
+        finally:
+            self.logger, self.journal, self.now = logger, journal, now
+        if self.logger: self.logger.resume(datetime.datetime.fromtimestamp(records[0].t))
+        return used
+
+    @property
+    def finished(self):
+        return self.idx >= 5
+
+    @property
+    def needs_cardio_choice(self):
+        return self.idx == 4 and self.cardio_mode is None
+
+    @property
+    def alt_cardio(self):
+        """Ex 5 is a timed Run / Walk / Jog (result is a time, no countdown timer)."""
+        return self.idx == 4 and pe.is_alt_cardio(self.cardio_mode)
+
+    def cardio_options(self):
+        """[(mode, target)] for the Ex 5 variant choice. Run/Walk targets are seconds."""
+        config = bx.get_cardio_config(self.levels()[2])
+        t = self.cardio_targets_all
+        options = [(STATIONARY_MODE, t[4]), (config['run'], t[5] if len(t) > 5 else 0)]
+        if config['walk']: options.append((config['walk'], t[6] if len(t) > 6 else 0))
+        return options
+
+    def select_cardio(self, mode, target):
+        self.cardio_mode = mode
+        self.target_reps_list[4] = target
+        options = [m for m, _ in self.cardio_options()]
+        if mode in options: self._journal(wj.CARDIO, options.index(mode), sync=True)
+
+    # --- PER EXERCISE ---
+    def exercise_detail(self, idx=None):
+        idx = self.idx if idx is None else idx
+        variant = self.cardio_mode if idx == 4 and self.cardio_mode else "Standard"
+        return bx.get_exercise_detail(self.user_data["current_chart"], idx, variant)
+
+    def begin_exercise(self):
+        details = self.exercise_detail()
+        self._journal(wj.EXERCISE, self.idx, sync=True)
+        self.session_metrics.append({'name': details['name'], 'hr': [], 'rmssd': []})
+        if self.idx == 4:
+            self.cardio_analyzer = CardioAnalyzer(self.true_max_hr, self.cardio_mode or "Standard")
+        self.timer_running = False
+        return details
+
+    def duration(self):
+        return bx.TIME_LIMITS[self.idx]
+
+    def start_timer(self):
+        self._journal(wj.TIMER_START, self.idx, sync=True)
+        self.end_recovery()
+        self.timer_running = True
+
+    def stop_timer(self):
+        """Ends the timed part of the current exercise. Returns the Ex 5 analyzer if it
+           now needs post-exercise (HRR) samples, else None."""
+        self._journal(wj.TIMER_STOP, self.idx, sync=True)
+        self.timer_running = False
+        self.end_recovery() # Run/Walk skips the countdown, so close any open rest here
+        if self.idx == 4 and self.cardio_analyzer and self.cardio_analyzer.phase == "EXERCISE":
+            self.cardio_analyzer.end_exercise(self.now())
+            return self.cardio_analyzer
+        return None
+
+    def record_result(self, value):
+        self._journal(wj.RESULT, self.idx, value=value, sync=True)
+        self.reps_achieved.append(value)
+        self.start_recovery(self.idx)
+        self.idx += 1
+
+    # --- BETWEEN-EXERCISE RECOVERY ---
+    def start_recovery(self, finished_idx):
+        # Track recovery of the exercise just completed until the next one starts
+        self.recovery_tracker = None
+        if finished_idx >= 4: return # Ex 5 recovery is handled by the HRR analysis
+        if finished_idx >= len(self.session_metrics): return
+        self.recovery_tracker = RecoveryTracker(self.bio_profile.resting_hr, self.bio_profile.baseline_rmssd,
+                                                exercise_name=self.session_metrics[finished_idx]['name'])
+        self.recovery_idx = finished_idx
+
+    def end_recovery(self):
+        if not self.recovery_tracker: return
+        self._journal(wj.RECOVERY_END, self.recovery_idx, sync=True)
+        summary = self.recovery_tracker.summary()
+        if summary and self.recovery_idx < len(self.session_metrics):
+            self.session_metrics[self.recovery_idx]['recovery'] = summary
+        self.recovery_tracker = None
+
+    # --- LIVE SAMPLES ---
+    def hr_status(self, hr):
+        """(advice text, colour, log status) for the HR limits."""
+        if hr >= self.true_max_hr * 0.95: return "⚠️ DANGER! STOP NOW", "#e74c3c", "CRITICAL"
+        if hr >= self.true_max_hr * 0.90: return "⚠️ Limit Reached - SLOW DOWN", "#e67e22", "WARNING"
+        if hr < self.true_max_hr * 0.60 and self.idx == 4: return "⚡ Push Harder!", "#f1c40f", "LOW"
+        return "Zone OK", "#2ecc71", "OK"
+
+    def log_telemetry(self, sensor):
+        """Writes the sensor's link telemetry next to the session log every TELEMETRY_LOG_SECS."""
+        if not (self.logger and hasattr(sensor, 'get_telemetry')): return
+        now = self.now()
+        if now < self.next_telemetry: return
+        self.next_telemetry = now + TELEMETRY_LOG_SECS
+        self.logger.log_telemetry(sensor.get_telemetry())
+
+    def sample(self, data):
+        """Consumes one sensor reading (get_data() dict). Returns (advice text, colour)."""
+        hr = data['bpm']
+        rmssd = data['rmssd']
+        now = self.now()
+        status_text, status_color, log_status = self.hr_status(hr)
+
+        # Between exercises: show recovery guidance unless an HR limit is breached
+        if self.recovery_tracker and not self.timer_running and hr > 0:
+            self.recovery_tracker.update(hr, rmssd, now)
+            if log_status == "OK":
+                status_text, status_color = self.recovery_tracker.get_advice()
+
+        if hr > 0:
+            self._journal(wj.SAMPLE, self.idx, hr, t=now, value=rmssd)
+            # Ex 5 analysis: only while actually exercising (timer running, or out on a Run/Walk)
+            if self.idx == 4 and self.cardio_analyzer and (self.timer_running or pe.is_alt_cardio(self.cardio_mode)):
+                self.cardio_analyzer.add_sample(hr, now)
+
+            if self.idx < len(self.session_metrics):
+                metric = self.session_metrics[self.idx]
+                metric['hr'].append(hr)
+                metric['rmssd'].append(rmssd)
+                if self.logger:
+                    chart, level = self.user_data["current_chart"], self.user_data["current_level"]
+                    self.logger.log(hr, rmssd, data.get('raw_rr_ms', 0), data.get('raw_hex', ''), f"Ch {chart} - Lvl {level}",
+                                    f"C{chart}-Ex {self.idx+1}: {metric['name']}", log_status, data.get('battery_volts'))
+        return status_text, status_color
+
+    # --- FINISH ---
+    def finish(self, consecutive_fails, age):
+        """
+        Scores the session. consecutive_fails(component) -> current strike count.
+        Returns a dict with the report lines, verdicts, milestones, the new levels and
+        'history' (keyword args for the history INSERT). Nothing is written here.
+        """
+        self.active = False
+        if self.logger: self.logger.stop()
+        session_file = self.logger.index() if self.logger else None
+        alt_cardio = pe.is_alt_cardio(self.cardio_mode)
+        reps = list(self.reps_achieved)
+        targets = self.target_reps_list
+
+        report_text = ["--- SESSION BREAKDOWN ---", "PERFORMANCE:"]
+        for i in range(5):
+            # Format for Cardio (Time vs Reps)
+            if i == 4 and any(m in str(self.cardio_mode) for m in ["Run", "Walk", "Jog"]):
+                report_text.append(f"{EXERCISE_NAMES[i]}: {format_secs(reps[i])} / {format_secs(targets[i])}")
+            else:
+                report_text.append(f"{EXERCISE_NAMES[i]}: {reps[i]} / {targets[i]}")
+        report_text.append("") # Spacer
+
+        session_peak_hr = 0
+        all_hr, all_rmssd = [], []
+        for i, metric in enumerate(self.session_metrics):
+            name, hrs, hrvs = metric['name'], metric['hr'], metric['rmssd']
+            if not hrs:
+                report_text.append(f"{name}: (No HR Data)"); continue
+
+            avg_hr, max_hr = sum(hrs)/len(hrs), max(hrs)
+            all_hr.extend(hrs)
+            session_peak_hr = max(session_peak_hr, max_hr)
+
+            if "Back Arch" in name or i == 2: hrv_str = "(Ignored)"; avg_hrv = 999
+            else: avg_hrv = sum(hrvs)/len(hrvs) if hrvs else 0; hrv_str = f"{avg_hrv:.1f} ms"; all_rmssd.extend(hrvs)
+
+            status = "OK"
+            if max_hr > (self.true_max_hr * 0.95): status = "INTENSE"
+            if avg_hrv < 10 and avg_hrv != 999: status += " / HIGH STRESS"
+
+            line = f"{name}: Avg HR {int(avg_hr)} | Max {max_hr} | HRV {hrv_str}"
+            if status != "OK": line += f"\n   -> ⚠️ {status}"
+            rec = metric.get('recovery')
+            if rec:
+                ready = f"Ready in {rec['ready_secs']}s" if rec['ready_secs'] is not None else f"Not recovered ({rec['rest_secs']}s rest)"
+                line += f"\n   -> Recovery: {ready} | HR {-rec['hr_drop']:+d} bpm | HRV x{rec['rmssd_rebound']}"
+            report_text.append(line)
+
+        cardio_stats = self.cardio_analyzer.summary() if self.cardio_analyzer else None
+        if cardio_stats:
+            zones = " ".join(f"{z}:{secs}s" for z, secs in sorted(cardio_stats['zone_secs'].items(), reverse=True))
+            report_text.append("\nCARDIO ANALYSIS (Ex 5):")
+            report_text.append(f"   Time in Zone: {zones or '--'}")
+            if cardio_stats['drift_bpm_min'] is not None:
+                report_text.append(f"   Cardiac Drift: {cardio_stats['drift_bpm_min']:+.1f} bpm/min")
+            report_text.append("   HR Recovery: measuring (30s / 60s)...")
+
+        new_max_hr = None
+        if session_peak_hr > self.true_max_hr and session_peak_hr < 220:
+            report_text.append(f"\n📈 NEW MAX HR: {session_peak_hr} bpm (Prev: {self.true_max_hr})")
+            report_text.append("⚠️ Pushed to absolute limit.")
+            new_max_hr = session_peak_hr
+
+        report_text.append("") # Spacer before Verdict
+
+        # Evaluate STRENGTH (Ex 1-4) and CARDIO (Ex 5) - rules live in progression_engine
+        s_chart, s_level, c_chart, c_level = self.levels()
+        table = pe.get_chart_table()
+        s_res = pe.evaluate_strength(s_chart, s_level, reps, targets, consecutive_fails("Strength"), table)
+        c_res = pe.evaluate_cardio(c_chart, c_level, reps, targets, self.cardio_mode, consecutive_fails("Cardio"), table)
+        report_text.extend(s_res['report'])
+        report_text.extend(c_res['report'])
+        (s_new_c, s_new_l), (c_new_c, c_new_l) = s_res['new'], c_res['new']
+        verdict = pe.format_verdict(s_res, c_res)
+        reason = pe.session_reason(s_res, c_res)
+        milestones = bx.check_milestones(age, s_chart, s_level, s_new_c, s_new_l, c_chart, c_level, c_new_c, c_new_l)
+
+        # Serialize Detailed Stats for History (EXTENDED V2)
+        segment_data = []
+        for metric in self.session_metrics:
+            hr_data, hrv_data = metric['hr'], metric['rmssd']
+            avg_hr_seg = int(sum(hr_data)/len(hr_data)) if hr_data else 0
+            max_hr_seg = max(hr_data) if hr_data else 0
+            avg_hrv_seg = int(sum(hrv_data)/len(hrv_data)) if hrv_data else 0
+
+            status_txt = "OK"
+            if max_hr_seg > (self.true_max_hr * 0.95): status_txt = "INTENSE"
+            if avg_hrv_seg < 10 and avg_hrv_seg > 0: status_txt += " / HIGH STRESS"
+            if status_txt == "OK": status_txt = "" # Don't save "OK" to keep JSON clean unless needed
+
+            seg = {"name": metric['name'], "avg_hr": avg_hr_seg, "max_hr": max_hr_seg, "hrv": avg_hrv_seg, "status": status_txt}
+            if metric.get('recovery'): seg["recovery"] = metric['recovery']
+            segment_data.append(seg)
+
+        stats_payload = {
+            "version": "2.0",
+            "segments": segment_data,
+            "badges": [{'text': m['text'], 'image': m.get('image', '')} for m in milestones or []],
+            "verdict_reason": reason
+        }
+        if cardio_stats: stats_payload["cardio"] = cardio_stats
+
+        # Ex 5 Metadata: a timed run stores its time separately and 1 in the reps column as a 'completed' flag
+        ex5_duration = 0
+        if alt_cardio:
+            ex5_duration = reps[4]
+            reps[4] = 1
+
+        new_levels = (s_new_c, s_new_l, c_new_c, c_new_l)
+        return {
+            "report": report_text,
+            "strength": s_res, "cardio": c_res,
+            "verdict": verdict, "reason": reason,
+            "milestones": milestones,
+            "new_max_hr": new_max_hr,
+            "new_levels": new_levels,
+            "history": {
+                "chart": f"{s_chart}/{c_chart}", "level": f"{s_level}/{c_level}", "verdict": verdict,
+                "avg_hr": sum(all_hr)/len(all_hr) if all_hr else 0, "max_hr": session_peak_hr,
+                "rmssd": all_rmssd[-1] if all_rmssd else 0,
+                "reps_list": reps, "stats_json": json.dumps(stats_payload),
+                "ex5_type": self.cardio_mode, "ex5_duration": ex5_duration, "new_levels": new_levels,
+                "session_file": session_file,
+            },
+        }
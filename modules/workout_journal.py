@@ -0,0 +1,123 @@
+import os
+import zlib
+import struct
+import threading
+from collections import namedtuple
+
+# Crash-safe journal of the workout in progress (WorkoutEngine inputs, see WorkoutEngine.resume).
+# Append-only, fixed 20-byte records with a CRC so a torn tail is detected and dropped.
+# Every record is flushed to the OS straight away (survives an app crash); fsync runs on a
+# background thread - at once for state transitions, batched every SYNC_SECS for the 1 Hz
+# samples - so the UI thread never waits on the disk. Deleted once the history row is saved.
+# One journal per user (journal_path), so starting a workout never overwrites another user's
+# interrupted one.
+
+JOURNAL_DIR = "ant_sessions"
+SYNC_SECS = 5.0
+
+BODY = struct.Struct("<BBHdf") # kind, exercise idx / option, hr, time, value
+RECORD = struct.Struct("<BBHdfI") # body + crc32(body)
+
+# Record kinds
+BEGIN = 1 # t = recording start (epoch), value = user id
+CARDIO = 2 # idx = Ex 5 option (WorkoutEngine.cardio_options() order)
+EXERCISE = 3 # begin_exercise()
+TIMER_START = 4
+TIMER_STOP = 5
+RECOVERY_END = 6
+SAMPLE = 7 # hr, value = rmssd
+RESULT = 8 # value = reps / seconds
+
+Record = namedtuple("Record", "kind idx hr t value")
+
+
+def journal_path(user_id, journal_dir=JOURNAL_DIR):
+    return os.path.join(journal_dir, f"workout_{user_id}.journal")
+
+
+def _pack(kind, idx=0, hr=0, t=0.0, value=0.0):
+    body = BODY.pack(kind, idx, min(int(hr), 0xFFFF), t, value)
+    return body + struct.pack("<I", zlib.crc32(body))
+
+
+def read(path):
+    """Records up to the first torn / corrupt one ([] if there is no journal)."""
+    try:
+        with open(path, 'rb') as f: data = f.read()
+    except OSError:
+        return []
+    records = []
+    for off in range(0, len(data) - RECORD.size + 1, RECORD.size):
+        *body, crc = RECORD.unpack_from(data, off)
+        if zlib.crc32(data[off:off + BODY.size]) != crc: break
+        records.append(Record(*body))
+    return records
+
+
+def pending(path):
+    """The interrupted workout's records, or None."""
+    records = read(path)
+    return records if records and records[0].kind == BEGIN else None
+
+
+def discard(path):
+    try: os.remove(path)
+    except FileNotFoundError: pass
+
+
+class WorkoutJournal:
+    def __init__(self, path, records=None, sync_secs=SYNC_SECS):
+        """records: continue an interrupted journal holding these (WorkoutEngine.resume()), else start a new one.
+           The kept records replace the old journal atomically, so a second crash still finds them."""
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.sync_secs = sync_secs
+        if records:
+            tmp = path + ".tmp"
+            with open(tmp, 'wb') as f:
+                f.write(b"".join(_pack(*r) for r in records))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+            self.file = open(path, 'ab')
+        else:
+            self.file = open(path, 'wb')
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.urgent = threading.Event()
+        self.stopped = False
+        self.thread = threading.Thread(target=self._sync_loop, name="journal-sync", daemon=True)
+        self.thread.start()
+
+    def append(self, kind, idx=0, hr=0, t=0.0, value=0.0, sync=False):
+        self.file.write(_pack(kind, idx, hr, t, value))
+        self.file.flush()
+        self.dirty = True
+        if sync: self.urgent.set()
+
+    def _fsync(self):
+        with self.lock:
+            if self.file.closed: return
+            self.dirty = False
+            os.fsync(self.file.fileno())
+
+    def _sync_loop(self):
+        while not self.stopped:
+            self.urgent.wait(self.sync_secs)
+            self.urgent.clear()
+            if self.dirty: self._fsync()
+
+    def close(self):
+        self.stopped = True
+        self.urgent.set()
+        if self.thread is not threading.current_thread(): self.thread.join(timeout=1.0)
+        with self.lock:
+            if self.file.closed: return
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+    def discard(self):
+        """The workout was saved (or abandoned): nothing left to resume."""
+        self.close()
+        discard(self.path)